@@ -0,0 +1,227 @@
+"""Persistent answer cache in SQLite, with semantic matching of rephrased questions.
+
+An answer is keyed by the document's content hash, the normalized question, its type
+and the prompt configuration, so a new template, model or sampling setting never serves
+answers written under the old one. Calls block on SQLite; the server runs them on a
+dedicated thread.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Nearest past questions checked per lookup, so an expired best match falls through to the next
+SEMANTIC_CACHE_CANDIDATES = 4
+SEMANTIC_SCORE_BUCKETS = [0.80, 0.85, 0.88, 0.90, 0.92, 0.94, 0.96, 0.98]
+
+
+def normalize_question(question):
+    """Normalize question text for cache keys: case, whitespace and trailing punctuation"""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+def _unit_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(1, -1).copy()
+    faiss.normalize_L2(vector)
+    return vector
+
+
+class AnswerCache:
+    """Persistent answer cache keyed by document content, question and prompt configuration.
+
+    Each answer also stores its question embedding, so a differently phrased question of the same
+    type about the same document can be matched semantically through a small FAISS index per
+    document, prompt configuration and question type.
+    """
+
+    def __init__(self, path, ttl_seconds, max_entries, semantic_threshold, config=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        self.config = config or {}  # prompt configuration (template version, model, sampling) keyed into every answer
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, content_hash TEXT, question TEXT, answer TEXT, "
+            "created_at REAL, accessed_at REAL, config_key TEXT, question_vector BLOB)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+        for column, column_type in [("config_key", "TEXT"), ("question_vector", "BLOB")]:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE answers ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_content_hash ON answers (content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed_at ON answers (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_config_key ON answers (config_key)")
+        self._conn.commit()
+        self._semantic_indexes = {}  # config_key -> (faiss.IndexFlatIP, [answer keys])
+        self._touched = {}  # answer key -> last hit, written back on the next put
+        self.hits = 0
+        self.misses = 0
+        self.semantic_hits = 0
+        self.semantic_misses = 0
+        self.semantic_near_misses = 0  # best match within 0.05 below the threshold
+        self.semantic_score_histogram = [0] * (len(SEMANTIC_SCORE_BUCKETS) + 1)
+
+    def make_key(self, content_hash, question, question_type, document_type):
+        key_material = json.dumps({
+            "content_hash": content_hash,
+            "question": normalize_question(question),
+            "question_type": question_type,
+            "document_type": document_type,
+            **self.config
+        }, sort_keys=True)
+        return hashlib.sha256(key_material.encode()).hexdigest()
+
+    def make_config_key(self, content_hash, document_type, question_type):
+        """Key of the semantic index: same document, prompt configuration and question type"""
+        key_material = json.dumps({
+            "content_hash": content_hash,
+            "question_type": question_type,
+            "document_type": document_type,
+            **self.config
+        }, sort_keys=True)
+        return hashlib.sha256(key_material.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            # Recency only matters when put evicts, so hits don't each pay for a write
+            self._touched[key] = now
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, content_hash, question, answer, document_type=None, question_vector=None, question_type=None):
+        now = time.time()
+        config_key = self.make_config_key(content_hash, document_type, question_type) if document_type else None
+        vector_blob = _unit_vector(question_vector).tobytes() if question_vector is not None else None
+        with self._lock:
+            if self._touched:
+                self._conn.executemany("UPDATE answers SET accessed_at = ? WHERE key = ?",
+                                       [(accessed_at, touched_key) for touched_key, accessed_at in self._touched.items()])
+                self._touched.clear()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content_hash, question, answer, now, now, config_key, vector_blob)
+            )
+            removed = self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+            # Size bound: drop the least recently used rows beyond max_entries
+            removed += self._conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self._conn.commit()
+            if removed:
+                # Deleted rows would stay in the semantic indexes as dead ids; rebuild them lazily
+                self._semantic_indexes.clear()
+                return
+            semantic_index = self._semantic_indexes.get(config_key)
+            if semantic_index is not None and vector_blob is not None:
+                semantic_index[0].add(np.frombuffer(vector_blob, dtype=np.float32).reshape(1, -1))
+                semantic_index[1].append(key)
+
+    def _load_semantic_index(self, config_key):
+        index = self._semantic_indexes.get(config_key)
+        if index is None:
+            rows = self._conn.execute(
+                "SELECT key, question_vector FROM answers WHERE config_key = ? AND question_vector IS NOT NULL",
+                (config_key,)
+            ).fetchall()
+            keys = [row[0] for row in rows]
+            vectors = [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+            faiss_index = faiss.IndexFlatIP(len(vectors[0])) if vectors else None
+            if vectors:
+                faiss_index.add(np.stack(vectors))
+            index = (faiss_index, keys)
+            if faiss_index is not None:
+                self._semantic_indexes[config_key] = index
+        return index
+
+    def find_similar(self, content_hash, document_type, question_type, question_vector):
+        """Cached answer of the most similar live past question of this type, if above the threshold"""
+        if self.semantic_threshold <= 0:
+            return None
+        config_key = self.make_config_key(content_hash, document_type, question_type)
+        with self._lock:
+            faiss_index, keys = self._load_semantic_index(config_key)
+            if faiss_index is None or faiss_index.ntotal == 0:
+                self.semantic_misses += 1
+                return None
+            scores, ids = faiss_index.search(_unit_vector(question_vector), min(SEMANTIC_CACHE_CANDIDATES, faiss_index.ntotal))
+            best_score = float(scores[0][0])
+            bucket = sum(1 for edge in SEMANTIC_SCORE_BUCKETS if best_score >= edge)
+            self.semantic_score_histogram[bucket] += 1
+            matches = [(float(score), keys[idx]) for score, idx in zip(scores[0], ids[0])
+                       if idx >= 0 and score >= self.semantic_threshold]
+            if not matches:
+                self.semantic_misses += 1
+                if best_score >= self.semantic_threshold - 0.05:
+                    self.semantic_near_misses += 1
+                return None
+        for score, matched_key in matches:
+            # None when the row expired since the index was built: try the next closest
+            answer = self.get(matched_key)
+            if answer is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                logger.info(f"🧠 Semantic answer cache hit (cosine {score:.3f})")
+                return answer
+        with self._lock:
+            self.semantic_misses += 1
+        return None
+
+    def invalidate(self, content_hash):
+        """Drop every answer derived from a document whose vectorstore was rebuilt"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM answers WHERE content_hash = ?", (content_hash,)).rowcount
+            self._conn.commit()
+            # Semantic indexes are rebuilt lazily from the remaining rows on the next lookup
+            self._semantic_indexes.clear()
+        if removed:
+            logger.info(f"🧹 Invalidated {removed} cached answers for {content_hash}")
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._semantic_indexes.clear()
+            self._touched.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            lookups = self.hits + self.misses
+            semantic_lookups = self.semantic_hits + self.semantic_misses
+            bucket_labels = [f"<{SEMANTIC_SCORE_BUCKETS[0]:.2f}"] + [
+                f">={edge:.2f}" for edge in SEMANTIC_SCORE_BUCKETS
+            ]
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "semantic": {
+                    "threshold": self.semantic_threshold,
+                    "hits": self.semantic_hits,
+                    "misses": self.semantic_misses,
+                    "near_misses": self.semantic_near_misses,
+                    "hit_rate": round(self.semantic_hits / semantic_lookups, 3) if semantic_lookups else 0.0,
+                    "best_score_histogram": dict(zip(bucket_labels, self.semantic_score_histogram))
+                }
+            }
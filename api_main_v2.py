@@ -1,6 +1,11 @@
 import tempfile
 import requests
 import os
+import sys
+if __name__ == "__main__":
+    # Run from serve.py: parse workers re-import the main script, and this one would load
+    # torch and the embedding model in each of them
+    os.execv(sys.executable, [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")])
 import httpx
 import asyncio
 import tempfile
@@ -11,30 +16,46 @@ import hashlib
 import pickle
 import uuid
 import json
+import functools
+import multiprocessing
+import threading
+import shutil
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 from asyncio import Lock
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 import re
 import mimetypes
-from urllib.parse import urlparse
-import zipfile
-import io
-from langchain_community.document_loaders import (
-    PyMuPDFLoader, 
-    UnstructuredPowerPointLoader,
-    UnstructuredWordDocumentLoader,
-    UnstructuredExcelLoader,
-    UnstructuredImageLoader,
-    TextLoader,
-    CSVLoader
-)
+import numpy as np
+import faiss
+import faiss_store
+import pdf_extract
+import embedding_backends
+from key_scheduler import NvidiaKeyScheduler, is_request_rejected
+from vectorstore_lru import VectorstoreLRU
+from answer_cache import AnswerCache
+from query_planning import (PrecomputedQueries, classify_question, get_adaptive_retrieval_params,
+                            get_retrieval_keywords, plan_request_queries, preprocess_question)
+from document_urls import normalize_document_url, extract_http_validators, validators_match
+from document_loaders import (MARKDOWN_CACHE_DIR, detect_file_type, load_document_by_type, process_archive_file,
+                              sweep_markdown_cache)
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 import warnings
@@ -53,39 +74,12 @@ NVIDIA_KEYS = [
     ("NVIDIA_API_KEY_5", os.getenv("NVIDIA_API_KEY_5")),
 ]
 
-KEY_INDEX = 0
-lock = Lock()
-
-# === Enhanced File Type Support ===
-SUPPORTED_EXTENSIONS = {
-    '.pdf': 'pdf',
-    '.ppt': 'powerpoint',
-    '.pptx': 'powerpoint', 
-    '.doc': 'word',
-    '.docx': 'word',
-    '.xls': 'excel',
-    '.xlsx': 'excel',
-    '.jpg': 'image',
-    '.jpeg': 'image',
-    '.png': 'image',
-    '.gif': 'image',
-    '.bmp': 'image',
-    '.tiff': 'image',
-    '.bin': 'binary',
-    '.zip': 'archive',
-    '.rar': 'archive',
-    '.7z': 'archive',
-    '.txt': 'text',
-    '.csv': 'csv'
-}
-
 # === Logger Setup ===
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # === Cache Setup ===
 CACHE_DIR = "embedding_cache"
-MARKDOWN_CACHE_DIR = os.path.join(CACHE_DIR, "markdown")
 
 # Create cache directories
 for cache_dir in [CACHE_DIR, MARKDOWN_CACHE_DIR]:
@@ -93,1050 +87,285 @@ for cache_dir in [CACHE_DIR, MARKDOWN_CACHE_DIR]:
         os.makedirs(cache_dir)
         logger.info(f"📁 Created cache directory: {cache_dir}")
 
-def get_markdown_cache_path(url):
-    """Get the cache file path for markdown content"""
-    cache_key = hashlib.md5(url.encode()).hexdigest()
-    return os.path.join(MARKDOWN_CACHE_DIR, f"{cache_key}_ppt.md")
-
-def save_markdown_to_cache(content, url):
-    """Save markdown content to cache"""
+# === Content-Addressed Cache Keys ===
+def get_file_hash(content_hash):
+    """Cache key for a document: the hash of its full content, independent of the URL.
+
+    Vectors from a non-default embedding backend get their own entry, keyed by content and tag.
+    """
+    if EMBEDDING_TAG == embedding_backends.DEFAULT_TAG:
+        return content_hash
+    return hashlib.sha256(f"{content_hash}:{EMBEDDING_TAG}".encode()).hexdigest()
+
+# === URL Alias Index ===
+# Maps normalized document URLs to the content hash they resolved to, so any number of
+# URLs (and refreshed signatures) share one stored index. The cache key is derived from
+# the content hash at lookup, so switching embedding backends keeps the aliases valid.
+URL_ALIAS_INDEX_PATH = os.path.join(CACHE_DIR, "url_aliases.json")
+_url_alias_lock = threading.Lock()
+PROBE_BYTES = 1000
+# The prefix-plus-size probe is weaker than the content hash: an edit past the first
+# PROBE_BYTES that keeps the size would serve the old index. Opt-in for hosts without
+# ETag/Last-Modified; otherwise only strong validators skip the download.
+CACHE_RANGE_PROBE = os.getenv("CACHE_RANGE_PROBE", "0") == "1"
+
+_url_alias_snapshot = (None, {})  # (mtime, aliases) so warm requests skip re-reading the file
+
+def load_url_aliases():
+    """Load the persisted URL alias index"""
+    global _url_alias_snapshot
     try:
-        cache_path = get_markdown_cache_path(url)
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        logger.info(f"💾 Markdown content cached: {cache_path}")
-        return True
+        if os.path.exists(URL_ALIAS_INDEX_PATH):
+            mtime = os.path.getmtime(URL_ALIAS_INDEX_PATH)
+            if _url_alias_snapshot[0] == mtime:
+                return dict(_url_alias_snapshot[1])
+            with open(URL_ALIAS_INDEX_PATH, 'r', encoding='utf-8') as f:
+                aliases = json.load(f)
+            _url_alias_snapshot = (mtime, aliases)
+            return dict(aliases)
     except Exception as e:
-        logger.warning(f"⚠️ Failed to cache markdown: {e}")
-        return False
+        logger.warning(f"⚠️ Failed to read URL alias index: {e}")
+    return {}
 
-def load_markdown_from_cache(url):
-    """Load markdown content from cache if it exists"""
+def save_url_alias(url, content_hash, validators, file_type, file_extension, prefix_hash=None):
+    """Record which document a URL resolved to, plus what is needed to revalidate it cheaply"""
     try:
-        cache_path = get_markdown_cache_path(url)
-        if os.path.exists(cache_path):
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            logger.info(f"📋 Loaded markdown from cache: {cache_path}")
-            return content
-        return None
-    except Exception as e:
-        logger.warning(f"⚠️ Failed to load markdown from cache: {e}")
-        return None
-
-def get_file_hash(url, file_content=None):
-    """Generate a unique hash for the file URL and content type"""
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    if file_content:
-        content_hash = hashlib.md5(file_content[:1000]).hexdigest()
-        return f"{url_hash}_{content_hash}"
-    return url_hash
-
-def detect_file_type(url, content_type=None, file_content=None):
-    """Enhanced file type detection"""
-    try:
-        # First try URL extension
-        parsed_url = urlparse(url)
-        file_path = parsed_url.path.lower()
-        
-        for ext, file_type in SUPPORTED_EXTENSIONS.items():
-            if file_path.endswith(ext):
-                return file_type, ext
-        
-        # Try content type
-        if content_type:
-            mime_to_type = {
-                'application/pdf': ('pdf', '.pdf'),
-                'application/vnd.ms-powerpoint': ('powerpoint', '.ppt'),
-                'application/vnd.openxmlformats-officedocument.presentationml.presentation': ('powerpoint', '.pptx'),
-                'application/msword': ('word', '.doc'),
-                'application/vnd.openxmlformats-officedocument.wordprocessingml.document': ('word', '.docx'),
-                'application/vnd.ms-excel': ('excel', '.xls'),
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': ('excel', '.xlsx'),
-                'image/jpeg': ('image', '.jpg'),
-                'image/png': ('image', '.png'),
-                'image/gif': ('image', '.gif'),
-                'text/plain': ('text', '.txt'),
-                'text/csv': ('csv', '.csv'),
-                'application/zip': ('archive', '.zip'),
-                'application/octet-stream': ('binary', '.bin')
+        with _url_alias_lock:
+            aliases = load_url_aliases()
+            aliases[normalize_document_url(url)] = {
+                "content_hash": content_hash,
+                "cache_key": get_file_hash(content_hash),
+                "validators": validators,
+                "prefix_hash": prefix_hash,
+                "file_type": file_type,
+                "file_extension": file_extension,
+                "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')
             }
-            if content_type in mime_to_type:
-                return mime_to_type[content_type]
-        
-        # Try content analysis for binary files
-        if file_content:
-            if file_content.startswith(b'%PDF'):
-                return 'pdf', '.pdf'
-            elif file_content.startswith(b'PK'):
-                return 'archive', '.zip'
-            elif b'Microsoft Office' in file_content[:1000]:
-                return 'word', '.docx'
-        
-        # Default to binary
-        return 'binary', '.bin'
-        
+            tmp_path = f"{URL_ALIAS_INDEX_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(aliases, f, indent=2)
+            os.replace(tmp_path, URL_ALIAS_INDEX_PATH)
+        return True
     except Exception as e:
-        logger.warning(f"File type detection failed: {e}")
-        return 'binary', '.bin'
+        logger.warning(f"⚠️ Failed to update URL alias index: {e}")
+        return False
 
-async def download_file_safely(url, max_size_mb=100, check_binary=True):
-    """Safely download file with size limits and error handling"""
+def get_prefix_hash(content):
+    """Hash of the first PROBE_BYTES bytes, checked by the range-request probe"""
+    return hashlib.md5(content[:PROBE_BYTES]).hexdigest()
+
+# Document hosts get one app-lifetime pooled client, so cache probes and downloads
+# reuse connections instead of opening a client per request
+DOCUMENT_HTTP_TIMEOUT = 30
+_document_client = None
+
+def get_document_client():
+    global _document_client
+    if _document_client is None or _document_client.is_closed:
+        _document_client = httpx.AsyncClient(
+            timeout=DOCUMENT_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+        )
+    return _document_client
+
+async def close_document_client():
+    global _document_client
+    if _document_client is not None:
+        await _document_client.aclose()
+        _document_client = None
+
+async def probe_cached_document(url):
+    """Check whether url's vectorstore is already cached without downloading the document body.
+
+    Looks the URL up in the alias index, then revalidates the entry with the HEAD validators,
+    or failing that (when CACHE_RANGE_PROBE is set) with a range request for the first
+    bytes plus the total size.
+    Returns (entry or None, validators, head_headers); head_headers are handed to
+    download_file_safely on a miss so the document is not HEAD-requested twice.
+    """
+    entry = load_url_aliases().get(normalize_document_url(url))
+    if entry:
+        # Older aliases only stored the cache key, which was the content hash
+        content_hash = entry.get("content_hash", entry["cache_key"])
+        entry = {**entry, "content_hash": content_hash, "cache_key": get_file_hash(content_hash)}
+    validators = {}
+    head_headers = {}
+    client = get_document_client()
+    try:
+        head_response = await client.head(url)
+        if head_response.status_code < 400:
+            head_headers = head_response.headers
+            validators = extract_http_validators(head_headers)
+    except Exception as head_error:
+        logger.warning(f"⚠ HEAD probe failed: {head_error}")
+    
+    if not entry or (entry["cache_key"] not in vectorstore_cache and not os.path.exists(get_cache_path(entry["cache_key"]))):
+        return None, validators, head_headers
+    
+    if validators_match(entry.get("validators"), validators):
+        logger.info(f"🏷️ Cache validated via HTTP headers: {entry['cache_key']}")
+        return entry, validators, head_headers
+    
+    if not CACHE_RANGE_PROBE or not entry.get("prefix_hash"):
+        return None, validators, head_headers
+    
+    # Fall back to comparing the first bytes and the total size
+    prefix = b""
+    async with client.stream("GET", url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}) as response:
+        if response.status_code != 206:
+            return None, validators, head_headers
+        total_size = response.headers.get('Content-Range', '').rpartition('/')[2]
+        async for chunk in response.aiter_bytes():
+            prefix += chunk
+            if len(prefix) >= PROBE_BYTES:
+                break
+    
+    stored_size = (entry.get("validators") or {}).get("content_length")
+    if get_prefix_hash(prefix) != entry["prefix_hash"] or not stored_size or total_size != stored_size:
+        return None, validators, head_headers
+    
+    merged_validators = {**entry["validators"], **{name: value for name, value in validators.items() if value}}
+    save_url_alias(url, entry["content_hash"], merged_validators, entry["file_type"], entry["file_extension"], entry["prefix_hash"])
+    logger.info(f"🏷️ Cache validated via {PROBE_BYTES}-byte range probe: {entry['cache_key']}")
+    return entry, validators, head_headers
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class DownloadedFile:
+    """A document streamed to a temporary file, hashed and type-sniffed on the way in"""
+
+    def __init__(self, path, content_type, content_hash, size, file_type, file_extension, prefix):
+        self.path = path
+        self.content_type = content_type
+        self.content_hash = content_hash
+        self.size = size
+        self.file_type = file_type
+        self.file_extension = file_extension
+        self.prefix_hash = get_prefix_hash(prefix)
+
+    def read_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+async def download_file_safely(url, max_size_mb=100, check_binary=True, head_headers=None):
+    """Safely download file with size limits and error handling.
+
+    Streams the body to a temporary file in fixed-size chunks, updating the content hash as it
+    goes, sniffs the type from the first chunk and aborts as soon as max_size_mb is exceeded.
+    head_headers are the headers of a HEAD the caller already sent ({} if it failed);
+    without them the size and type are fetched with a HEAD of our own.
+    Returns (DownloadedFile or None for skipped files, content_type).
+    """
+    temp_path = None
     try:
         logger.info(f"🔄 Attempting to download file from: {url}")
+        max_bytes = max_size_mb * 1024 * 1024
         
-        async with httpx.AsyncClient(timeout=30) as client:
-            # First, get headers to check file size and type
+        client = get_document_client()
+        # First, get headers to check file size and type
+        if head_headers is None:
             try:
-                head_response = await client.head(url)
-                content_length = head_response.headers.get('Content-Length')
-                content_type = head_response.headers.get('Content-Type', '')
+                head_headers = (await client.head(url)).headers
             except Exception as head_error:
                 logger.warning(f"⚠ HEAD request failed: {head_error}, proceeding with limited info")
-                content_length = None
-                content_type = ''
-            
-            # Check if it's a binary file and size is too large
-            if content_length and check_binary:
-                size_mb = int(content_length) / (1024 * 1024)
-                file_type, _ = detect_file_type(url, content_type)
-                
-                # If it's a binary file and larger than 50MB, skip download
-                if file_type == 'binary' and size_mb > 50:
-                    logger.info(f"🚫 Skipping large binary file: {size_mb:.1f}MB")
-                    return None, content_type  # Return None to indicate binary skip
-                
-                if size_mb > max_size_mb:
-                    logger.info(f"🚫 Skipping file too large: {size_mb:.1f}MB (max: {max_size_mb}MB)")
-                    return None, content_type  # Return None instead of raising exception
-            
-            # Check file type even without content length for known binary extensions
-            if check_binary:
-                file_type, _ = detect_file_type(url, content_type)
-                if file_type == 'binary':
-                    # For binary files without size info, skip download for safety
-                    logger.info(f"🚫 Skipping binary file (unknown size): {url}")
-                    return None, content_type
-            
-            # Download the file
-            response = await client.get(url, timeout=120)
+                head_headers = {}
+        content_length = head_headers.get('Content-Length')
+        content_type = head_headers.get('Content-Type', '')
+        
+        if content_length and int(content_length) > max_bytes:
+            logger.info(f"🚫 Skipping file too large: {int(content_length) / (1024 * 1024):.1f}MB (max: {max_size_mb}MB)")
+            return None, content_type  # Return None instead of raising exception
+        
+        content_hasher = hashlib.sha256()
+        size = 0
+        tmp_file = None
+        async with client.stream("GET", url, timeout=120) as response:
             if response.status_code != 200:
                 raise Exception(f"Download failed with status {response.status_code}")
+            content_type = content_type or response.headers.get('Content-Type', '')
             
-            content = response.content
-            if len(content) > max_size_mb * 1024 * 1024:
-                raise Exception(f"File size exceeded {max_size_mb}MB during download")
-            
-            logger.info(f"✅ Successfully downloaded {len(content)} bytes")
-            return content, content_type
-            
-    except Exception as e:
-        logger.error(f"❌ Download failed: {e}")
-        raise e
-
-def process_archive_file(content, file_extension):
-    """Enhanced archive extraction with robust ZIP handling and multiple format support"""
-    documents = []
-    extracted_files_count = 0
-    total_files_count = 0
-    
-    try:
-        if file_extension in ['.zip']:
-            logger.info(f"🗜️ Processing ZIP archive...")
-            
-            # Try multiple extraction methods for better compatibility
-            zip_file = None
-            try:
-                # Method 1: Standard zipfile with enhanced error recovery
-                zip_file = zipfile.ZipFile(io.BytesIO(content))
-                logger.info(f"✅ ZIP file opened successfully with standard method")
-            except zipfile.BadZipFile:
-                logger.warning(f"⚠️ Standard ZIP extraction failed, trying alternative methods...")
-                try:
-                    # Method 2: Try with different mode and strict mode disabled
-                    zip_file = zipfile.ZipFile(io.BytesIO(content), mode='r', allowZip64=True, strict_timestamps=False)
-                    logger.info(f"✅ ZIP file opened with allowZip64=True and relaxed timestamps")
-                except Exception as e2:
-                    logger.warning(f"⚠️ Alternative ZIP method 2 failed: {e2}")
-                    try:
-                        # Method 3: Try to recover partial ZIP content
-                        logger.info(f"🔧 Attempting ZIP recovery mode...")
-                        # Reset the BytesIO position
-                        content_stream = io.BytesIO(content)
-                        content_stream.seek(0)
-                        zip_file = zipfile.ZipFile(content_stream, mode='r')
-                        logger.info(f"✅ ZIP file opened with recovery mode")
-                    except Exception as e3:
-                        logger.error(f"❌ All ZIP extraction methods failed: {e3}")
-                        raise Exception(f"Cannot open ZIP file: corrupted, password-protected, or invalid format. Try extracting manually.")
-            
-            if zip_file:
-                try:
-                    # Get file list with better error handling
-                    file_list = zip_file.namelist()
-                    total_files_count = len(file_list)
-                    logger.info(f"📁 Found {total_files_count} files in ZIP archive")
-                    
-                    if total_files_count == 0:
-                        logger.warning(f"⚠️ ZIP archive is empty")
-                        return []
-                    
-                    # Process each file with enhanced extraction
-                    for filename in file_list:
-                        try:
-                            # Skip directories and hidden files
-                            if filename.endswith('/') or filename.startswith('__MACOSX/') or filename.startswith('.'):
-                                logger.info(f"⏭️ Skipping directory/hidden file: {filename}")
-                                continue
-                                
-                            file_info = zip_file.getinfo(filename)
-                            
-                            # Enhanced size check with more reasonable limits
-                            if file_info.file_size > 100 * 1024 * 1024:  # 100MB limit per file
-                                logger.warning(f"⚠️ Skipping large file {filename}: {file_info.file_size / (1024*1024):.1f}MB")
-                                continue
-                            
-                            if file_info.file_size == 0:
-                                logger.info(f"⏭️ Skipping empty file: {filename}")
-                                continue
-                            
-                            logger.info(f"📄 Extracting: {filename} ({file_info.file_size} bytes)")
-                            
-                            # Extract file content with better error handling
-                            try:
-                                extracted_content = zip_file.read(filename)
-                                extracted_files_count += 1
-                                logger.info(f"✅ Successfully extracted {filename}")
-                            except Exception as extract_error:
-                                logger.warning(f"⚠️ Failed to extract {filename}: {extract_error}")
-                                continue
-                            
-                            # Enhanced file type detection
-                            file_type, ext = detect_file_type(filename, file_content=extracted_content)
-                            logger.info(f"🔍 Detected file type for {filename}: {file_type}")
-                            
-                            # Process different file types with enhanced support
-                            if file_type in ['text', 'csv']:
-                                # Try multiple encodings
-                                text_content = None
-                                for encoding in ['utf-8', 'utf-16', 'latin1', 'cp1252']:
-                                    try:
-                                        text_content = extracted_content.decode(encoding)
-                                        logger.info(f"✅ Decoded {filename} with {encoding}")
-                                        break
-                                    except UnicodeDecodeError:
-                                        continue
-                                
-                                if text_content is not None:
-                                    doc = Document(
-                                        page_content=text_content,
-                                        metadata={
-                                            "source": f"archive/{filename}", 
-                                            "type": file_type,
-                                            "archive_extraction": True,
-                                            "file_size": file_info.file_size
-                                        }
-                                    )
-                                    documents.append(doc)
-                                else:
-                                    logger.warning(f"⚠️ Could not decode text file: {filename}")
-                                    
-                            elif file_type in ['pdf', 'word', 'excel', 'powerpoint']:
-                                # Save extracted file temporarily and process
-                                try:
-                                    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-                                        tmp_file.write(extracted_content)
-                                        temp_path = tmp_file.name
-                                    
-                                    # Process the extracted file
-                                    processed_docs = load_document_by_type(temp_path, file_type, f"archive/{filename}")
-                                    
-                                    # Add archive metadata
-                                    for doc in processed_docs:
-                                        doc.metadata.update({
-                                            "archive_extraction": True,
-                                            "archive_file": filename,
-                                            "file_size": file_info.file_size
-                                        })
-                                    
-                                    documents.extend(processed_docs)
-                                    
-                                    # Cleanup
-                                    os.unlink(temp_path)
-                                    logger.info(f"✅ Processed {file_type} file: {filename}")
-                                    
-                                except Exception as process_error:
-                                    logger.warning(f"⚠️ Failed to process {filename}: {process_error}")
-                                    
-                            elif file_type == 'image':
-                                # Process images from ZIP
-                                try:
-                                    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-                                        tmp_file.write(extracted_content)
-                                        temp_path = tmp_file.name
-                                    
-                                    processed_docs = load_document_by_type(temp_path, file_type, f"archive/{filename}")
-                                    for doc in processed_docs:
-                                        doc.metadata.update({
-                                            "archive_extraction": True,
-                                            "archive_file": filename,
-                                            "file_size": file_info.file_size
-                                        })
-                                    documents.extend(processed_docs)
-                                    
-                                    os.unlink(temp_path)
-                                    logger.info(f"✅ Processed image: {filename}")
-                                    
-                                except Exception as img_error:
-                                    logger.warning(f"⚠️ Failed to process image {filename}: {img_error}")
-                            
-                            else:
-                                # Create a metadata document for unsupported files
-                                doc = Document(
-                                    page_content=f"File: {filename}\nType: {file_type}\nSize: {file_info.file_size} bytes\nContent: Binary or unsupported file type from ZIP archive.",
-                                    metadata={
-                                        "source": f"archive/{filename}",
-                                        "type": file_type,
-                                        "archive_extraction": True,
-                                        "file_size": file_info.file_size,
-                                        "processable": False
-                                    }
-                                )
-                                documents.append(doc)
-                                logger.info(f"📄 Created metadata document for: {filename}")
-                        
-                        except Exception as file_error:
-                            logger.warning(f"⚠️ Error processing file {filename}: {file_error}")
-                            continue
-                    
-                finally:
-                    zip_file.close()
-                    
-                logger.info(f"✅ ZIP processing complete: {extracted_files_count}/{total_files_count} files extracted, {len(documents)} documents created")
-        
-        else:
-            logger.warning(f"⚠️ Unsupported archive format: {file_extension}")
-        
-        return documents
-        
-    except Exception as e:
-        logger.error(f"❌ Archive processing failed: {e}")
-        # Return at least one document with error info instead of empty list
-        error_doc = Document(
-            page_content=f"Archive processing failed: {str(e)}. This ZIP file may be corrupted, password-protected, or contain unsupported file formats.",
-            metadata={
-                "source": "archive_error",
-                "type": "archive",
-                "error": "extraction_failed",
-                "extracted_files": extracted_files_count,
-                "total_files": total_files_count
-            }
-        )
-        return [error_doc]
-
-def load_document_by_type(file_path, file_type, original_url):
-    """Load document based on file type with enhanced error handling"""
-    try:
-        documents = []
-        
-        # Get file extension from file_path
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_type == 'pdf':
-            loader = PyMuPDFLoader(file_path)
-            documents = loader.load()
-        elif file_type == 'powerpoint':
-            logger.info(f"🎯 Processing PowerPoint file: {file_path}")
-            try:
-                # First try importing the converter
-                from ppt_convert import convert_powerpoint_to_markdown
-                logger.info("📚 Imported PowerPoint converter module")
-                
-                # Check if markdown cache exists
-                cached_content = load_markdown_from_cache(original_url)
-                if cached_content:
-                    documents = [Document(
-                        page_content=cached_content,
-                        metadata={
-                            "source": original_url,
-                            "type": "presentation",
-                            "cached": True
-                        }
-                    )]
-                    return documents
-                
-                # Convert PowerPoint if no cache exists
-                logger.info("🔄 Starting PowerPoint to Markdown conversion using Docling...")
-                markdown_content, error = convert_powerpoint_to_markdown(file_path)
+            async for chunk in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if tmp_file is None:
+                    # Sniff magic bytes from the first chunk before committing to the download
+                    prefix = chunk[:PROBE_BYTES]
+                    file_type, file_extension = detect_file_type(url, content_type, chunk)
+                    if check_binary and file_type == 'binary':
+                        logger.info(f"🚫 Skipping binary file: {url}")
+                        return None, content_type  # Return None to indicate binary skip
+                    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=file_extension)
+                    temp_path = tmp_file.name
                 
-                if error:
-                    raise Exception(f"PowerPoint conversion failed: {error}")
-                
-                # Cache the markdown content
-                save_markdown_to_cache(markdown_content, original_url)
-                
-                documents = [Document(
-                    page_content=markdown_content,
-                    metadata={
-                        "source": original_url,
-                        "type": "presentation",
-                        "cached": False,
-                        "converted_at": time.strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                )]
-                logger.info("✅ PowerPoint processing completed successfully")
-                return documents
-                
-            except Exception as e:
-                logger.error(f"❌ PowerPoint processing failed: {str(e)}")
-                # Fall back to UnstructuredPowerPointLoader
-                logger.info("🔄 Falling back to UnstructuredPowerPointLoader...")
-                try:
-                    loader = UnstructuredPowerPointLoader(file_path)
-                    documents = loader.load()
-                    return documents
-                except Exception as fallback_error:
-                    logger.error(f"❌ Fallback loader failed: {str(fallback_error)}")
-                    raiseloader = UnstructuredPowerPointLoader(file_path)
-            documents = loader.load()
-        elif file_type == 'word':
-            try:
-                loader = UnstructuredWordDocumentLoader(file_path)
-                documents = loader.load()
-            except Exception as e:
-                logger.warning(f"Word loading failed: {e}")
-                doc = Document(
-                    page_content=f"Word document from {original_url}. Content extraction failed.",
-                    metadata={"source": original_url, "type": "word", "error": "extraction_failed"}
-                )
-                documents = [doc]
-                
-        elif file_type == 'excel':
-            try:
-                # Enhanced Excel processing with dramatically improved context window and data extraction
-                logger.info("🔍 Starting enhanced Excel processing with extended context...")
-                
-                # Method 1: Enhanced UnstructuredExcelLoader with more context
-                try:
-                    loader = UnstructuredExcelLoader(file_path)
-                    documents = loader.load()
-                    
-                    if documents and any(hasattr(doc, 'page_content') and isinstance(doc.page_content, str) and doc.page_content.strip() for doc in documents):
-                        # Enhance the extracted content with more detailed analysis
-                        enhanced_content = []
-                        for doc in documents:
-                            if hasattr(doc, 'page_content') and isinstance(doc.page_content, str):
-                                content = doc.page_content.strip()
-                            else:
-                                continue
-                            
-                            # Add structured analysis to the content
-                            enhanced_text = f"""EXCEL SPREADSHEET ANALYSIS:
-
-EXTRACTED DATA:
-{content}
-
-DATA STRUCTURE ANALYSIS:
-- This Excel file contains structured tabular data
-- Data is organized in rows and columns with headers
-- May contain formulas, calculations, and formatted information
-- Could include multiple worksheets with different data sets
-- Numbers, text, dates, and calculated values are present
-- Data relationships and dependencies may exist between cells
-
-CONTENT SUMMARY:
-The spreadsheet contains detailed information that can be analyzed for specific questions about data values, calculations, trends, comparisons, and structured information retrieval."""
-                            
-                            enhanced_content.append(enhanced_text)
-                        
-                        # Create enhanced document with much larger context
-                        documents = [Document(
-                            page_content="\n\n".join(enhanced_content),
-                            metadata={
-                                "source": original_url, 
-                                "type": "excel", 
-                                "method": "enhanced_unstructured",
-                                "context_level": "high",
-                                "processing_quality": "enhanced"
-                            }
-                        )]
-                        logger.info("✅ Excel processed with Enhanced UnstructuredExcelLoader")
-                    else:
-                        raise Exception("Empty content from UnstructuredExcelLoader")
-                        
-                except Exception as e1:
-                    logger.warning(f"Enhanced UnstructuredExcelLoader failed: {e1}")
-                    
-                    # Method 2: Advanced openpyxl processing with comprehensive data extraction
-                    try:
-                        if file_extension in ['.xlsx', '.xlsm', '.xlsb']:
-                            import openpyxl
-                            logger.info("🔧 Using advanced openpyxl processing...")
-                            
-                            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-                            comprehensive_content = []
-                            
-                            # Enhanced worksheet processing
-                            for sheet_name in wb.sheetnames:
-                                try:
-                                    sheet = wb[sheet_name]
-                                    logger.info(f"📊 Processing sheet: {sheet_name}")
-                                    
-                                    sheet_analysis = f"""WORKSHEET: {sheet_name}
-DATA EXTRACTION AND ANALYSIS:
-
-RAW DATA:
-"""
-                                    
-                                    # Extract more comprehensive data with better formatting
-                                    rows_processed = 0
-                                    max_rows = min(sheet.max_row, 1000)  # Process up to 1000 rows for performance
-                                    
-                                    # Try to identify headers
-                                    header_row = None
-                                    for row_idx in range(1, min(6, max_rows + 1)):  # Check first 5 rows for headers
-                                        row = list(sheet.iter_rows(min_row=row_idx, max_row=row_idx, values_only=True))[0]
-                                        if any(isinstance(cell, str) and len(str(cell)) > 0 for cell in row if cell is not None):
-                                            header_row = row_idx
-                                            header_data = [str(cell) if cell is not None else "" for cell in row]
-                                            sheet_analysis += f"HEADERS (Row {row_idx}): {' | '.join(header_data)}\n\n"
-                                            break
-                                    
-                                    # Extract data rows with enhanced formatting
-                                    start_row = header_row + 1 if header_row else 1
-                                    for row in sheet.iter_rows(min_row=start_row, max_row=max_rows, values_only=True):
-                                        if any(cell is not None for cell in row):
-                                            # Enhanced cell processing
-                                            processed_row = []
-                                            for cell in row:
-                                                if cell is not None:
-                                                    # Better formatting for different data types
-                                                    if isinstance(cell, (int, float)):
-                                                        processed_row.append(f"{cell:,.2f}" if isinstance(cell, float) else f"{cell:,}")
-                                                    else:
-                                                        processed_row.append(str(cell))
-                                                else:
-                                                    processed_row.append("")
-                                            
-                                            row_text = " | ".join(processed_row)
-                                            sheet_analysis += f"Row {rows_processed + start_row}: {row_text}\n"
-                                            rows_processed += 1
-                                            
-                                            # Limit rows for readability but ensure comprehensive coverage
-                                            if rows_processed >= 200:  # Increased from typical limits
-                                                sheet_analysis += f"\n... (showing first 200 data rows of {max_rows} total rows)\n"
-                                                break
-                                    
-                                    # Add data analysis summary
-                                    sheet_analysis += f"""
-
-SHEET SUMMARY:
-- Total rows processed: {rows_processed}
-- Sheet contains structured data with {'identified headers' if header_row else 'data without clear headers'}
-- Data types include numbers, text, and potentially calculated values
-- This sheet can be queried for specific data values, calculations, and analysis
-
-"""
-                                    comprehensive_content.append(sheet_analysis)
-                                    
-                                except Exception as sheet_error:
-                                    logger.warning(f"⚠️ Error processing sheet {sheet_name}: {sheet_error}")
-                                    comprehensive_content.append(f"WORKSHEET: {sheet_name}\nError processing this sheet: {sheet_error}\n\n")
-                            
-                            if comprehensive_content:
-                                # Create comprehensive document with extensive context
-                                final_content = f"""COMPREHENSIVE EXCEL ANALYSIS:
-
-{chr(10).join(comprehensive_content)}
-
-OVERALL SPREADSHEET ANALYSIS:
-- This Excel file contains {len(wb.sheetnames)} worksheet(s): {', '.join(wb.sheetnames)}
-- Data is structured in tabular format with rows and columns
-- Contains various data types including text, numbers, dates, and formulas
-- Can be analyzed for specific values, calculations, trends, and data relationships
-- Supports complex queries about data patterns, comparisons, and statistical analysis
-- All data has been extracted and formatted for comprehensive question answering
-
-QUERY CAPABILITIES:
-- Specific cell values and data lookups
-- Data comparisons and calculations
-- Trend analysis and pattern recognition
-- Statistical summaries and aggregations
-- Cross-sheet data relationships
-- Detailed data filtering and analysis"""
-
-                                documents = [Document(
-                                    page_content=final_content,
-                                    metadata={
-                                        "source": original_url, 
-                                        "type": "excel", 
-                                        "method": "advanced_openpyxl",
-                                        "sheets_count": len(wb.sheetnames),
-                                        "context_level": "comprehensive",
-                                        "processing_quality": "detailed"
-                                    }
-                                )]
-                                logger.info(f"✅ Excel processed with Advanced openpyxl - {len(wb.sheetnames)} sheets analyzed")
-                            else:
-                                raise Exception("No content extracted with advanced openpyxl")
-                        else:
-                            raise Exception("Not a supported xlsx file format")
-                            
-                    except Exception as e2:
-                        logger.warning(f"Advanced openpyxl failed: {e2}")
-                        
-                        # Method 3: Enhanced xlrd for legacy .xls files
-                        try:
-                            if file_extension in ['.xls']:
-                                import xlrd
-                                logger.info("🔧 Using enhanced xlrd for legacy Excel...")
-                                
-                                workbook = xlrd.open_workbook(file_path)
-                                comprehensive_content = []
-                                
-                                for sheet_idx in range(workbook.nsheets):
-                                    try:
-                                        sheet = workbook.sheet_by_index(sheet_idx)
-                                        sheet_name = sheet.name
-                                        
-                                        sheet_analysis = f"""LEGACY WORKSHEET: {sheet_name}
-ENHANCED DATA EXTRACTION:
-
-RAW DATA:
-"""
-                                        
-                                        # Enhanced legacy processing
-                                        for row_idx in range(min(sheet.nrows, 500)):  # Process more rows
-                                            try:
-                                                row = sheet.row_values(row_idx)
-                                                if any(cell for cell in row if str(cell).strip()):
-                                                    # Better formatting for legacy data
-                                                    formatted_row = []
-                                                    for cell in row:
-                                                        if isinstance(cell, (int, float)) and cell != 0:
-                                                            formatted_row.append(f"{cell:,.2f}" if isinstance(cell, float) else f"{cell:,}")
-                                                        elif str(cell).strip():
-                                                            formatted_row.append(str(cell))
-                                                        else:
-                                                            formatted_row.append("")
-                                                    
-                                                    row_text = " | ".join(formatted_row)
-                                                    sheet_analysis += f"Row {row_idx + 1}: {row_text}\n"
-                                            except Exception as row_error:
-                                                logger.warning(f"Error processing row {row_idx}: {row_error}")
-                                                continue
-                                        
-                                        sheet_analysis += f"""
-
-LEGACY SHEET SUMMARY:
-- Contains {sheet.nrows} rows and {sheet.ncols} columns
-- Legacy Excel format with preserved data structure
-- Data extracted and formatted for analysis
-- Supports comprehensive querying and analysis
-
-"""
-                                        comprehensive_content.append(sheet_analysis)
-                                        
-                                    except Exception as sheet_error:
-                                        logger.warning(f"Error processing legacy sheet {sheet_idx}: {sheet_error}")
-                                        continue
-                                
-                                if comprehensive_content:
-                                    final_content = f"""LEGACY EXCEL COMPREHENSIVE ANALYSIS:
-
-{chr(10).join(comprehensive_content)}
-
-OVERALL LEGACY SPREADSHEET ANALYSIS:
-- Legacy Excel file (.xls format) successfully processed
-- Contains {workbook.nsheets} worksheet(s)
-- Data preserved from legacy format with enhanced formatting
-- Supports detailed queries about data values, calculations, and analysis
-- All accessible data has been extracted and structured for comprehensive analysis"""
-
-                                    documents = [Document(
-                                        page_content=final_content,
-                                        metadata={
-                                            "source": original_url, 
-                                            "type": "excel", 
-                                            "method": "enhanced_xlrd",
-                                            "legacy_format": True,
-                                            "context_level": "comprehensive",
-                                            "processing_quality": "detailed"
-                                        }
-                                    )]
-                                    logger.info("✅ Legacy Excel processed with Enhanced xlrd")
-                                else:
-                                    raise Exception("No content extracted with enhanced xlrd")
-                            else:
-                                raise Exception("Not a legacy .xls file")
-                                
-                        except Exception as e3:
-                            logger.warning(f"Enhanced xlrd failed: {e3}")
-                            
-                            # Method 4: Intelligent fallback with comprehensive context
-                            logger.info("🔄 Creating intelligent Excel fallback with comprehensive context...")
-                            documents = [Document(
-                                page_content=f"""EXCEL SPREADSHEET COMPREHENSIVE ANALYSIS:
-
-FILE INFORMATION:
-- Source: {original_url}
-- Type: Excel Spreadsheet ({file_extension})
-- Processing Status: Intelligent Fallback Mode
-
-SPREADSHEET CHARACTERISTICS:
-This Excel file contains structured tabular data organized in rows and columns. Excel spreadsheets typically include:
-
-DATA STRUCTURE:
-- Headers defining column categories and data types
-- Numeric data including integers, decimals, percentages, and currency values
-- Text data including names, descriptions, categories, and labels  
-- Date and time information
-- Calculated fields with formulas and functions
-- Multiple worksheets with related or different data sets
-
-ANALYTICAL CAPABILITIES:
-The spreadsheet supports comprehensive analysis including:
-- Specific data value lookups and retrieval
-- Mathematical calculations and statistical analysis
-- Data comparisons between rows, columns, and cells
-- Trend analysis and pattern identification
-- Data filtering and conditional queries
-- Cross-referencing between different sections
-- Summary statistics and aggregations
-
-QUERY SUPPORT:
-This Excel file can answer questions about:
-- Specific cell values and data points
-- Data ranges and calculations
-- Comparisons between different data elements
-- Statistical summaries and totals
-- Data patterns and relationships
-- Conditional data analysis
-- Multi-criteria data filtering
-
-PROCESSING NOTE:
-While specific content extraction encountered technical limitations, the file structure and data organization principles allow for meaningful responses to data-related questions based on typical Excel spreadsheet patterns and the comprehensive context provided.""",
-                                metadata={
-                                    "source": original_url, 
-                                    "type": "excel", 
-                                    "method": "intelligent_fallback",
-                                    "processable": True,
-                                    "context_level": "comprehensive",
-                                    "processing_quality": "enhanced_fallback"
-                                }
-                            )]
-                            logger.info("📄 Intelligent Excel fallback document created with comprehensive context")
-                            
-            except Exception as e:
-                logger.error(f"Complete Excel processing failure: {e}")
-                # Enhanced failure fallback with maximum context
-                documents = [Document(
-                    page_content=f"""EXCEL DOCUMENT COMPREHENSIVE CONTEXT:
-
-FILE: {original_url}
-TYPE: Excel Spreadsheet
-STATUS: Processing encountered technical difficulties
-
-EXCEL FILE CONTEXT:
-This is an Excel spreadsheet file that contains structured data in tabular format. Excel files are designed to store, organize, and analyze data using rows and columns.
-
-TYPICAL EXCEL CONTENT INCLUDES:
-- Numerical data (integers, decimals, percentages, currency)
-- Text data (names, descriptions, categories, labels)
-- Date and time values
-- Calculated fields using formulas and functions
-- Multiple worksheets for different data sets
-- Headers and data organization structures
-
-DATA ANALYSIS CAPABILITIES:
-Excel spreadsheets support various analytical operations:
-- Data lookups and specific value retrieval
-- Mathematical calculations and statistical analysis
-- Data comparisons and trend analysis
-- Conditional formatting and data filtering
-- Summary statistics and aggregations
-- Cross-referencing and data relationships
-
-QUESTION ANSWERING POTENTIAL:
-Despite processing limitations, this Excel file can potentially provide information about:
-- General data structure and organization
-- Typical Excel analytical capabilities
-- Standard spreadsheet features and functions
-- Data management and analysis principles
-- Common Excel use cases and applications
-
-TECHNICAL NOTE:
-Content extraction encountered difficulties, but the file maintains its Excel structure and can be discussed in terms of general spreadsheet capabilities and standard Excel functionality.""",
-                    metadata={
-                        "source": original_url, 
-                        "type": "excel", 
-                        "processable": True, 
-                        "error": "processing_failed",
-                        "context_level": "comprehensive",
-                        "fallback_mode": "enhanced"
-                    }
-                )]
-                
-        elif file_type == 'image':
-            # Enhanced image processing with multiple OCR fallbacks and better error handling
-            try:
-                logger.info(f"🖼️ Starting enhanced image OCR processing for {file_path}")
-                
-                # Method 1: Try EasyOCR (most robust and modern)
-                try:
-                    import easyocr
-                    logger.info("🔍 Attempting EasyOCR processing...")
-                    
-                    # Initialize EasyOCR reader with common languages
-                    reader = easyocr.Reader(['en', 'ch_sim'], gpu=False, verbose=False)
-                    
-                    # Process image with EasyOCR
-                    results = reader.readtext(file_path, detail=0)  # detail=0 for simple text output
-                    
-                    if results and any(text.strip() for text in results):
-                        extracted_text = "\n".join([text.strip() for text in results if text.strip()])
-                        
-                        documents = [Document(
-                            page_content=f"OCR Extracted Text:\n{extracted_text}",
-                            metadata={
-                                "source": original_url, 
-                                "type": "image", 
-                                "method": "easyocr",
-                                "ocr_confidence": "high",
-                                "text_blocks": len(results)
-                            }
-                        )]
-                        logger.info(f"✅ EasyOCR successfully extracted {len(results)} text blocks")
-                    else:
-                        raise Exception("No text detected by EasyOCR")
-                        
-                except ImportError:
-                    logger.warning("⚠️ EasyOCR not available, trying pytesseract...")
-                    raise Exception("EasyOCR not installed")
-                except Exception as e:
-                    logger.warning(f"⚠️ EasyOCR failed: {e}, trying pytesseract...")
-                    
-                    # Method 2: Enhanced pytesseract with better configuration
-                    try:
-                        import pytesseract
-                        from PIL import Image
-                        logger.info("🔍 Attempting enhanced pytesseract processing...")
-                        
-                        # Open and preprocess image
-                        image = Image.open(file_path)
-                        
-                        # Convert to RGB if needed
-                        if image.mode != 'RGB':
-                            image = image.convert('RGB')
-                        
-                        # Enhanced OCR with custom configuration for better accuracy
-                        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,!?@#$%^&*()_+-=[]{}|;:,.<>?/`~"\' '
-                        
-                        # Try different PSM modes for better text detection
-                        psm_modes = [6, 8, 13, 11, 12]  # Different page segmentation modes
-                        best_text = ""
-                        best_confidence = 0
-                        
-                        for psm in psm_modes:
-                            try:
-                                config = f'--oem 3 --psm {psm}'
-                                text = pytesseract.image_to_string(image, config=config, timeout=30)
-                                
-                                if text.strip() and len(text.strip()) > len(best_text.strip()):
-                                    # Get confidence data
-                                    data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT, timeout=30)
-                                    confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-                                    avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-                                    
-                                    if avg_confidence > best_confidence or not best_text.strip():
-                                        best_text = text
-                                        best_confidence = avg_confidence
-                                        
-                            except Exception as psm_error:
-                                logger.warning(f"PSM {psm} failed: {psm_error}")
-                                continue
-                        
-                        if best_text.strip():
-                            documents = [Document(
-                                page_content=f"OCR Extracted Text (Confidence: {best_confidence:.1f}%):\n{best_text.strip()}",
-                                metadata={
-                                    "source": original_url, 
-                                    "type": "image", 
-                                    "method": "pytesseract_enhanced",
-                                    "ocr_confidence": f"{best_confidence:.1f}%",
-                                    "processing_mode": "multi_psm"
-                                }
-                            )]
-                            logger.info(f"✅ Enhanced pytesseract extracted text with {best_confidence:.1f}% confidence")
-                        else:
-                            raise Exception("No text found with enhanced pytesseract")
-                            
-                    except ImportError:
-                        logger.warning("⚠️ Pytesseract not available, trying UnstructuredImageLoader...")
-                        raise Exception("Pytesseract not installed")
-                    except Exception as e2:
-                        logger.warning(f"⚠️ Enhanced pytesseract failed: {e2}, trying basic methods...")
-                        
-                        # Method 3: Try UnstructuredImageLoader as fallback
-                        try:
-                            loader = UnstructuredImageLoader(file_path)
-                            documents = loader.load()
-                            if documents and documents[0].page_content.strip():
-                                # Enhance the content with OCR context
-                                enhanced_content = f"Image Text Content:\n{documents[0].page_content.strip()}"
-                                documents = [Document(
-                                    page_content=enhanced_content,
-                                    metadata={
-                                        "source": original_url, 
-                                        "type": "image", 
-                                        "method": "unstructured_loader",
-                                        "fallback_method": True
-                                    }
-                                )]
-                                logger.info("✅ UnstructuredImageLoader extracted content")
-                            else:
-                                raise Exception("Empty content from UnstructuredImageLoader")
-                        except Exception as e3:
-                            logger.warning(f"⚠️ UnstructuredImageLoader failed: {e3}, using image metadata...")
-                            
-                            # Method 4: Enhanced image metadata with visual analysis
-                            try:
-                                from PIL import Image
-                                image = Image.open(file_path)
-                                width, height = image.size
-                                format_name = image.format
-                                mode = image.mode
-                                
-                                # Try to detect if image might contain text based on characteristics
-                                aspect_ratio = width / height
-                                pixel_count = width * height
-                                
-                                text_likelihood = "unknown"
-                                if aspect_ratio > 2 or aspect_ratio < 0.5:
-                                    text_likelihood = "possible (unusual aspect ratio suggests document/text)"
-                                elif pixel_count > 500000:  # High resolution suggests document
-                                    text_likelihood = "likely (high resolution suggests document)"
-                                
-                                enhanced_metadata_content = f"""Image Analysis Report:
-- Source: {original_url}
-- Format: {format_name}
-- Dimensions: {width}x{height} pixels ({pixel_count:,} total pixels)
-- Color Mode: {mode}
-- Aspect Ratio: {aspect_ratio:.2f}
-- Text Content Likelihood: {text_likelihood}
-
-OCR Processing Status:
-- Advanced OCR methods (EasyOCR, Enhanced Pytesseract) were attempted but failed
-- This could be due to:
-  1. No readable text in the image
-  2. Text in unsupported languages
-  3. Poor image quality or resolution
-  4. Missing OCR dependencies
-
-Note: The image file exists and is readable, but automated text extraction was not successful."""
-
-                                documents = [Document(
-                                    page_content=enhanced_metadata_content,
-                                    metadata={
-                                        "source": original_url, 
-                                        "type": "image", 
-                                        "method": "enhanced_metadata",
-                                        "width": width,
-                                        "height": height,
-                                        "format": format_name,
-                                        "text_likelihood": text_likelihood,
-                                        "ocr_attempted": True,
-                                        "ocr_success": False
-                                    }
-                                )]
-                                logger.info("📊 Enhanced image metadata analysis completed")
-                            except Exception as e4:
-                                # Final fallback
-                                logger.warning(f"⚠️ Image metadata extraction failed: {e4}")
-                                documents = [Document(
-                                    page_content=f"Image file detected from {original_url}. Multiple OCR processing methods were attempted (EasyOCR, Enhanced Pytesseract, UnstructuredImageLoader) but text extraction was not successful. This may indicate the image contains no readable text, uses unsupported languages, or has quality issues preventing OCR processing.",
-                                    metadata={
-                                        "source": original_url, 
-                                        "type": "image", 
-                                        "error": "all_ocr_methods_failed",
-                                        "attempted_methods": ["easyocr", "pytesseract_enhanced", "unstructured_loader", "metadata_analysis"]
-                                    }
-                                )]
-                                logger.info("📄 Final fallback image document created")
-                                
-            except Exception as e:
-                logger.error(f"❌ Complete image processing failure: {e}")
-                documents = [Document(
-                    page_content=f"Critical error processing image from {original_url}. Error: {str(e)}. The image file could not be processed due to system-level issues.",
-                    metadata={"source": original_url, "type": "image", "error": "critical_failure"}
-                )]
-
-                
-        elif file_type == 'text':
-            try:
-                loader = TextLoader(file_path, encoding='utf-8')
-                documents = loader.load()
-            except Exception as e:
-                try:
-                    loader = TextLoader(file_path, encoding='latin1')
-                    documents = loader.load()
-                except Exception as e2:
-                    logger.warning(f"Text loading failed: {e2}")
-                    documents = []
-                    
-        elif file_type == 'csv':
-            try:
-                loader = CSVLoader(file_path)
-                documents = loader.load()
-            except Exception as e:
-                logger.warning(f"CSV loading failed: {e}")
-                documents = []
-                
-        elif file_type == 'binary':
-            # For binary files, create a placeholder document
-            doc = Document(
-                page_content=f"Binary file from {original_url}. Content type: {file_type}. Binary files cannot be processed for text content.",
-                metadata={"source": original_url, "type": "binary", "processable": False}
-            )
-            documents = [doc]
-            
-        elif file_type == 'archive':
-            # Handle archive files separately in the main function
-            documents = []
-            
-        else:
-            doc = Document(
-                page_content=f"Unsupported file type from {original_url}.",
-                metadata={"source": original_url, "type": file_type, "processable": False}
-            )
-            documents = [doc]
+                size += len(chunk)
+                if size > max_bytes:
+                    raise Exception(f"File size exceeded {max_size_mb}MB during download")
+                content_hasher.update(chunk)
+                tmp_file.write(chunk)
+        
+        if tmp_file is None:
+            raise Exception("Downloaded file is empty")
+        tmp_file.close()
         
-        logger.info(f"📄 Loaded {len(documents)} documents from {file_type} file")
-        return documents
+        logger.info(f"✅ Successfully downloaded {size} bytes to {temp_path}")
+        return DownloadedFile(temp_path, content_type, content_hasher.hexdigest(), size,
+                              file_type, file_extension, prefix), content_type
         
     except Exception as e:
-        logger.error(f"❌ Document loading failed for {file_type}: {e}")
-        # Return error document
-        error_doc = Document(
-            page_content=f"Failed to load {file_type} file from {original_url}. Error: {str(e)}",
-            metadata={"source": original_url, "type": file_type, "error": "loading_failed"}
-        )
-        return [error_doc]
+        logger.error(f"❌ Download failed: {e}")
+        if temp_path and os.path.exists(temp_path):
+            if tmp_file is not None:
+                tmp_file.close()
+            os.remove(temp_path)
+        raise e
 
 def get_cache_path(file_hash):
     """Get the cache file path for a given file hash"""
     return os.path.join(CACHE_DIR, f"{file_hash}.faiss")
 
+# Staging directories (.building-*, .retired-*) older than this are crash leftovers, swept at startup
+CACHE_SWEEP_MIN_AGE_SECONDS = int(os.getenv("CACHE_SWEEP_MIN_AGE_SECONDS", 3600))
+# Ingestion checkpoints (.partial) are kept far longer, for a retry to resume from, and never while locked
+CACHE_CHECKPOINT_MAX_AGE_SECONDS = int(os.getenv("CACHE_CHECKPOINT_MAX_AGE_SECONDS", 7 * 24 * 3600))
+
+def get_checkpoint_path(file_hash):
+    """Directory holding the embedded batches of an unfinished ingestion"""
+    return f"{get_cache_path(file_hash)}.partial"
+
 def save_vectorstore_to_cache(vectorstore, file_hash):
-    """Save vectorstore to cache"""
+    """Save vectorstore to cache as index.faiss plus a columnar chunk store.
+
+    The entry is written into a temp directory and renamed into place once complete,
+    so no worker ever loads a half-written entry; workers that have the previous
+    index memory-mapped keep reading their copy.
+    """
+    build_path = None
     try:
         cache_path = get_cache_path(file_hash)
-        vectorstore.save_local(cache_path)
-        logger.info(f"💾 Vectorstore saved to cache: {cache_path}")
+        build_path = tempfile.mkdtemp(dir=CACHE_DIR, prefix=f".building-{file_hash}-")
+        documents = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[row])
+                     for row in range(vectorstore.index.ntotal)]
+        faiss_store.write_chunk_store(build_path, documents)
+        index_type = INDEX_TYPE
+        if index_type == "auto":
+            index_type = faiss_store.choose_index_type(vectorstore.index.ntotal, INDEX_IVF_MIN_CHUNKS, INDEX_HNSW_MIN_CHUNKS)
+        manifest = faiss_store.write_vector_index(
+            build_path, vectorstore.index, index_type, INDEX_QUANTIZATION, INDEX_RERANK_FACTOR,
+            INDEX_PQ_SUBQUANTIZERS, INDEX_IVF_NPROBE, INDEX_HNSW_M, INDEX_HNSW_EF_SEARCH
+        )
+        faiss_store.commit_directory(build_path, cache_path)
+        build_path = None
+        logger.info(f"💾 Vectorstore saved to cache ({manifest['factory']}): {cache_path}")
+        # Keep the on-disk form resident: mapped, compressed and lazily materialized
+        vectorstore_cache.put(file_hash, read_cached_vectorstore(cache_path, vectorstore.embedding_function))
+        if answer_cache:
+            # Answers retrieved from a previous build of this index are stale
+            answer_cache.invalidate(file_hash)
         return True
     except Exception as e:
         logger.warning(f"⚠ Failed to save cache: {e}")
         return False
+    finally:
+        if build_path:
+            shutil.rmtree(build_path, ignore_errors=True)
 
 def save_test_results(results, filename="test_results.json"):
     """Save test results to a JSON file for later analysis, with robust error handling, logging, and console confirmation."""
@@ -1207,13 +436,71 @@ def save_test_results(results, filename="test_results.json"):
                     print(f"❌ Failed to reset {filename}: {reset_err}")
                 return False
 
+# === In-Memory Vectorstore LRU ===
+VECTORSTORE_CACHE_MAX_MB = int(os.getenv("VECTORSTORE_CACHE_MAX_MB", 1024))
+# Memory-mapped indexes are charged no private bytes, so the entry count bounds their mappings and file handles
+VECTORSTORE_LRU_MAX_ENTRIES = int(os.getenv("VECTORSTORE_LRU_MAX_ENTRIES", 256))
+# Open cached indexes read-only memory-mapped, so workers share page-cache pages
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+# Index structure by chunk count: flat below INDEX_IVF_MIN_CHUNKS, IVF below INDEX_HNSW_MIN_CHUNKS, then HNSW
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto").lower()
+if INDEX_TYPE not in faiss_store.INDEX_TYPES:
+    raise ValueError(f"INDEX_TYPE must be one of {faiss_store.INDEX_TYPES}")
+INDEX_IVF_MIN_CHUNKS = int(os.getenv("INDEX_IVF_MIN_CHUNKS", 2000))
+INDEX_HNSW_MIN_CHUNKS = int(os.getenv("INDEX_HNSW_MIN_CHUNKS", 20000))
+INDEX_IVF_NPROBE = int(os.getenv("INDEX_IVF_NPROBE", 0))  # 0 = nlist / 8
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", 32))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", 64))
+# Opt-in compressed cache entries: "sq8" (int8, 4x smaller) or "pq" (INDEX_PQ_SUBQUANTIZERS bytes per vector)
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none").lower()
+if INDEX_QUANTIZATION not in faiss_store.QUANTIZATIONS:
+    raise ValueError(f"INDEX_QUANTIZATION must be one of {faiss_store.QUANTIZATIONS}")
+# Shortlist k * factor on the codes, then re-rank exactly with the float vectors (0 disables re-ranking)
+INDEX_RERANK_FACTOR = int(os.getenv("INDEX_RERANK_FACTOR", 4))
+INDEX_PQ_SUBQUANTIZERS = int(os.getenv("INDEX_PQ_SUBQUANTIZERS", 64))
+
+vectorstore_cache = VectorstoreLRU(VECTORSTORE_CACHE_MAX_MB * 1024 * 1024, VECTORSTORE_LRU_MAX_ENTRIES)
+
+def read_cached_vectorstore(cache_path, embedding_model):
+    """FAISS.load_local equivalent over the chunk store; memory-maps index.faiss when FAISS_MMAP is set.
+
+    Entries still holding a pickled index.pkl docstore are converted to a chunk store once.
+    """
+    if not faiss_store.has_chunk_store(cache_path):
+        try:
+            with open(os.path.join(cache_path, "index.pkl"), "rb") as f:
+                legacy_docstore, legacy_ids = pickle.load(f)
+            documents = [legacy_docstore.search(legacy_ids[row]) for row in range(len(legacy_ids))]
+            faiss_store.write_chunk_store(cache_path, documents)
+            os.remove(os.path.join(cache_path, "index.pkl"))
+            logger.info(f"📦 Converted pickled docstore to chunk store: {cache_path}")
+        except FileNotFoundError:
+            # Another worker converted it first
+            if not faiss_store.has_chunk_store(cache_path):
+                raise
+    
+    index, mapped = faiss_store.read_vector_index(cache_path, mmap=FAISS_MMAP)
+    docstore = faiss_store.ChunkStore(cache_path)
+    # Entries keep the metric they were built with until migrate_index_metric.py converts them
+    distance_strategy = (DistanceStrategy.MAX_INNER_PRODUCT if index.metric_type == faiss.METRIC_INNER_PRODUCT
+                         else DistanceStrategy.EUCLIDEAN_DISTANCE)
+    vectorstore = FAISS(embedding_model, index, docstore, faiss_store.RowIds(len(docstore)),
+                        distance_strategy=distance_strategy)
+    vectorstore.index_mapped = mapped
+    return vectorstore
+
 def load_vectorstore_from_cache(file_hash, embedding_model):
-    """Load vectorstore from cache if it exists"""
+    """Load vectorstore from the in-memory LRU, or from the disk cache if it exists"""
     try:
+        vectorstore = vectorstore_cache.get(file_hash)
+        if vectorstore is not None:
+            logger.info(f"⚡ Vectorstore served from memory: {file_hash}")
+            return vectorstore
         cache_path = get_cache_path(file_hash)
         if os.path.exists(cache_path):
-            vectorstore = FAISS.load_local(cache_path, embedding_model, allow_dangerous_deserialization=True)
-            logger.info(f"🎯 Loaded vectorstore from cache: {cache_path}")
+            vectorstore = read_cached_vectorstore(cache_path, embedding_model)
+            logger.info(f"🎯 Loaded vectorstore from cache{' (mmap)' if vectorstore.index_mapped else ''}: {cache_path}")
+            vectorstore_cache.put(file_hash, vectorstore)
             return vectorstore
         return None
     except Exception as e:
@@ -1221,15 +508,205 @@ def load_vectorstore_from_cache(file_hash, embedding_model):
         return None
 
 
-async def get_next_nvidia_key():
-    global KEY_INDEX
-    async with lock:
-        key_label, key_value = NVIDIA_KEYS[KEY_INDEX]
-        KEY_INDEX = (KEY_INDEX + 1) % len(NVIDIA_KEYS)
-    return key_label, key_value
+# === NVIDIA Key Scheduler ===
+LLM_KEY_MAX_CONCURRENCY = int(os.getenv("LLM_KEY_MAX_CONCURRENCY", 8))
+LLM_KEY_TOKENS_PER_MINUTE = int(os.getenv("LLM_KEY_TOKENS_PER_MINUTE", 0))  # 0 = unlimited
+LLM_KEY_FAILURE_THRESHOLD = int(os.getenv("LLM_KEY_FAILURE_THRESHOLD", 3))
+LLM_KEY_COOLDOWN_SECONDS = float(os.getenv("LLM_KEY_COOLDOWN_SECONDS", 30))
+
+key_scheduler = NvidiaKeyScheduler(NVIDIA_KEYS, LLM_KEY_MAX_CONCURRENCY, LLM_KEY_TOKENS_PER_MINUTE,
+                                   LLM_KEY_FAILURE_THRESHOLD, LLM_KEY_COOLDOWN_SECONDS)
+
+# === Shared NVIDIA HTTP Clients ===
+NVIDIA_API_URL = os.getenv("NVIDIA_API_URL", "https://integrate.api.nvidia.com/v1/chat/completions")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 10))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+LLM_TIMEOUT = 40
+
+class NvidiaClientPool:
+    """App-lifetime httpx clients, one connection pool per API key"""
+
+    def __init__(self, max_connections, max_keepalive, http2):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=60
+        )
+        self.http2 = http2
+        self._clients = {}
+
+    def _new_client(self):
+        if self.http2:
+            try:
+                return httpx.AsyncClient(timeout=LLM_TIMEOUT, limits=self.limits, http2=True)
+            except ImportError:
+                logger.warning("⚠️ h2 package not installed, NVIDIA client falling back to HTTP/1.1")
+                self.http2 = False
+        return httpx.AsyncClient(timeout=LLM_TIMEOUT, limits=self.limits)
+
+    def get(self, api_key):
+        """Get (or lazily create) the pooled client for an API key"""
+        client = self._clients.get(api_key)
+        if client is None or client.is_closed:
+            client = self._new_client()
+            self._clients[api_key] = client
+        return client
+
+    def open(self, keys):
+        for _, key_value in keys:
+            if key_value:
+                self.get(key_value)
+        logger.info(f"🔌 Opened {len(self._clients)} pooled NVIDIA client(s) (http2={self.http2})")
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+nvidia_clients = NvidiaClientPool(LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_HTTP2)
+
+# === Executor Layer ===
+# Parsing/OCR is CPU-bound Python and goes to a process pool; torch and FAISS
+# release the GIL, so embedding and vector search go to a thread pool.
+# Parse workers start from a forkserver (spawn where there is none) that preloads only
+# PARSE_POOL_PRELOAD: forking this process itself, once torch and the HTTP clients run
+# threads, can leave a child blocked on a lock another thread held. Workers re-import
+# the main script, which is why the server starts from serve.py.
+# PARSE_POOL_WORKERS=0 runs parsing in one dedicated thread instead; PyMuPDF
+# and the other loaders are not thread-safe, so that thread is never shared.
+PARSE_POOL_WORKERS = int(os.getenv("PARSE_POOL_WORKERS", max(1, min(4, (os.cpu_count() or 2) // 2))))
+EMBED_POOL_WORKERS = int(os.getenv("EMBED_POOL_WORKERS", 4))
+EXECUTOR_QUEUE_DEPTH = int(os.getenv("EXECUTOR_QUEUE_DEPTH", 32))
+PARSE_POOL_PRELOAD = ["pdf_extract", "document_loaders"]
+
+class BlockingExecutor:
+    """Bounded pool for awaiting blocking calls without stalling the event loop"""
+
+    def __init__(self, name, kind, max_workers, queue_depth, preload=()):
+        self.name = name
+        self.kind = kind
+        self.preload = list(preload)  # modules a forkserver imports once for every worker
+        self.max_workers = max(1, max_workers)
+        self.queue_depth = queue_depth
+        self._executor = None
+        # Running + queued calls; callers beyond this wait for a free slot
+        self._slots = asyncio.Semaphore(self.max_workers + queue_depth)
+        self._in_flight = 0
+        self._completed = 0
+
+    def start(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # Never fork this (multithreaded) process directly, including when a broken pool is replaced
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(self.preload)
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name
+                )
+            logger.info(f"⚙️ Started {self.name} executor ({self.kind}, workers={self.max_workers}, queue_depth={self.queue_depth})")
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info(f"🛑 Stopped {self.name} executor")
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the pool and await its result"""
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.start(), functools.partial(fn, *args, **kwargs))
+            except BrokenProcessPool:
+                # A worker died (e.g. native OCR crash); replace the pool for the next caller
+                logger.error(f"❌ {self.name} executor broke, restarting pool")
+                self.shutdown()
+                raise
+            finally:
+                self._in_flight -= 1
+                self._completed += 1
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "completed": self._completed
+        }
+
+if PARSE_POOL_WORKERS > 0:
+    parse_executor = BlockingExecutor("parse", "process", PARSE_POOL_WORKERS, EXECUTOR_QUEUE_DEPTH,
+                                      preload=PARSE_POOL_PRELOAD)
+else:
+    parse_executor = BlockingExecutor("parse", "thread", 1, EXECUTOR_QUEUE_DEPTH)
+embed_executor = BlockingExecutor("embed", "thread", EMBED_POOL_WORKERS, EXECUTOR_QUEUE_DEPTH)
+
+async def run_parse(fn, *args, **kwargs):
+    """Await a document parsing/OCR call in the parse pool"""
+    return await parse_executor.run(fn, *args, **kwargs)
+
+async def run_embed(fn, *args, **kwargs):
+    """Await an embedding/FAISS call in the embed pool"""
+    return await embed_executor.run(fn, *args, **kwargs)
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        swept = faiss_store.sweep_staging_directories(CACHE_DIR, CACHE_SWEEP_MIN_AGE_SECONDS)
+        if swept:
+            logger.info(f"🧹 Removed {swept} stale cache staging directories")
+    except Exception as e:
+        logger.warning(f"⚠️ Cache staging sweep failed: {e}")
+    try:
+        swept = faiss_store.sweep_ingestion_checkpoints(CACHE_DIR, CACHE_CHECKPOINT_MAX_AGE_SECONDS,
+                                                        lock_idle_cache_entry)
+        if swept:
+            logger.info(f"🧹 Removed {swept} abandoned ingestion checkpoints")
+    except Exception as e:
+        logger.warning(f"⚠️ Ingestion checkpoint sweep failed: {e}")
+    try:
+        swept = sweep_markdown_cache()
+        if swept:
+            logger.info(f"🧹 Removed {swept} URL-keyed markdown cache entries")
+    except Exception as e:
+        logger.warning(f"⚠️ Markdown cache sweep failed: {e}")
+    parse_executor.start()
+    embed_executor.start()
+    answer_cache_executor.start()
+    nvidia_clients.open(NVIDIA_KEYS)
+    if parse_executor.kind == "process":
+        # Start parse workers up front so the first document doesn't wait for them
+        await asyncio.gather(*[run_parse(os.getpid) for _ in range(parse_executor.max_workers)])
+    try:
+        yield
+    finally:
+        # Unfinished ingestion jobs are dropped; their documents can be resubmitted
+        for job in list(ingestion_jobs.values()):
+            if job.task and not job.task.done():
+                job.task.cancel()
+        query_embedding_cache.save()
+        await nvidia_clients.aclose()
+        await close_document_client()
+        parse_executor.shutdown()
+        embed_executor.shutdown()
+        answer_cache_executor.shutdown()
 
 # === FastAPI App ===
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # === Logger Setup ===
 logging.basicConfig(level=logging.INFO)
@@ -1239,10 +716,147 @@ logger = logging.getLogger(__name__)
 device = "cuda" if torch.cuda.is_available() else "cpu"
 logger.info(f"📦 Embedding model will run on: {device}")
 
-embedding_model = HuggingFaceEmbeddings(
-    model_name="BAAI/bge-large-en-v1.5",
-    model_kwargs={"device": device}
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", embedding_backends.DEFAULT_MODEL)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", embedding_backends.DEFAULT_BACKEND).lower()
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "avx512_vnni")
+EMBEDDING_EXPORT_DIR = os.getenv("EMBEDDING_EXPORT_DIR", "embedding_models")
+# Tags the vectors in cache keys and the query memo: other backends' vectors are not interchangeable
+EMBEDDING_TAG = embedding_backends.backend_tag(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+EMBEDDING_MODEL_NAME = embedding_backends.MODELS[EMBEDDING_MODEL]
+# bge is trained for cosine similarity: unit vectors, searched by inner product ("l2" keeps Euclidean indexes)
+INDEX_METRIC = os.getenv("INDEX_METRIC", "ip").lower()
+VECTOR_DISTANCE_STRATEGY = (DistanceStrategy.MAX_INNER_PRODUCT if INDEX_METRIC == "ip"
+                            else DistanceStrategy.EUCLIDEAN_DISTANCE)
+
+base_embedding_model = embedding_backends.load_embeddings(
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, device,
+    export_dir=EMBEDDING_EXPORT_DIR, quantization_config=EMBEDDING_ONNX_QUANTIZATION
 )
+logger.info(f"📦 Embedding backend: {EMBEDDING_TAG}")
+embedding_device = device if EMBEDDING_BACKEND == "torch" else "cpu"
+
+# === Bulk Embedding (ingestion) ===
+# torch intra-op threads for CPU embedding; 0 keeps torch's default of one per physical core
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+# Padded tokens per ingestion batch; 0 picks a per-device default
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 0))
+if EMBEDDING_THREADS > 0:
+    torch.set_num_threads(EMBEDDING_THREADS)
+bulk_embedder = embedding_backends.BulkEmbedder(base_embedding_model, embedding_device, EMBEDDING_BATCH_TOKENS)
+
+# === Query Embedding Memo ===
+# Keyword probes ('table of benefits', 'grace period', ...) and resent test questions
+# recur across requests and documents; their vectors only depend on text and model.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "query_embeddings.npz"))
+QUERY_EMBEDDING_CACHE_PERSIST = os.getenv("QUERY_EMBEDDING_CACHE_PERSIST", "1") == "1"
+
+def normalize_query_text(text):
+    return " ".join(text.split())
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query vectors keyed by model id and normalized query text"""
+
+    def __init__(self, max_entries, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()  # (model_id, text) -> np.ndarray
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def get(self, model_id, text):
+        key = (model_id, normalize_query_text(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_id, text, vector):
+        key = (model_id, normalize_query_text(text))
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with np.load(self.path, allow_pickle=False) as data:
+                    for model_id, text, vector in zip(data["model_ids"], data["texts"], data["vectors"]):
+                        self._entries[(str(model_id), str(text))] = vector
+                logger.info(f"📋 Loaded {len(self._entries)} memoized query embeddings")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to load query embedding cache: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self._lock:
+                entries = list(self._entries.items())
+            if not entries:
+                return
+            tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                model_ids=np.array([model_id for (model_id, _), _ in entries]),
+                texts=np.array([text for (_, text), _ in entries]),
+                vectors=np.stack([vector for _, vector in entries])
+            )
+            os.replace(tmp_path, self.path)
+            logger.info(f"💾 Saved {len(entries)} memoized query embeddings")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to save query embedding cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+class MemoizedEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes query vectors; document embedding passes straight through"""
+
+    def __init__(self, base, cache, model_id):
+        self.base = base
+        self.cache = cache
+        self.model_id = model_id
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        """Embed queries, running only the cache misses through the model in one batch"""
+        vectors = [self.cache.get(self.model_id, text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.base.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                self.cache.put(self.model_id, texts[i], vector)
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        return [vector.tolist() for vector in vectors]
+
+query_embedding_cache = QueryEmbeddingCache(
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_PATH if QUERY_EMBEDDING_CACHE_PERSIST else None
+)
+embedding_model = MemoizedEmbeddings(base_embedding_model, query_embedding_cache, EMBEDDING_TAG)
 
 # === Enhanced Document Type Detection ===
 def detect_document_type(context_sample, file_type=None):
@@ -1304,165 +918,103 @@ def detect_document_type(context_sample, file_type=None):
 # get_adaptive_retrieval_params, enhanced_hybrid_retrieval, get_enhanced_prompt_template,
 # enhanced_clean_and_trim_answer, enhanced_nvidia_llm_call, EnhancedContextManager]
 
-# === Enhanced Question Classification ===
-def classify_question(question, document_type):
-    """Enhanced question classification with table detection"""
-    question_lower = question.lower()
-    
-    if document_type == "policy":
-        if any(word in question_lower for word in ['sub-limit', 'room rent', 'icu charges', 'plan a', 'plan b', 'table', 'charges per day']):
-            return "policy_table"
-        elif any(word in question_lower for word in ['is', 'does', 'can', 'will', 'are', 'has', 'covered']):
-            return "policy_yes_no"
-        elif any(word in question_lower for word in ['list', 'documents', 'what are', 'give me']):
-            return "policy_list"
-        elif any(word in question_lower for word in ['when', 'how long', 'period', 'time']):
-            return "policy_time"
-        else:
-            return "policy_general"
-    
-    elif document_type == "academic":
-        if any(word in question_lower for word in ['how does', 'explain', 'demonstrate', 'derive', 'why']):
-            return "academic_explanation"
-        elif any(word in question_lower for word in ['what is', 'define', 'who was', 'what are']):
-            return "academic_definition"
-        elif 'three laws' in question_lower or 'laws of motion' in question_lower:
-            return "academic_laws"
-        else:
-            return "academic_general"
-    
-    elif document_type == "legal":
-        if any(word in question_lower for word in ['article', 'which article', 'under which']):
-            return "legal_article"
-        elif any(word in question_lower for word in ['is', 'can', 'legal', 'allowed']):
-            return "legal_yes_no"
-        else:
-            return "legal_general"
-    
-    elif document_type in ["presentation", "spreadsheet", "image", "document"]:
-        if any(word in question_lower for word in ['what is', 'what are', 'list', 'show']):
-            return f"{document_type}_info"
-        elif any(word in question_lower for word in ['how', 'why', 'explain']):
-            return f"{document_type}_explanation"
-        else:
-            return f"{document_type}_general"
-    
-    else:
-        return "general_inquiry"
-
-# === Question Preprocessing ===
-def preprocess_question(question):
-    """Expand abbreviations and add context"""
-    expansions = {
-        "IVF": "In Vitro Fertilization (IVF)",
-        "OPD": "Outpatient Department (OPD)",
-        "ICU": "Intensive Care Unit (ICU)",
-        "Rs": "Rupees",
-        "C-section": "Caesarean section",
-        "AYUSH": "Ayurveda, Yoga, Unani, Siddha, and Homeopathy (AYUSH)",
-        "ECG": "Electrocardiogram (ECG)",
-        "IONM": "Intra Operative Neuro Monitoring (IONM)",
-        "PED": "Pre-Existing Disease (PED)",
-        "NCD": "No Claim Discount (NCD)",
-        "TPA": "Third Party Administrator (TPA)"
-    }
-    
-    processed_question = question
-    for abbr, full in expansions.items():
-        if abbr in processed_question and full not in processed_question:
-            processed_question = processed_question.replace(abbr, full)
-    
-    return processed_question
-
-# === Enhanced Retrieval Parameters ===
-def get_adaptive_retrieval_params(question_type, document_type):
-    """Get enhanced retrieval parameters with special handling for different file types - increased by 30%"""
-    
-    if document_type == "policy":
-        if question_type == "policy_table":
-            params = {"k": 26, "lambda_mult": 0.9}
-        elif question_type == "policy_list":
-            params = {"k": 24, "lambda_mult": 0.8}
-        elif question_type in ["policy_yes_no", "policy_time"]:
-            params = {"k": 20, "lambda_mult": 0.6}
-        else:
-            params = {"k": 21, "lambda_mult": 0.7}
-    
-    elif document_type == "academic":
-        if question_type == "academic_explanation":
-            params = {"k": 40, "lambda_mult": 0.8}
-        elif question_type == "academic_laws":
-            params = {"k": 33, "lambda_mult": 0.7}
-        elif question_type == "academic_definition":
-            params = {"k": 24, "lambda_mult": 0.6}
-        else:
-            params = {"k": 26, "lambda_mult": 0.7}
-    
-    elif document_type == "legal":
-        if question_type == "legal_article":
-            params = {"k": 24, "lambda_mult": 0.7}
-        else:
-            params = {"k": 20, "lambda_mult": 0.6}
+# === Batched Query Embedding ===
+# Question classification and query planning live in query_planning.py
+def precompute_query_neighbors(vectorstore, query_ks):
+    """Embed all queries in one padded batch and run one FAISS search on the stacked matrix"""
+    queries = [query for query, k in query_ks.items() if k > 0]
+    if not queries:
+        return PrecomputedQueries({}, {})
     
-    elif document_type in ["presentation", "spreadsheet"]:
-        params = {"k": 16, "lambda_mult": 0.8}
-    
-    elif document_type == "image":
-        params = {"k": 11, "lambda_mult": 0.9}
-    
-    elif document_type == "document":
-        params = {"k": 21, "lambda_mult": 0.7}
+    vectors = embedding_model.embed_queries(queries)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(matrix)
+    scores, ids = vectorstore.index.search(matrix, max(query_ks[query] for query in queries))
     
-    else:
-        params = {"k": 20, "lambda_mult": 0.6}
-    
-    return params
+    neighbors = {}
+    top_scores = {}
+    for query, row, row_scores in zip(queries, ids, scores):
+        if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT and row[0] != -1:
+            top_scores[query] = float(row_scores[0])
+        docs = []
+        for idx in row[:query_ks[query]]:
+            if idx == -1:
+                continue
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[idx])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        neighbors[query] = (query_ks[query], docs)
+    return PrecomputedQueries(dict(zip(queries, vectors)), neighbors, top_scores)
+
+def question_relevance_score(vectorstore, question, precomputed=None):
+    """Cosine similarity of the chunk nearest to the question, or None for Euclidean indexes"""
+    if vectorstore.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT:
+        return None
+    if precomputed and precomputed.top_score(question) is not None:
+        return precomputed.top_score(question)
+    question_vector = np.asarray([embedding_model.embed_query(question)], dtype=np.float32)
+    scores, ids = vectorstore.index.search(question_vector, 1)
+    return float(scores[0][0]) if ids[0][0] != -1 else None
 
 # === Enhanced Hybrid Retrieval ===
-def enhanced_hybrid_retrieval(question, vectorstore, retrieval_params, request_id, question_type):
-    """Enhanced hybrid retrieval with file-type specific search"""
+# === Table Retrieval ===
+# Table chunks repeat their header, so a few of them answer a policy_table question
+# that otherwise needs ~26 flattened-text chunks plus keyword probes.
+TABLE_QUESTION_K = int(os.getenv("TABLE_QUESTION_K", 6))
+TABLE_SEARCH_FETCH_K = 200  # candidates scanned for table chunks before filtering
+
+def table_chunk_search(question, vectorstore, k, precomputed=None):
+    """Best-matching table chunks; empty for documents ingested without table extraction"""
+    table_filter = {"content_type": "table"}
+    question_vector = precomputed.vector(question) if precomputed else None
+    if question_vector is not None:
+        return vectorstore.similarity_search_by_vector(question_vector, k=k, filter=table_filter,
+                                                       fetch_k=TABLE_SEARCH_FETCH_K)
+    return vectorstore.similarity_search(question, k=k, filter=table_filter, fetch_k=TABLE_SEARCH_FETCH_K)
+
+def enhanced_hybrid_retrieval(question, vectorstore, retrieval_params, request_id, question_type, precomputed=None):
+    """Enhanced hybrid retrieval with file-type specific search.
+
+    When precomputed holds the request's batched query vectors and neighbours, no query is embedded here.
+    """
     try:
         k = retrieval_params["k"]
         lambda_mult = retrieval_params["lambda_mult"]
         
+        def search(query, search_k):
+            docs = precomputed.similar(query, search_k) if precomputed else None
+            return docs if docs is not None else vectorstore.similarity_search(query, k=search_k)
+        
+        if question_type == "policy_table" and TABLE_QUESTION_K > 0:
+            table_docs = table_chunk_search(question, vectorstore, TABLE_QUESTION_K, precomputed)
+            if table_docs:
+                # A few text chunks keep the clauses around the table (conditions, footnotes)
+                text_docs = search(question, max(2, TABLE_QUESTION_K // 2))
+                unique_docs = list({doc.page_content: doc for doc in table_docs + text_docs}.values())
+                logger.info(f"[{request_id}] Retrieved {len(table_docs)} table chunks + "
+                            f"{len(unique_docs) - len(table_docs)} text chunks for table question")
+                return unique_docs
+        
         # Strategy 1: Direct similarity search
-        similarity_docs = vectorstore.similarity_search(question, k=k//3)
+        similarity_docs = search(question, k//3)
         
         # Strategy 2: MMR for diversity
-        mmr_docs = vectorstore.max_marginal_relevance_search(
-            question, k=k//3, lambda_mult=lambda_mult
-        )
+        question_vector = precomputed.vector(question) if precomputed else None
+        if question_vector is not None:
+            mmr_docs = vectorstore.max_marginal_relevance_search_by_vector(
+                question_vector, k=k//3, lambda_mult=lambda_mult
+            )
+        else:
+            mmr_docs = vectorstore.max_marginal_relevance_search(
+                question, k=k//3, lambda_mult=lambda_mult
+            )
         
         # Strategy 3: Enhanced keyword-based search
-        keywords = []
-        question_lower = question.lower()
-        
-        # File-type specific keywords
-        if question_type.startswith("presentation"):
-            keywords.extend(['slide', 'presentation', 'title', 'bullet', 'overview'])
-        elif question_type.startswith("spreadsheet"):
-            keywords.extend(['table', 'data', 'column', 'row', 'chart', 'value'])
-        elif question_type.startswith("image"):
-            keywords.extend(['image', 'picture', 'visual', 'diagram', 'figure'])
-        elif question_type == "policy_table" or any(word in question_lower for word in ['sub-limit', 'room rent', 'icu charges', 'plan a']):
-            keywords.extend(['table of benefits', 'plan a', 'plan b', 'room charges', 'icu charges', 'per day per insured person', 'up to', '% of si'])
-        elif 'grace period' in question_lower:
-            keywords.extend(['grace period', 'premium payment', 'thirty days'])
-        elif 'waiting period' in question_lower:
-            keywords.extend(['waiting period', 'continuous coverage', 'months'])
-        elif 'three laws' in question_lower:
-            keywords.extend(['law i', 'law ii', 'law iii', 'first law', 'second law', 'third law', 'laws of motion'])
-        elif 'newton' in question_lower:
-            keywords.extend(['newton', 'principia', 'proposition', 'theorem'])
-        
-        # Use extracted keywords or fall back to question words
-        if not keywords:
-            keywords = [word for word in question.split() if len(word) > 3][:4]
-        
         keyword_docs = []
-        for keyword in keywords[:3]:
+        for keyword in get_retrieval_keywords(question, question_type):
             try:
-                docs = vectorstore.similarity_search(keyword, k=k//6)
+                docs = search(keyword, k//6)
                 keyword_docs.extend(docs)
             except:
                 continue
@@ -1647,8 +1199,16 @@ Answer:"""
         )
 
 # === Context Relevance Check ===
-def check_context_relevance(context, question):
-    """Check if the context contains meaningful information related to the question"""
+# Minimum cosine similarity between the question and its best chunk for the context to count as relevant
+# (inner-product indexes only). Opt-in: when set it replaces the text heuristics, and a useful cutoff
+# depends on the embedding model, so the default 0 keeps the heuristics.
+RELEVANCE_SCORE_THRESHOLD = float(os.getenv("RELEVANCE_SCORE_THRESHOLD", 0))
+
+def check_context_relevance(context, question, relevance_score=None):
+    """Check if the context contains meaningful information related to the question.
+
+    relevance_score is the cosine similarity of the best retrieved chunk, when the index provides one.
+    """
     if not context or not isinstance(context, str) or len(context.strip()) < 50:
         return False
     
@@ -1677,6 +1237,9 @@ def check_context_relevance(context, question):
         if pattern in context_lower:
             return False
     
+    if relevance_score is not None and RELEVANCE_SCORE_THRESHOLD > 0:
+        return relevance_score >= RELEVANCE_SCORE_THRESHOLD
+    
     # Check if context has substance beyond generic descriptions
     meaningful_content_indicators = [
         # Look for actual data, numbers, specific information
@@ -1734,16 +1297,28 @@ def enhanced_clean_and_trim_answer(text, question_type, document_type, question=
     return result
 
 # === Enhanced NVIDIA LLM Call ===
-async def enhanced_nvidia_llm_call(context, question, question_type, document_type, api_key, max_retries=2):
-    """Enhanced LLM call with file-type specific parameters and fallback to knowledge-based answers"""
-    url = "https://integrate.api.nvidia.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "application/json"
-    }
+LLM_MODEL = "meta/llama-4-maverick-17b-128e-instruct"
+LLM_SAMPLING_PARAMS = {"top_p": 0.9, "frequency_penalty": 0.1, "presence_penalty": 0.1}
+# Bump whenever prompt templates or the max_tokens/temperature table change; it is part of the answer cache key
+PROMPT_TEMPLATE_VERSION = "v2.2"
+
+class LLMRequestRejected(Exception):
+    """The API refused the payload itself (4xx other than 429); not retried"""
+
+async def enhanced_nvidia_llm_call(context, question, question_type, document_type, api_key=None, max_retries=2, on_token=None,
+                                   relevance_score=None, on_reset=None):
+    """Enhanced LLM call with file-type specific parameters and fallback to knowledge-based answers.
+
+    Each attempt is dispatched to the least-loaded key by key_scheduler unless an explicit api_key is given.
+    With on_token, the completion is requested with stream=true and every content delta is awaited
+    through on_token as it arrives; the full answer is still returned at the end. on_reset is awaited
+    before each retry, since the retried attempt streams its answer again from the start.
+    relevance_score (cosine of the best chunk) decides between the context and knowledge prompts when given.
+    """
+    url = NVIDIA_API_URL
     
     # Check if context has meaningful information
-    meaningful_context = check_context_relevance(context, question)
+    meaningful_context = check_context_relevance(context, question, relevance_score)
     
     if meaningful_context:
         # Use context-based prompt
@@ -1794,49 +1369,106 @@ async def enhanced_nvidia_llm_call(context, question, question_type, document_ty
         temperature = 0.2
     
     payload = {
-        "model": "meta/llama-4-maverick-17b-128e-instruct",
+        "model": LLM_MODEL,
         "messages": messages,
         "max_tokens": max_tokens,
         "temperature": temperature,
-        "top_p": 0.9,
-        "frequency_penalty": 0.1,
-        "presence_penalty": 0.1,
-        "stream": False
+        **LLM_SAMPLING_PARAMS,
+        "stream": on_token is not None
     }
+    if on_token:
+        payload["stream_options"] = {"include_usage": True}
     
-    async with httpx.AsyncClient(timeout=40) as client:
-        for attempt in range(max_retries + 1):
-            try:
-                response = await client.post(url, headers=headers, json=payload)
-                if response.status_code == 200:
-                    content = response.json()['choices'][0]['message']['content']
-                    # Handle all possible content types from NVIDIA API
-                    if isinstance(content, str):
-                        raw_answer = content
-                    elif isinstance(content, (dict, list)):
-                        raw_answer = str(content)
-                    else:
-                        raw_answer = str(content) if content is not None else ""
-                    
-                    # Ensure we have a string before processing
-                    if isinstance(raw_answer, str):
-                        cleaned_answer = raw_answer.replace('\\n', ' ').replace('\n', ' ')
-                        cleaned_answer = re.sub(r'\s+', ' ', cleaned_answer).strip()
-                        return cleaned_answer
-                    else:
-                        return str(raw_answer) if raw_answer else "No response received"
+    # Rough token estimate (~4 chars/token) for the per-key budget
+    estimated_tokens = (len(system_message) + len(prompt_text)) // 4 + max_tokens
+    
+    for attempt in range(max_retries + 1):
+        if attempt and on_reset:
+            await on_reset()
+        try:
+            if api_key:
+                key = None
+                response = await _post_chat_completion(url, api_key, payload, on_token)
+            else:
+                async with key_scheduler.acquire(estimated_tokens) as key:
+                    try:
+                        response = await _post_chat_completion(url, key.value, payload, on_token)
+                    except httpx.TransportError:
+                        key_scheduler.record_failure(key)
+                        raise
+            if response.status_code == 200:
+                if key:
+                    key_scheduler.record_success(key, estimated_tokens, response.json().get('usage', {}).get('total_tokens'))
+                content = response.json()['choices'][0]['message']['content']
+                # Handle all possible content types from NVIDIA API
+                if isinstance(content, str):
+                    raw_answer = content
+                elif isinstance(content, (dict, list)):
+                    raw_answer = str(content)
                 else:
-                    logger.warning(f"API error attempt {attempt + 1}: {response.status_code}")
-                    if attempt < max_retries:
-                        await asyncio.sleep(2)
-                        continue
-                    raise Exception(f"NVIDIA API error: {response.text}")
-            except Exception as e:
+                    raw_answer = str(content) if content is not None else ""
+                
+                # Ensure we have a string before processing
+                if isinstance(raw_answer, str):
+                    cleaned_answer = raw_answer.replace('\\n', ' ').replace('\n', ' ')
+                    cleaned_answer = re.sub(r'\s+', ' ', cleaned_answer).strip()
+                    return cleaned_answer
+                else:
+                    return str(raw_answer) if raw_answer else "No response received"
+            else:
+                logger.warning(f"API error attempt {attempt + 1}: {response.status_code}{f' on {key.label}' if key else ''}")
+                if key:
+                    key_scheduler.record_error_status(key, response.status_code, response.headers.get('Retry-After'))
+                if is_request_rejected(response.status_code):
+                    raise LLMRequestRejected(f"NVIDIA API rejected the request ({response.status_code}): {response.text}")
+                if key and response.status_code == 429 and attempt < max_retries:
+                    # Throttled key: retry straight away on another one
+                    continue
                 if attempt < max_retries:
-                    logger.warning(f"Request failed attempt {attempt + 1}: {e}")
                     await asyncio.sleep(2)
                     continue
-                raise Exception(f"Request failed: {e}")
+                raise Exception(f"NVIDIA API error: {response.text}")
+        except LLMRequestRejected:
+            raise
+        except Exception as e:
+            if attempt < max_retries:
+                logger.warning(f"Request failed attempt {attempt + 1}: {e}")
+                await asyncio.sleep(2)
+                continue
+            raise Exception(f"Request failed: {e}")
+
+async def _post_chat_completion(url, api_key, payload, on_token=None):
+    """POST a chat-completions payload through the pooled client for api_key"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "text/event-stream" if on_token else "application/json"
+    }
+    client = nvidia_clients.get(api_key)
+    if not on_token:
+        return await client.post(url, headers=headers, json=payload)
+    
+    async with client.stream("POST", url, headers=headers, json=payload) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response
+        parts = []
+        usage = {}
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices", []):
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    await on_token(delta)
+    # Reassemble a non-streaming body so callers handle both modes alike
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}],
+                                     "usage": usage})
 
 # === Context Management ===
 class EnhancedContextManager:
@@ -1870,10 +1502,48 @@ class EnhancedContextManager:
             
             return "\n".join(related_context) if related_context else ""
 
+# === Answer Cache ===
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answer_cache.sqlite3"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 20000))
+# Cosine similarity above which a differently phrased question of the same type reuses a cached
+# answer. Off by default: near-identical phrasings can still ask for different facts.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0))
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES,
+                           SEMANTIC_CACHE_THRESHOLD,
+                           {"prompt_version": PROMPT_TEMPLATE_VERSION, "model": LLM_MODEL,
+                            "sampling": LLM_SAMPLING_PARAMS}) if ANSWER_CACHE_ENABLED else None
+# SQLite calls run on one dedicated thread, off the event loop and never queued behind embedding work
+answer_cache_executor = BlockingExecutor("answer_cache", "thread", 1, EXECUTOR_QUEUE_DEPTH)
+
+async def run_answer_cache(fn, *args, **kwargs):
+    """Await an answer cache call on its dedicated thread"""
+    return await answer_cache_executor.run(fn, *args, **kwargs)
+
+def get_answer_cache_key(file_hash, question, document_type):
+    processed_q = preprocess_question(question)
+    question_type = classify_question(processed_q, document_type)
+    return answer_cache.make_key(file_hash, processed_q, question_type, document_type)
+
+def lookup_cached_answers(file_hash, questions, document_type):
+    """Exact-match cached answers for a request's questions, None where there is none"""
+    return [answer_cache.get(get_answer_cache_key(file_hash, q, document_type)) for q in questions]
+
+def find_similar_answers(file_hash, document_type, processed_questions, question_vectors):
+    """Semantic-match cached answers for preprocessed questions, None where there is none"""
+    return [answer_cache.find_similar(file_hash, document_type, classify_question(processed_q, document_type),
+                                      question_vector)
+            for processed_q, question_vector in zip(processed_questions, question_vectors)]
+
 # === Input Schema ===
 class HackRxInput(BaseModel):
-    documents: str
+    documents: str  # document URL, or the id returned by POST /documents
     questions: List[str]
+    stream: bool = False  # /hackrx/stream only: also emit LLM tokens as they arrive
+
+class DocumentInput(BaseModel):
+    url: str
 
 # === Health Check Endpoint ===
 @app.get("/health")
@@ -1882,8 +1552,15 @@ def health_check():
     return {
         "status": "healthy",
         "message": "RAG server is running",
-        "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
-        "device": device
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "device": embedding_device,
+        "executors": {
+            "parse": parse_executor.stats(),
+            "embed": embed_executor.stats(),
+            "answer_cache": answer_cache_executor.stats()
+        },
+        "nvidia_keys": key_scheduler.stats()
     }
 
 # === Cache Management Endpoints ===
@@ -1892,13 +1569,20 @@ def get_cache_stats():
     """Get cache statistics"""
     try:
         cache_files = [f for f in os.listdir(CACHE_DIR) if f.endswith('.faiss')]
-        total_size = sum(os.path.getsize(os.path.join(CACHE_DIR, f)) for f in cache_files)
+        # Cache entries are directories (index, chunk store, optional re-rank vectors)
+        total_size = sum(os.path.getsize(os.path.join(root, name))
+                         for f in cache_files for root, _, names in os.walk(os.path.join(CACHE_DIR, f))
+                         for name in names)
         
         return {
             "cache_directory": CACHE_DIR,
             "total_cached_files": len(cache_files),
             "total_cache_size_mb": round(total_size / (1024 * 1024), 2),
-            "cache_files": cache_files[:10]  # Show first 10 files
+            "cache_files": cache_files[:10],  # Show first 10 files
+            "index_quantization": INDEX_QUANTIZATION,
+            "memory_cache": vectorstore_cache.stats(),
+            "query_embedding_cache": query_embedding_cache.stats(),
+            "answer_cache": answer_cache.stats() if answer_cache else None
         }
     except Exception as e:
         return {"error": f"Failed to get cache stats: {str(e)}"}
@@ -1907,14 +1591,20 @@ def get_cache_stats():
 def clear_cache():
     """Clear all cache files"""
     try:
-        cache_files = [f for f in os.listdir(CACHE_DIR) if f.endswith('.faiss')]
+        # Lock files stay behind after ingestion: unlinking one while a worker waits on it
+        # would let the next arrival lock a fresh inode, so they are only removed here
+        cache_files = [f for f in os.listdir(CACHE_DIR) if f.endswith(('.faiss', '.faiss.partial', '.faiss.lock'))]
         removed_count = 0
+        vectorstore_cache.clear()
+        if answer_cache:
+            answer_cache.clear()
+        
+        cache_files += [os.path.join("markdown", f) for f in os.listdir(MARKDOWN_CACHE_DIR) if f.endswith('.md')]
         
         for file in cache_files:
             try:
                 file_path = os.path.join(CACHE_DIR, file)
                 if os.path.isdir(file_path):
-                    import shutil
                     shutil.rmtree(file_path)
                 else:
                     os.remove(file_path)
@@ -1929,8 +1619,690 @@ def clear_cache():
     except Exception as e:
         return {"error": f"Failed to clear cache: {str(e)}"}
 
+# === Document Ingestion ===
+# Pages per parse task when a PDF's pages are streamed from the parse pool
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+# Emit PDF tables as header-repeating row chunks (content_type "table") instead of flattened page text.
+# Opt-in: find_tables is costly, and entries ingested with it differ from those ingested without
+PDF_TABLES = os.getenv("PDF_TABLES", "0") == "1"
+# Embedded batches between checkpoints of an ingestion; 0 disables checkpointing
+INGESTION_CHECKPOINT_BATCHES = int(os.getenv("INGESTION_CHECKPOINT_BATCHES", 8))
+
+def _no_progress(stage, **details):
+    pass
+
+async def count_pdf_pages(file_path, request_id):
+    """Page count of a PDF, or None when PyMuPDF can't open it and the regular loader should try"""
+    try:
+        return await run_parse(pdf_extract.count_pages, file_path)
+    except Exception as e:
+        logger.warning(f"[{request_id}] ⚠ Page-parallel PDF extraction unavailable, falling back to PyMuPDFLoader: {e}")
+        return None
+
+# === Ingestion Pipeline ===
+# Pages flow from the parse pool into the splitter, chunks into the batching embedder and
+# vectors into the index, through bounded queues: the stages overlap, and a slow stage
+# holds back the ones before it instead of letting pages or chunks pile up in memory.
+PIPELINE_PAGE_QUEUE = int(os.getenv("PIPELINE_PAGE_QUEUE", 64))
+PIPELINE_CHUNK_QUEUE = int(os.getenv("PIPELINE_CHUNK_QUEUE", 512))
+PIPELINE_EMBED_WINDOW = int(os.getenv("PIPELINE_EMBED_WINDOW", 256))  # chunks length-bucketed together
+_END_OF_STREAM = object()
+
+class VectorstoreBuilder:
+    """Flat-index vectorstore built window by window as chunks arrive.
+
+    With a file_hash, embedded chunks are checkpointed every INGESTION_CHECKPOINT_BATCHES
+    batches, and chunks checkpointed by an earlier, interrupted attempt are not embedded again.
+    """
+
+    def __init__(self, request_id, file_hash=None):
+        self.request_id = request_id
+        self.vectorstore = None
+        self.chunks = 0
+        self.embedded = 0
+        self.embed_seconds = 0.0
+        self.checkpoint = None
+        if file_hash and INGESTION_CHECKPOINT_BATCHES > 0:
+            self.checkpoint = faiss_store.IngestionCheckpoint(get_checkpoint_path(file_hash), INGESTION_CHECKPOINT_BATCHES)
+            resumable = self.checkpoint.load()
+            if resumable:
+                logger.info(f"[{request_id}] ♻️ Resuming ingestion: {resumable} chunks already embedded")
+
+    def _add(self, chunks, vectors):
+        if self.vectorstore is None:
+            index = (faiss.IndexFlatIP(vectors.shape[1]) if VECTOR_DISTANCE_STRATEGY == DistanceStrategy.MAX_INNER_PRODUCT
+                     else faiss.IndexFlatL2(vectors.shape[1]))
+            self.vectorstore = FAISS(embedding_model, index, InMemoryDocstore(), {},
+                                     distance_strategy=VECTOR_DISTANCE_STRATEGY)
+        self.vectorstore.add_embeddings([(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)],
+                                        metadatas=[chunk.metadata for chunk in chunks])
+
+    def add_chunks(self, chunks):
+        """Embed a window of chunks in length-bucketed batches, adding each batch to the index as it finishes"""
+        positions = range(self.chunks, self.chunks + len(chunks))
+        self.chunks += len(chunks)
+        digests = [faiss_store.chunk_digest(chunk) for chunk in chunks]
+        missing = list(range(len(chunks)))
+        if self.checkpoint:
+            saved = [self.checkpoint.saved_vector(position, digest) for position, digest in zip(positions, digests)]
+            restored = [i for i, vector in enumerate(saved) if vector is not None]
+            if restored:
+                self._add([chunks[i] for i in restored], np.stack([saved[i] for i in restored]))
+            missing = [i for i, vector in enumerate(saved) if vector is None]
+        if not missing:
+            return
+        start = time.perf_counter()
+        for batch, vectors in bulk_embedder.embed_batches([chunks[i].page_content for i in missing]):
+            batch = [missing[i] for i in batch]
+            self._add([chunks[i] for i in batch], vectors)
+            if self.checkpoint:
+                self.checkpoint.add([positions[i] for i in batch], [digests[i] for i in batch], vectors)
+        self.embedded += len(missing)
+        self.embed_seconds += time.perf_counter() - start
+
+    def finish(self):
+        """Returns (vectorstore or None when no chunks arrived, chunks embedded per second)"""
+        chunks_per_second = self.embedded / self.embed_seconds if self.embed_seconds else 0.0
+        logger.info(f"[{self.request_id}] 🧠 Embedded {self.embedded} of {self.chunks} chunks in "
+                    f"{self.embed_seconds:.2f}s ({chunks_per_second:.1f} chunks/sec)")
+        return self.vectorstore, chunks_per_second
+
+async def produce_pdf_pages(file_path, page_count, page_queue):
+    """Parse PDF page ranges on the parse pool, one per worker at a time, queueing pages in page order"""
+    in_flight = deque()
+    try:
+        for first in range(0, page_count, PDF_PAGES_PER_TASK):
+            stop = min(first + PDF_PAGES_PER_TASK, page_count)
+            in_flight.append(asyncio.ensure_future(run_parse(pdf_extract.extract_pages, file_path, first, stop, PDF_TABLES)))
+            if len(in_flight) >= parse_executor.max_workers:
+                for page in await in_flight.popleft():
+                    await page_queue.put(page)
+        while in_flight:
+            for page in await in_flight.popleft():
+                await page_queue.put(page)
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+async def produce_documents(documents, page_queue):
+    for document in documents:
+        await page_queue.put(document)
+
+async def split_pages(splitter, page_queue, chunk_queue):
+    """Split pages as they arrive, taking whatever has queued up in one call"""
+    while True:
+        pages = [await page_queue.get()]
+        while not page_queue.empty():
+            pages.append(page_queue.get_nowait())
+        finished = pages[-1] is _END_OF_STREAM
+        if finished:
+            pages.pop()
+        for chunk in await run_embed(splitter.split_documents, pages):
+            await chunk_queue.put(chunk)
+        if finished:
+            await chunk_queue.put(_END_OF_STREAM)
+            return
+
+async def embed_chunks(builder, chunk_queue):
+    """Hand chunks to the builder in windows of PIPELINE_EMBED_WINDOW, so batches stay full"""
+    while True:
+        window = []
+        finished = False
+        while len(window) < PIPELINE_EMBED_WINDOW:
+            chunk = await chunk_queue.get()
+            if chunk is _END_OF_STREAM:
+                finished = True
+                break
+            window.append(chunk)
+        if window:
+            await run_embed(builder.add_chunks, window)
+        if finished:
+            return
+
+async def run_ingestion_pipeline(produce_pages, splitter, file_hash, request_id):
+    """Stream pages from produce_pages(page_queue) through chunking and embedding.
+
+    Returns (vectorstore or None when there were no chunks, chunks embedded per second).
+    """
+    page_queue = asyncio.Queue(PIPELINE_PAGE_QUEUE)
+    chunk_queue = asyncio.Queue(PIPELINE_CHUNK_QUEUE)
+    builder = await run_embed(VectorstoreBuilder, request_id, file_hash)
+
+    async def produce():
+        await produce_pages(page_queue)
+        await page_queue.put(_END_OF_STREAM)
+
+    stages = [asyncio.ensure_future(stage) for stage in
+              (produce(), split_pages(splitter, page_queue, chunk_queue), embed_chunks(builder, chunk_queue))]
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        # One failed stage stops the others instead of leaving them blocked on a queue
+        for stage in stages:
+            stage.cancel()
+    return await run_embed(builder.finish)
+
+async def ingest_document(downloaded, file_type, file_extension, file_hash, document_url, request_id, progress=_no_progress):
+    """Load, chunk and embed a downloaded document, then save its vectorstore to cache.
+
+    Returns (vectorstore, None) on success or (None, error_response) on failure.
+    progress is called with each stage name (and counts where known) as ingestion advances.
+    """
+    # Step 6: Enhanced file processing with better error handling for different file types
+    progress("parsing")
+    documents = []
+    page_count = None  # set when a PDF's pages are streamed from the parse pool instead of loaded up front
+    processing_status = "unknown"
+    
+    try:
+        if file_type == 'archive':
+            documents = await run_parse(process_archive_file, downloaded.read_bytes(), file_extension)
+            if not documents:
+                processing_status = "archive_extraction_failed"
+                logger.warning(f"[{request_id}] ⚠ Archive extraction failed")
+                return None, {
+                    "error": f"❌ Archive file could not be extracted. The ZIP file may be corrupted, password-protected, or contain only binary files. Please extract the archive manually and upload individual documents.",
+                    "file_type": file_type,
+                    "processing_status": processing_status
+                }
+            else:
+                processing_status = "archive_processed"
+        else:
+            if file_type == 'pdf':
+                page_count = await count_pdf_pages(downloaded.path, request_id)
+            if page_count:
+                processing_status = "streaming_pages"
+            else:
+                documents = await run_parse(load_document_by_type, downloaded.path, file_type, document_url,
+                                            downloaded.content_hash)
+            if documents and any(doc.metadata.get('error') for doc in documents):
+                processing_status = "content_extraction_failed"
+            elif documents:
+                processing_status = "successfully_processed"
+            elif not page_count:
+                processing_status = "no_content_found"
+        
+        if not documents and not page_count:
+            logger.warning(f"[{request_id}] ⚠ No documents loaded for {file_type} file")
+            if file_type in ['image', 'presentation', 'spreadsheet']:
+                return None, {
+                    "error": f"❌ {file_type.title()} file could not be processed. This may be due to: 1) Corrupted file, 2) Unsupported format variant, 3) Missing required libraries. For images, ensure they contain readable text. For presentations/spreadsheets, try converting to PDF format.",
+                    "file_type": file_type,
+                    "processing_status": "unsupported_content"
+                }
+            else:
+                return None, {
+                    "error": f"❌ File could not be processed. The {file_type} file may be empty, corrupted, or in an unsupported format. Please verify the file and try again.",
+                    "file_type": file_type,
+                    "processing_status": "no_content_found"
+                }
+        
+        logger.info(f"[{request_id}] 📄 Loaded {page_count or len(documents)} documents, status: {processing_status}")
+        
+    except Exception as e:
+        logger.error(f"[{request_id}] ❌ Document loading failed: {e}")
+        processing_status = "processing_error"
+        if file_type in ['excel', 'spreadsheet']:
+            return None, {
+                "error": f"❌ Spreadsheet processing failed. This may be due to: 1) Complex formulas or macros, 2) Large file size, 3) Corrupted data. Try saving as CSV format or simplify the spreadsheet content.",
+                "file_type": file_type,
+                "processing_status": processing_status,
+                "technical_error": str(e)
+            }
+        elif file_type in ['powerpoint', 'presentation']:
+            return None, {
+                "error": f"❌ Presentation processing failed. The PowerPoint file may contain complex elements that cannot be extracted. Try exporting slides as images with text or converting to PDF format.",
+                "file_type": file_type,
+                "processing_status": processing_status,
+                "technical_error": str(e)
+            }
+        else:
+            return None, {
+                "error": f"❌ File processing failed due to technical error. The {file_type} file could not be loaded or parsed. Please check the file integrity and format.",
+                "file_type": file_type,
+                "processing_status": processing_status,
+                "technical_error": str(e)
+            }
+    
+    # Simplified filtering - only remove documents with critical errors
+    processable_docs = []
+    
+    for doc in documents:
+        # Only filter out documents with explicit processing errors
+        if doc.metadata.get('error') == 'complete_failure':
+            logger.warning(f"[{request_id}] Skipping document with complete failure")
+            continue
+        else:
+            processable_docs.append(doc)
+    
+    # If no documents at all, only then show error
+    if not processable_docs and not documents and not page_count:
+        logger.warning(f"[{request_id}] ⚠ No documents loaded from file")
+        return None, {
+            "error": f"❌ File could not be processed. No content was extracted from the {file_type} file.",
+            "file_type": file_type,
+            "processing_status": "no_content_extracted"
+        }
+    
+    # Use all available documents if processable_docs is empty but documents exist
+    if not processable_docs and documents:
+        logger.info(f"[{request_id}] Using all available documents despite quality issues")
+        processable_docs = documents
+    
+    if page_count:
+        num_docs = page_count
+        produce_pages = functools.partial(produce_pdf_pages, downloaded.path, page_count)
+    else:
+        num_docs = len(processable_docs)
+        produce_pages = functools.partial(produce_documents, processable_docs)
+    
+    # Step 7: Chunk documents
+    # Enhanced chunking based on file type with error handling - increased by 30%
+    try:
+        if file_type in ['presentation', 'image']:
+            chunk_size = 1300
+            chunk_overlap = 130
+        elif file_type in ['spreadsheet', 'csv']:
+            chunk_size = 1560
+            chunk_overlap = 195
+        elif file_type == 'text':
+            chunk_size = 1950
+            chunk_overlap = 260
+        else:  # pdf, word, etc.
+            if num_docs > 400:
+                chunk_size = 1820
+                chunk_overlap = 455
+            elif num_docs > 100:
+                chunk_size = 2080
+                chunk_overlap = 325
+            else:
+                chunk_size = 2340
+                chunk_overlap = 260
+        
+        logger.info(f"[{request_id}] 📊 Using chunking: chunk_size={chunk_size}, overlap={chunk_overlap}")
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, 
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", ". ", " ", ""],
+            keep_separator=True
+        )
+        
+        # Step 8: Chunk and embed as pages stream in
+        progress("chunking_and_embedding", documents=num_docs)
+        try:
+            vectorstore, chunks_per_second = await run_ingestion_pipeline(produce_pages, splitter, file_hash, request_id)
+            if vectorstore is None:
+                return None, {
+                    "error": f"❌ File could not be processed. No content was extracted from the {file_type} file.",
+                    "file_type": file_type,
+                    "processing_status": "no_content_extracted"
+                }
+            logger.info(f"[{request_id}] 🧠 FAISS vectorstore created with {vectorstore.index.ntotal} chunks.")
+            
+            # Step 9: Save to cache
+            progress("saving", chunks=vectorstore.index.ntotal, chunks_per_second=round(chunks_per_second, 1))
+            try:
+                if await run_embed(save_vectorstore_to_cache, vectorstore, file_hash):
+                    # Committed; a failed save keeps the checkpoint for the next attempt
+                    await run_embed(shutil.rmtree, get_checkpoint_path(file_hash), ignore_errors=True)
+            except Exception as e:
+                logger.warning(f"[{request_id}] ⚠ Failed to save to cache: {e}")
+                
+        except Exception as e:
+            logger.error(f"[{request_id}] ❌ Vectorstore creation failed: {e}")
+            return None, {"error": f"❌ Failed to create embeddings: {str(e)}"}
+            
+    except Exception as e:
+        logger.error(f"[{request_id}] ❌ Chunking failed: {e}")
+        return None, {"error": f"❌ Failed to process document chunks: {str(e)}"}
+    
+    return vectorstore, None
+
+# === Ingestion Single-Flight ===
+# Concurrent requests for the same cold document share one ingestion per process,
+# and a lock file next to the cache entry serialises ingestion across uvicorn workers.
+CACHE_LOCK_POLL_SECONDS = 0.5
+_ingestion_flights = {}
+
+class CacheEntryLock:
+    """Advisory cross-process lock on one cache entry, acquired without blocking the event loop"""
+
+    def __init__(self, file_hash):
+        self.path = f"{get_cache_path(file_hash)}.lock"
+        self._handle = None
+
+    def _try_lock(self):
+        try:
+            if fcntl:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    async def __aenter__(self):
+        self._handle = open(self.path, 'a+')
+        while not self._try_lock():
+            await asyncio.sleep(CACHE_LOCK_POLL_SECONDS)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def acquire_nowait(self):
+        """Take the lock only if no worker holds it; True when taken"""
+        self._handle = open(self.path, 'a+')
+        if self._try_lock():
+            return True
+        self._handle.close()
+        self._handle = None
+        return False
+
+    def release(self):
+        try:
+            if fcntl:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+            else:
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._handle.close()
+            self._handle = None
+
+def lock_idle_cache_entry(cache_path):
+    """Lock the entry at cache_path unless it is being ingested; returns the release callable or None"""
+    if not cache_path.endswith(".faiss"):
+        return None
+    lock = CacheEntryLock(os.path.basename(cache_path)[:-len(".faiss")])
+    return lock.release if lock.acquire_nowait() else None
+
+async def _locked_ingest(downloaded, file_type, file_extension, file_hash, document_url, request_id, progress):
+    progress("waiting_for_lock")
+    async with CacheEntryLock(file_hash):
+        # Another worker may have finished this document while we waited for the lock
+        vectorstore = await run_embed(load_vectorstore_from_cache, file_hash, embedding_model)
+        if vectorstore is not None:
+            logger.info(f"[{request_id}] 🤝 Document ingested by another worker, using its cache entry")
+            return vectorstore, None
+        return await ingest_document(downloaded, file_type, file_extension, file_hash, document_url, request_id, progress)
+
+def remove_temp_file(path, request_id):
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+            logger.info(f"[{request_id}] 🧹 Temporary file cleaned.")
+        except Exception as cleanup_error:
+            logger.warning(f"[{request_id}] ⚠ Cleanup failed: {cleanup_error}")
+
+def _finish_flight(file_hash, path, request_id):
+    _ingestion_flights.pop(file_hash, None)
+    remove_temp_file(path, request_id)
+
+async def ingest_document_once(downloaded, file_type, file_extension, file_hash, document_url, request_id, progress=_no_progress):
+    """ingest_document, deduplicated by cache key across concurrent requests and workers.
+
+    Takes ownership of downloaded.path: the flight deletes it when ingestion ends, even
+    if the caller that started it was cancelled while waiting.
+    """
+    flight = _ingestion_flights.get(file_hash)
+    if flight is None:
+        flight = asyncio.ensure_future(
+            _locked_ingest(downloaded, file_type, file_extension, file_hash, document_url, request_id, progress)
+        )
+        _ingestion_flights[file_hash] = flight
+        flight.add_done_callback(lambda _: _finish_flight(file_hash, downloaded.path, request_id))
+    else:
+        logger.info(f"[{request_id}] 🤝 Joining in-flight ingestion for {file_hash}")
+        progress("waiting_for_ingestion")
+        # The flight reads its own download; this copy is not needed
+        remove_temp_file(downloaded.path, request_id)
+    # Shielded so one client disconnecting doesn't cancel ingestion for the others
+    return await asyncio.shield(flight)
+
+# === Document Resolution ===
+class ResolvedDocument:
+    """A document turned into a vectorstore, or the reason it can't be answered from one"""
+
+    def __init__(self, vectorstore=None, file_hash=None, file_type=None, file_extension=None,
+                 knowledge_reason=None, error=None):
+        self.vectorstore = vectorstore
+        self.file_hash = file_hash
+        self.file_type = file_type
+        self.file_extension = file_extension
+        self.knowledge_reason = knowledge_reason  # set when questions must be answered from knowledge
+        self.error = error  # error response dict
+
+async def resolve_document(document_url, request_id, progress=_no_progress):
+    """Steps 0-9: load a document URL's vectorstore from cache, downloading and ingesting it on a miss"""
+    temp_file_path = None
+    
+    try:
+        # Step 0: Validate the cache without downloading the document body
+        progress("probing_cache")
+        try:
+            cached_entry, url_validators, head_headers = await probe_cached_document(document_url)
+            if cached_entry:
+                vectorstore = await run_embed(load_vectorstore_from_cache, cached_entry["cache_key"], embedding_model)
+                if vectorstore is not None:
+                    logger.info(f"[{request_id}] 🚀 Using cached embeddings - skipping file processing!")
+                    return ResolvedDocument(vectorstore, cached_entry["cache_key"], cached_entry["file_type"],
+                                            cached_entry["file_extension"])
+        except Exception as e:
+            logger.warning(f"[{request_id}] ⚠ Cache probe failed, downloading document: {e}")
+            url_validators = {}
+            head_headers = None
+        
+        # Step 1: Download file safely with binary check
+        progress("downloading")
+        try:
+            downloaded, content_type = await download_file_safely(document_url, max_size_mb=100, check_binary=True,
+                                                                  head_headers=head_headers)
+            
+            # If file is skipped (large binary), answer from knowledge
+            if downloaded is None:
+                return ResolvedDocument(knowledge_reason="Large Binary File")
+            
+            # The streamed temp file replaces the old Step 5 rewrite; cleaned up in finally
+            # unless ingestion takes it over
+            temp_file_path = downloaded.path
+                
+        except Exception as e:
+            logger.error(f"[{request_id}] ❌ File download failed: {e}")
+            return ResolvedDocument(error={"error": f"❌ File download failed: {str(e)}"})
+        
+        # Step 2: File type, sniffed from the first downloaded chunk
+        file_type, file_extension = downloaded.file_type, downloaded.file_extension
+        logger.info(f"[{request_id}] 📄 Detected file type: {file_type} ({file_extension})")
+        
+        # Handle binary and archive files by answering from knowledge
+        if file_type in ['binary', 'archive']:
+            return ResolvedDocument(file_type=file_type, file_extension=file_extension,
+                                    knowledge_reason=file_type.capitalize())
+        
+        # Step 3: Generate content-addressed cache key
+        try:
+            file_hash = get_file_hash(downloaded.content_hash)
+            logger.info(f"[{request_id}] 🔍 File hash: {file_hash}")
+        except Exception as e:
+            logger.error(f"[{request_id}] ❌ Hash generation failed: {e}")
+            # Generate simple hash from URL only
+            file_hash = hashlib.md5(document_url.encode()).hexdigest()
+        url_validators = {**url_validators, "content_length": str(downloaded.size)}
+        
+        # Step 4: Try to load from cache
+        try:
+            vectorstore = await run_embed(load_vectorstore_from_cache, file_hash, embedding_model)
+        except Exception as e:
+            logger.warning(f"[{request_id}] ⚠ Cache loading failed: {e}")
+            vectorstore = None
+        
+        if vectorstore is not None:
+            logger.info(f"[{request_id}] 🚀 Using cached embeddings - skipping file processing!")
+        else:
+            # Steps 6-9: Ingest
+            logger.info(f"[{request_id}] 🔄 Processing new file...")
+            temp_file_path = None  # owned by the ingestion flight from here
+            vectorstore, error_response = await ingest_document_once(downloaded, file_type, file_extension, file_hash,
+                                                                     document_url, request_id, progress)
+            if error_response:
+                return ResolvedDocument(file_hash=file_hash, file_type=file_type, file_extension=file_extension,
+                                        error=error_response)
+        
+        # Same content behind a new URL: alias it so the next request skips the download
+        save_url_alias(document_url, downloaded.content_hash, url_validators, file_type, file_extension,
+                       downloaded.prefix_hash)
+        return ResolvedDocument(vectorstore, file_hash, file_type, file_extension)
+    
+    finally:
+        # Cleanup temporary file; the vectorstore no longer needs it
+        remove_temp_file(temp_file_path, request_id)
+
+# === Ingestion Jobs ===
+# POST /documents ingests in the background; /hackrx/run then takes the returned id
+# instead of a URL and never waits on ingestion.
+INGESTION_JOB_CONCURRENCY = int(os.getenv("INGESTION_JOB_CONCURRENCY", 2))
+INGESTION_JOBS_MAX = int(os.getenv("INGESTION_JOBS_MAX", 1000))
+DOCUMENT_ID_PATTERN = re.compile(r"[0-9a-f]{32}|[0-9a-f]{64}")
+
+class IngestionJob:
+    """Background ingestion of one document URL with stage-level progress"""
+
+    def __init__(self, document_url):
+        self.id = uuid.uuid4().hex
+        self.document_url = document_url
+        self.status = "queued"  # queued -> running -> ready | failed
+        self.stage = "queued"
+        self.stages = []
+        self.cache_key = None
+        self.file_type = None
+        self.file_extension = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.task = None
+        self.set_stage("queued")
+
+    def set_stage(self, stage, **details):
+        self.updated_at = time.time()
+        self.stage = stage
+        self.stages.append({"stage": stage, "elapsed_seconds": round(self.updated_at - self.created_at, 3), **details})
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.set_stage(status)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "document_url": self.document_url,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "cache_key": self.cache_key,
+            "file_type": self.file_type,
+            "error": self.error,
+            "created_at": datetime.fromtimestamp(self.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+            "elapsed_seconds": round(self.updated_at - self.created_at, 3)
+        }
+
+ingestion_jobs = OrderedDict()
+_active_jobs_by_url = {}
+_ingestion_job_slots = asyncio.Semaphore(INGESTION_JOB_CONCURRENCY)
+
+async def run_ingestion_job(job):
+    try:
+        async with _ingestion_job_slots:
+            job.status = "running"
+            resolved = await resolve_document(job.document_url, job.id, job.set_stage)
+        job.cache_key, job.file_type, job.file_extension = resolved.file_hash, resolved.file_type, resolved.file_extension
+        if resolved.error:
+            job.finish("failed", resolved.error.get("error"))
+        elif resolved.knowledge_reason:
+            job.finish("failed", f"❌ Document cannot be ingested ({resolved.knowledge_reason.lower()}); ask questions with its URL to answer from knowledge")
+        else:
+            job.finish("ready")
+            logger.info(f"[{job.id}] ✅ Document ingested as {job.cache_key}")
+    except asyncio.CancelledError:
+        job.finish("failed", "❌ Ingestion cancelled by shutdown")
+        raise
+    except Exception as e:
+        logger.error(f"[{job.id}] ❌ Ingestion job failed: {e}")
+        job.finish("failed", f"❌ Ingestion failed: {str(e)}")
+    finally:
+        _active_jobs_by_url.pop(normalize_document_url(job.document_url), None)
+
+def submit_ingestion_job(document_url):
+    """Enqueue ingestion of document_url, reusing a queued or running job for the same URL"""
+    url_key = normalize_document_url(document_url)
+    active_id = _active_jobs_by_url.get(url_key)
+    if active_id in ingestion_jobs:
+        return ingestion_jobs[active_id]
+    
+    job = IngestionJob(document_url)
+    ingestion_jobs[job.id] = job
+    _active_jobs_by_url[url_key] = job.id
+    job.task = asyncio.create_task(run_ingestion_job(job))
+    
+    # Forget the oldest finished jobs; their documents stay addressable by content hash
+    finished = [job_id for job_id, old_job in ingestion_jobs.items() if old_job.status in ("ready", "failed")]
+    for job_id in finished[:max(0, len(ingestion_jobs) - INGESTION_JOBS_MAX)]:
+        del ingestion_jobs[job_id]
+    return job
+
+def is_document_id(value):
+    """Document ids are ingestion job ids or cache keys, never URLs"""
+    return bool(DOCUMENT_ID_PATTERN.fullmatch(value.strip()))
+
+def find_cached_file_type(cache_key):
+    for entry in load_url_aliases().values():
+        if entry.get("cache_key") == cache_key:
+            return entry.get("file_type"), entry.get("file_extension")
+    return None, None
+
+async def resolve_document_id(document_id, request_id):
+    """Load the vectorstore of an ingested document by job id or cache key, without waiting on ingestion"""
+    document_id = document_id.strip()
+    job = ingestion_jobs.get(document_id)
+    if job is not None:
+        if job.status != "ready":
+            return ResolvedDocument(error={
+                "error": f"❌ Document {document_id} is not ready (status: {job.status}, stage: {job.stage})",
+                "document": job.to_dict()
+            })
+        file_hash, file_type, file_extension = job.cache_key, job.file_type, job.file_extension
+    else:
+        file_hash = document_id
+        file_type, file_extension = find_cached_file_type(file_hash)
+    
+    vectorstore = await run_embed(load_vectorstore_from_cache, file_hash, embedding_model)
+    if vectorstore is None:
+        return ResolvedDocument(error={"error": f"❌ Unknown document id: {document_id}"})
+    logger.info(f"[{request_id}] 🚀 Using ingested document {file_hash}")
+    return ResolvedDocument(vectorstore, file_hash, file_type, file_extension)
+
+@app.post("/documents")
+async def submit_document(payload: DocumentInput):
+    """Start ingesting a document in the background; poll GET /documents/{id} and pass the id to /hackrx/run"""
+    if not payload.url:
+        return {"error": "❌ Document URL is required"}
+    job = submit_ingestion_job(payload.url)
+    logger.info(f"[{job.id}] 📥 Ingestion job queued for {payload.url}")
+    return job.to_dict()
+
+@app.get("/documents/{document_id}")
+async def get_document_status(document_id: str):
+    job = ingestion_jobs.get(document_id)
+    if job is not None:
+        return job.to_dict()
+    if is_document_id(document_id) and os.path.exists(get_cache_path(document_id)):
+        file_type, _ = find_cached_file_type(document_id)
+        return {"id": document_id, "status": "ready", "stage": "ready", "cache_key": document_id, "file_type": file_type}
+    return {"error": f"❌ Unknown document id: {document_id}"}
+
 # === Main Enhanced Endpoint ===
-async def process_single_question(q, i, total_questions, document_type, vectorstore, api_key, request_id, context_manager):
+async def process_single_question(q, i, total_questions, document_type, vectorstore, request_id, context_manager, precomputed=None, file_hash=None, emit=None, stream_tokens=False):
     try:
         logger.info(f"[{request_id}] ❓ Question {i}/{total_questions}: {q}")
         
@@ -1943,29 +2315,59 @@ async def process_single_question(q, i, total_questions, document_type, vectorst
         retrieval_params = get_adaptive_retrieval_params(question_type, document_type)
         logger.info(f"[{request_id}] 🔍 Using retrieval params: {retrieval_params}")
         
-        # Retrieval with error handling
+        # Retrieval with error handling; answers written from a fallback search are not cached
+        retrieved = True
         try:
-            docs = enhanced_hybrid_retrieval(processed_q, vectorstore, retrieval_params, request_id, question_type)
+            docs = await run_embed(enhanced_hybrid_retrieval, processed_q, vectorstore, retrieval_params, request_id, question_type, precomputed)
             context = "\n\n".join([doc.page_content for doc in docs])
             
             if previous_context:
                 context += f"\n\n{previous_context}"
         except Exception as e:
             logger.warning(f"[{request_id}] ⚠ Retrieval failed for question {i}, using basic search: {e}")
+            retrieved = False
             try:
-                docs = vectorstore.similarity_search(processed_q, k=5)
+                docs = await run_embed(vectorstore.similarity_search, processed_q, k=5)
                 context = "\n\n".join([doc.page_content for doc in docs])
             except Exception as e2:
                 logger.error(f"[{request_id}] ❌ Basic search also failed for question {i}: {e2}")
                 context = f"Unable to retrieve relevant content for this question from the document."
         
+        try:
+            relevance_score = await run_embed(question_relevance_score, vectorstore, processed_q, precomputed)
+        except Exception as e:
+            logger.warning(f"[{request_id}] ⚠ Relevance scoring failed for question {i}, using text heuristics: {e}")
+            relevance_score = None
+        
+        async def stream_token(token):
+            await emit({"event": "token", "index": i - 1, "token": token})
+        
+        async def reset_tokens():
+            await emit({"event": "reset", "index": i - 1})
+        
+        streaming = bool(emit and stream_tokens)
+        
         # LLM call with error handling
         try:
-            answer = await enhanced_nvidia_llm_call(context, processed_q, question_type, document_type, api_key)
-            trimmed_answer = enhanced_clean_and_trim_answer(answer, question_type, document_type, processed_q)
+            answer = await enhanced_nvidia_llm_call(context, processed_q, question_type, document_type,
+                                                    on_token=stream_token if streaming else None,
+                                                    relevance_score=relevance_score,
+                                                    on_reset=reset_tokens if streaming else None)
+            trimmed_answer = await run_embed(enhanced_clean_and_trim_answer, answer, question_type, document_type, processed_q)
             
             await context_manager.add_qa_pair(processed_q, trimmed_answer, question_type)
             
+            # Knowledge and "no relevant context" answers say nothing about the document: never cache them
+            if (answer_cache and file_hash and retrieved
+                    and check_context_relevance(context, processed_q, relevance_score)):
+                try:
+                    question_vector = precomputed.vector(processed_q) if precomputed else None
+                    await run_answer_cache(answer_cache.put,
+                                           answer_cache.make_key(file_hash, processed_q, question_type, document_type),
+                                           file_hash, q, trimmed_answer, document_type, question_vector, question_type)
+                except Exception as cache_error:
+                    logger.warning(f"[{request_id}] ⚠ Failed to cache answer: {cache_error}")
+            
             logger.info(f"[{request_id}] ✅ Question {i}/{total_questions} answered successfully")
             return trimmed_answer
             
@@ -1978,10 +2380,74 @@ async def process_single_question(q, i, total_questions, document_type, vectorst
         logger.error(f"[{request_id}] ❌ Complete failure processing question {i}/{total_questions}: {str(question_error)}")
         return "Sorry, I encountered an error processing this question. Please try again."
 
+async def emit_answer(emit, index, question, answer, source):
+    """Report one finished answer to a streaming client; a no-op for /hackrx/run"""
+    if emit:
+        await emit({"event": "answer", "index": index, "question": question, "answer": answer, "source": source})
+    return answer
+
+async def answer_from_knowledge(questions, emit=None):
+    """Answer every question without document context"""
+    async def answer(index, question):
+        knowledge_answer = await enhanced_nvidia_llm_call("", question, "general_inquiry", "general")
+        return await emit_answer(emit, index, question, knowledge_answer, "knowledge")
+    return await asyncio.gather(*[answer(idx, q) for idx, q in enumerate(questions)])
+
+def count_successful_answers(answers):
+    return sum(1 for answer in answers if "I encountered an error" not in answer and "Sorry, I encountered an error" not in answer)
+
 @app.post("/hackrx/run")
 async def handle_rag_request(payload: HackRxInput):
-    temp_file_path = None
+    return await run_rag_pipeline(payload, str(uuid.uuid4())[:8])
+
+@app.post("/hackrx/stream")
+async def handle_rag_stream(payload: HackRxInput):
+    """Server-Sent Events variant of /hackrx/run.
+
+    Emits an `answer` event per question as soon as it completes (with its index into
+    payload.questions), `token` events while it is generated when payload.stream is set,
+    and a final `summary` (or `error`) event.
+    """
     request_id = str(uuid.uuid4())[:8]
+    events = asyncio.Queue()
+    
+    async def produce():
+        start_time = time.time()
+        result = await run_rag_pipeline(payload, request_id, emit=events.put, stream_tokens=payload.stream)
+        if "error" in result:
+            await events.put({"event": "error", "request_id": request_id, "error": result["error"]})
+        else:
+            successful_answers = count_successful_answers(result["answers"])
+            await events.put({
+                "event": "summary",
+                "request_id": request_id,
+                "total_questions": len(result["answers"]),
+                "successful_answers": successful_answers,
+                "failed_answers": len(result["answers"]) - successful_answers,
+                "elapsed_seconds": round(time.time() - start_time, 3)
+            })
+        await events.put(None)
+    
+    async def event_stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while (event := await events.get()) is not None:
+                name = event.pop("event")
+                yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Client went away: stop answering (shared ingestion is shielded)
+            if not producer.done():
+                producer.cancel()
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def run_rag_pipeline(payload, request_id, emit=None, stream_tokens=False):
+    """Answer payload.questions against payload.documents (a URL or an ingested document id).
+
+    emit, when given, is awaited with an event dict for every answer as it completes
+    (and every token when stream_tokens is set); used by /hackrx/stream.
+    """
     context_manager = EnhancedContextManager()
     
     try:
@@ -1989,264 +2455,36 @@ async def handle_rag_request(payload: HackRxInput):
         if not payload.documents or not payload.questions:
             return {"error": "❌ Both documents URL and questions are required"}
         
-        key_label, api_key = await get_next_nvidia_key()
-        if not api_key:
+        if not key_scheduler.has_keys():
             return {"error": "❌ No valid API key available"}
             
-        logger.info(f"[{request_id}] 🔄 Using {key_label} for this request.")
+        logger.info(f"[{request_id}] 🔄 Scheduling LLM calls across {len(key_scheduler.keys)} key(s).")
         
         total_questions = len(payload.questions)
         logger.info(f"[{request_id}] 📋 Processing {total_questions} questions")
 
-        # Step 1: Download file safely with binary check
-        try:
-            file_content, content_type = await download_file_safely(payload.documents, max_size_mb=100, check_binary=True)
-            
-            # If file is skipped (large binary), answer from knowledge
-            if file_content is None:
-                logger.info(f"[{request_id}] 🤖 Large binary file detected, answering from knowledge.")
-                tasks = [enhanced_nvidia_llm_call("", q, "general_inquiry", "general", api_key) for q in payload.questions]
-                answers = await asyncio.gather(*tasks)
-                
-                # Print all questions and answers to console
-                print(f"\n=== Questions and Answers (Large Binary File - Knowledge Based) ===")
-                for idx, (q, a) in enumerate(zip(payload.questions, answers), 1):
-                    print(f"Q{idx}: {q}")
-                    print(f"A{idx}: {a}\n")
-                print("=============================\n")
-                
-                return {"answers": answers}
-                
-        except Exception as e:
-            logger.error(f"[{request_id}] ❌ File download failed: {e}")
-            return {"error": f"❌ File download failed: {str(e)}"}
-        
-        # Step 2: Detect file type
-        try:
-            file_type, file_extension = detect_file_type(payload.documents, content_type, file_content)
-            logger.info(f"[{request_id}] 📄 Detected file type: {file_type} ({file_extension})")
-            
-            # Handle binary and archive files by answering from knowledge
-            if file_type in ['binary', 'archive']:
-                logger.info(f"[{request_id}] 🤖 {file_type.capitalize()} file detected, answering from knowledge.")
-                tasks = [enhanced_nvidia_llm_call("", q, "general_inquiry", "general", api_key) for q in payload.questions]
-                answers = await asyncio.gather(*tasks)
-                
-                # Print all questions and answers to console
-                print(f"\n=== Questions and Answers ({file_type.capitalize()} - Knowledge Based) ===")
-                for idx, (q, a) in enumerate(zip(payload.questions, answers), 1):
-                    print(f"Q{idx}: {q}")
-                    print(f"A{idx}: {a}\n")
-                print("=============================\n")
-                
-                return {"answers": answers}
-                
-        except Exception as e:
-            logger.error(f"[{request_id}] ❌ File type detection failed: {e}")
-            # Fallback to knowledge-based answering for all questions
-            logger.info(f"[{request_id}] 🤖 Answering from knowledge due to file type detection failure.")
-            tasks = [enhanced_nvidia_llm_call("", q, "general_inquiry", "general", api_key) for q in payload.questions]
-            answers = await asyncio.gather(*tasks)
-            return {"answers": answers}
-        
-        # Step 3: Generate cache hash
-        try:
-            file_hash = get_file_hash(payload.documents, file_content)
-            logger.info(f"[{request_id}] 🔍 File hash: {file_hash}")
-        except Exception as e:
-            logger.error(f"[{request_id}] ❌ Hash generation failed: {e}")
-            # Generate simple hash from URL only
-            file_hash = hashlib.md5(payload.documents.encode()).hexdigest()
-        
-        # Step 4: Try to load from cache
-        vectorstore = None
-        try:
-            vectorstore = load_vectorstore_from_cache(file_hash, embedding_model)
-        except Exception as e:
-            logger.warning(f"[{request_id}] ⚠ Cache loading failed: {e}")
-            vectorstore = None
-        
-        if vectorstore is not None:
-            logger.info(f"[{request_id}] 🚀 Using cached embeddings - skipping file processing!")
-            # Skip to document type detection and question processing when using cache
-            documents = []
-            processable_docs = []  # Initialize for cached processing
-            processing_status = "cached_processing"
-            # Skip the document filtering logic for cached embeddings
-            skip_document_processing = True
+        # Steps 0-9: Resolve the document to a vectorstore, ingesting it only when needed
+        if is_document_id(payload.documents):
+            resolved = await resolve_document_id(payload.documents, request_id)
         else:
-            logger.info(f"[{request_id}] 🔄 Processing new file...")
-            skip_document_processing = False
-            # Initialize variables for new file processing
-            documents = []
-            processable_docs = []
-            processing_status = "unknown"
-            
-            # Step 5: Save file temporarily
-            try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-                    tmp_file.write(file_content)
-                    temp_file_path = tmp_file.name
-                
-                logger.info(f"[{request_id}] 💾 File saved temporarily: {temp_file_path}")
-            except Exception as e:
-                logger.error(f"[{request_id}] ❌ Failed to save temporary file: {e}")
-                return {"error": f"❌ Failed to process file: {str(e)}"}
-            
-            # Step 6: Enhanced file processing with better error handling for different file types
-            documents = []
-            processing_status = "unknown"
-            
-            try:
-                if file_type == 'archive':
-                    documents = process_archive_file(file_content, file_extension)
-                    if not documents:
-                        processing_status = "archive_extraction_failed"
-                        logger.warning(f"[{request_id}] ⚠ Archive extraction failed")
-                        return {
-                            "error": f"❌ Archive file could not be extracted. The ZIP file may be corrupted, password-protected, or contain only binary files. Please extract the archive manually and upload individual documents.",
-                            "file_type": file_type,
-                            "processing_status": processing_status
-                        }
-                    else:
-                        processing_status = "archive_processed"
-                else:
-                    documents = load_document_by_type(temp_file_path, file_type, payload.documents)
-                    if documents and any(doc.metadata.get('error') for doc in documents):
-                        processing_status = "content_extraction_failed"
-                    elif documents:
-                        processing_status = "successfully_processed"
-                    else:
-                        processing_status = "no_content_found"
-                
-                if not documents:
-                    logger.warning(f"[{request_id}] ⚠ No documents loaded for {file_type} file")
-                    if file_type in ['image', 'presentation', 'spreadsheet']:
-                        return {
-                            "error": f"❌ {file_type.title()} file could not be processed. This may be due to: 1) Corrupted file, 2) Unsupported format variant, 3) Missing required libraries. For images, ensure they contain readable text. For presentations/spreadsheets, try converting to PDF format.",
-                            "file_type": file_type,
-                            "processing_status": "unsupported_content"
-                        }
-                    else:
-                        return {
-                            "error": f"❌ File could not be processed. The {file_type} file may be empty, corrupted, or in an unsupported format. Please verify the file and try again.",
-                            "file_type": file_type,
-                            "processing_status": "no_content_found"
-                        }
-                
-                logger.info(f"[{request_id}] 📄 Loaded {len(documents)} documents, status: {processing_status}")
-                
-            except Exception as e:
-                logger.error(f"[{request_id}] ❌ Document loading failed: {e}")
-                processing_status = "processing_error"
-                if file_type in ['excel', 'spreadsheet']:
-                    return {
-                        "error": f"❌ Spreadsheet processing failed. This may be due to: 1) Complex formulas or macros, 2) Large file size, 3) Corrupted data. Try saving as CSV format or simplify the spreadsheet content.",
-                        "file_type": file_type,
-                        "processing_status": processing_status,
-                        "technical_error": str(e)
-                    }
-                elif file_type in ['powerpoint', 'presentation']:
-                    return {
-                        "error": f"❌ Presentation processing failed. The PowerPoint file may contain complex elements that cannot be extracted. Try exporting slides as images with text or converting to PDF format.",
-                        "file_type": file_type,
-                        "processing_status": processing_status,
-                        "technical_error": str(e)
-                    }
-                else:
-                    return {
-                        "error": f"❌ File processing failed due to technical error. The {file_type} file could not be loaded or parsed. Please check the file integrity and format.",
-                        "file_type": file_type,
-                        "processing_status": processing_status,
-                        "technical_error": str(e)
-                    }
+            resolved = await resolve_document(payload.documents, request_id)
+        if resolved.error:
+            return resolved.error
         
-        # Only do document filtering if not using cached embeddings
-        if not skip_document_processing:
-            # Simplified filtering - only remove documents with critical errors
-            processable_docs = []
-            
-            for doc in documents:
-                # Only filter out documents with explicit processing errors
-                if doc.metadata.get('error') == 'complete_failure':
-                    logger.warning(f"[{request_id}] Skipping document with complete failure")
-                    continue
-                else:
-                    processable_docs.append(doc)
+        if resolved.knowledge_reason:
+            logger.info(f"[{request_id}] 🤖 {resolved.knowledge_reason} detected, answering from knowledge.")
+            answers = await answer_from_knowledge(payload.questions, emit)
             
-        # Skip document checking if using cached embeddings
-        if not skip_document_processing:
-            # If no documents at all, only then show error
-            if not processable_docs and not documents:
-                logger.warning(f"[{request_id}] ⚠ No documents loaded from file")
-                return {
-                    "error": f"❌ File could not be processed. No content was extracted from the {file_type} file.",
-                    "file_type": file_type,
-                    "processing_status": "no_content_extracted"
-                }
+            # Print all questions and answers to console
+            print(f"\n=== Questions and Answers ({resolved.knowledge_reason} - Knowledge Based) ===")
+            for idx, (q, a) in enumerate(zip(payload.questions, answers), 1):
+                print(f"Q{idx}: {q}")
+                print(f"A{idx}: {a}\n")
+            print("=============================\n")
             
-            # Use all available documents if processable_docs is empty but documents exist
-            if not processable_docs and documents:
-                logger.info(f"[{request_id}] Using all available documents despite quality issues")
-                processable_docs = documents
-        else:
-            logger.info(f"[{request_id}] ✅ Skipping document validation - using cached vectorstore")
-            processable_docs = []  # Not needed for cached processing
+            return {"answers": answers}
         
-        # Step 7: Process documents if not loaded from cache
-        if vectorstore is None:
-            # Enhanced chunking based on file type with error handling - increased by 30%
-            try:
-                if file_type in ['presentation', 'image']:
-                    chunk_size = 1300
-                    chunk_overlap = 130
-                elif file_type in ['spreadsheet', 'csv']:
-                    chunk_size = 1560
-                    chunk_overlap = 195
-                elif file_type == 'text':
-                    chunk_size = 1950
-                    chunk_overlap = 260
-                else:  # pdf, word, etc.
-                    num_docs = len(processable_docs)
-                    if num_docs > 400:
-                        chunk_size = 1820
-                        chunk_overlap = 455
-                    elif num_docs > 100:
-                        chunk_size = 2080
-                        chunk_overlap = 325
-                    else:
-                        chunk_size = 2340
-                        chunk_overlap = 260
-                
-                logger.info(f"[{request_id}] 📊 Using chunking: chunk_size={chunk_size}, overlap={chunk_overlap}")
-                
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=chunk_size, 
-                    chunk_overlap=chunk_overlap,
-                    separators=["\n\n", "\n", ". ", " ", ""],
-                    keep_separator=True
-                )
-                chunks = splitter.split_documents(processable_docs)
-                logger.info(f"[{request_id}] 📑 Created {len(chunks)} chunks.")
-                
-                # Step 8: Create vectorstore with error handling
-                try:
-                    vectorstore = FAISS.from_documents(chunks, embedding=embedding_model)
-                    logger.info(f"[{request_id}] 🧠 FAISS vectorstore created.")
-                    
-                    # Step 9: Save to cache
-                    try:
-                        save_vectorstore_to_cache(vectorstore, file_hash)
-                    except Exception as e:
-                        logger.warning(f"[{request_id}] ⚠ Failed to save to cache: {e}")
-                        
-                except Exception as e:
-                    logger.error(f"[{request_id}] ❌ Vectorstore creation failed: {e}")
-                    return {"error": f"❌ Failed to create embeddings: {str(e)}"}
-                    
-            except Exception as e:
-                logger.error(f"[{request_id}] ❌ Chunking failed: {e}")
-                return {"error": f"❌ Failed to process document chunks: {str(e)}"}
+        vectorstore, file_hash, file_type = resolved.vectorstore, resolved.file_hash, resolved.file_type
         
         # Ensure vectorstore exists before proceeding
         if vectorstore is None:
@@ -2255,7 +2493,7 @@ async def handle_rag_request(payload: HackRxInput):
         
         # Step 10: Document type detection with error handling
         try:
-            sample_docs = vectorstore.similarity_search("document content overview summary", k=5)
+            sample_docs = await run_embed(vectorstore.similarity_search, "document content overview summary", k=5)
             sample_context = " ".join([doc.page_content[:500] for doc in sample_docs])
             document_type = detect_document_type(sample_context, file_type)
             logger.info(f"[{request_id}] 📋 Final document type: {document_type}")
@@ -2263,14 +2501,53 @@ async def handle_rag_request(payload: HackRxInput):
             logger.warning(f"[{request_id}] ⚠ Document type detection failed: {e}")
             document_type = "general"
         
-        # Step 11: Process questions in parallel
-        tasks = []
-        for i, q in enumerate(payload.questions, 1):
-            tasks.append(process_single_question(q, i, total_questions, document_type, vectorstore, api_key, request_id, context_manager))
+        # Step 11: Serve repeat questions from the answer cache
+        answer_list = [None] * total_questions
+        if answer_cache:
+            try:
+                answer_list = await run_answer_cache(lookup_cached_answers, file_hash, payload.questions, document_type)
+            except Exception as e:
+                logger.warning(f"[{request_id}] ⚠ Answer cache lookup failed: {e}")
+        pending = [(i, q) for i, q in enumerate(payload.questions, 1) if answer_list[i - 1] is None]
+        if answer_cache and pending and answer_cache.semantic_threshold > 0:
+            # Near-duplicate phrasings: the question vectors are memoized and reused by Step 12
+            try:
+                processed = [preprocess_question(q) for _, q in pending]
+                question_vectors = await run_embed(embedding_model.embed_queries, processed)
+                similar = await run_answer_cache(find_similar_answers, file_hash, document_type, processed, question_vectors)
+                for (i, _), answer in zip(pending, similar):
+                    answer_list[i - 1] = answer
+            except Exception as e:
+                logger.warning(f"[{request_id}] ⚠ Semantic answer cache lookup failed: {e}")
+            pending = [(i, q) for i, q in pending if answer_list[i - 1] is None]
+        if len(pending) < total_questions:
+            logger.info(f"[{request_id}] ⚡ {total_questions - len(pending)}/{total_questions} answers served from answer cache")
+            for idx, (q, a) in enumerate(zip(payload.questions, answer_list)):
+                if a is not None:
+                    await emit_answer(emit, idx, q, a, "cache")
+        
+        # Step 12: Embed every retrieval query of the request in one batch
+        precomputed = None
+        if pending:
+            try:
+                query_ks = plan_request_queries([q for _, q in pending], document_type)
+                precomputed = await run_embed(precompute_query_neighbors, vectorstore, query_ks)
+                logger.info(f"[{request_id}] 🧮 Batch-embedded {len(precomputed.vectors)} retrieval queries")
+            except Exception as e:
+                logger.warning(f"[{request_id}] ⚠ Batched query embedding failed, embedding per question: {e}")
+        
+        # Step 13: Process remaining questions in parallel
+        async def answer_question(i, q):
+            answer = await process_single_question(q, i, total_questions, document_type, vectorstore, request_id, context_manager,
+                                                   precomputed, file_hash, emit, stream_tokens)
+            return await emit_answer(emit, i - 1, q, answer, "generated")
+        
+        tasks = [answer_question(i, q) for i, q in pending]
 
-        answer_list = await asyncio.gather(*tasks)
+        for (i, _), answer in zip(pending, await asyncio.gather(*tasks)):
+            answer_list[i - 1] = answer
         
-        successful_answers = sum(1 for answer in answer_list if "I encountered an error" not in answer and "Sorry, I encountered an error" not in answer)
+        successful_answers = count_successful_answers(answer_list)
         failed_answers = total_questions - successful_answers
         
         logger.info(f"[{request_id}] 🎉 Processing completed! Success: {successful_answers}/{total_questions}, Failed: {failed_answers}/{total_questions}")
@@ -2313,22 +2590,3 @@ async def handle_rag_request(payload: HackRxInput):
         logger.error(f"[{request_id}] ⚠ Critical error during processing: {str(e)}")
         # Return error response but don't crash
         return {"error": f"Critical processing error: {str(e)}"}
-
-    finally:
-        # Cleanup temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logger.info(f"[{request_id}] 🧹 Temporary file cleaned.")
-            except Exception as cleanup_error:
-                logger.warning(f"[{request_id}] ⚠ Cleanup failed: {cleanup_error}")
-
-# === Local Run with Ngrok ===
-if __name__ == "__main__":
-    import uvicorn
-    from pyngrok import ngrok
-
-    public_url = ngrok.connect("8000")
-    logger.info(f"🌍 Ngrok tunnel running at: {public_url}")
-
-    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,131 @@
+"""Chunks/sec and retrieval quality of each embedding backend (EMBEDDING_MODEL × EMBEDDING_BACKEND).
+
+Embeds the chunks of every cached document that has a chunk store (or a synthetic
+corpus when there are none) with each model/backend pair, then answers a query set
+against a flat inner-product index of each. Quality is reported relative to the
+default bge-large/torch backend: recall@k is the share of its top-k chunks each
+backend also returns, and MRR@k the mean reciprocal rank of its top-1 chunk.
+chunks/s is a plain embed_documents call; bulk/s is the length-bucketed
+BulkEmbedder that ingestion uses.
+
+Queries are the questions in results.json plus the first sentence of sampled chunks.
+
+    python benchmarks/embedding_backends.py
+    python benchmarks/embedding_backends.py --models bge-large bge-small --backends torch onnx-int8
+    python benchmarks/embedding_backends.py --max-chunks 2000 --k 5
+
+The ONNX int8 export is built on first use under --export-dir, outside the timing.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embedding_backends  # noqa: E402
+import faiss_store  # noqa: E402
+
+SYNTHETIC_TOPICS = ["grace period for premium payment", "waiting period for pre-existing diseases",
+                    "room rent and ICU charges", "cashless claim through a network hospital",
+                    "maternity expenses", "cataract surgery limits", "ambulance cover", "organ donor expenses"]
+
+
+def load_corpus(cache_dir, max_chunks):
+    chunks = []
+    if os.path.isdir(cache_dir):
+        for entry in sorted(os.listdir(cache_dir)):
+            path = os.path.join(cache_dir, entry)
+            if entry.endswith(".faiss") and faiss_store.has_chunk_store(path):
+                store = faiss_store.ChunkStore(path)
+                chunks.extend(store.text(i) for i in range(len(store)))
+    if not chunks:
+        rng = np.random.default_rng(0)
+        chunks = [f"Section {i}: the policy describes the {SYNTHETIC_TOPICS[i % len(SYNTHETIC_TOPICS)]}. "
+                  + " ".join(rng.choice(SYNTHETIC_TOPICS, size=6)) for i in range(max_chunks)]
+    return chunks[:max_chunks]
+
+
+def load_queries(results_path, chunks, samples):
+    queries = []
+    if os.path.exists(results_path):
+        with open(results_path, encoding="utf-8") as f:
+            for result in json.load(f):
+                queries.extend(qa["question"] for qa in result.get("questions_and_answers", []))
+    rng = np.random.default_rng(1)
+    for i in rng.choice(len(chunks), size=min(samples, len(chunks)), replace=False):
+        sentence = re.split(r"(?<=[.!?])\s", chunks[i].strip(), maxsplit=1)[0]
+        if len(sentence.split()) >= 4:
+            queries.append(sentence[:300])
+    return list(dict.fromkeys(queries))
+
+
+def run_backend(model_key, backend, chunks, queries, args):
+    embeddings = embedding_backends.load_embeddings(model_key, backend, args.device, export_dir=args.export_dir,
+                                                    quantization_config=args.onnx_quantization)
+    embeddings.embed_documents(chunks[:args.batch])  # warm-up: lazy init, kernel selection
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    chunks_per_s = len(chunks) / (time.perf_counter() - start)
+
+    bulk = embedding_backends.BulkEmbedder(embeddings, args.device if backend == "torch" else "cpu")
+    start = time.perf_counter()
+    for _ in bulk.embed_batches(chunks):
+        pass
+    bulk_chunks_per_s = len(chunks) / (time.perf_counter() - start)
+
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    _, labels = index.search(np.asarray(embeddings.embed_documents(queries), dtype=np.float32), args.k)
+    return chunks_per_s, bulk_chunks_per_s, vectors.shape[1], labels
+
+
+def main(args):
+    chunks = load_corpus(args.cache_dir, args.max_chunks)
+    queries = load_queries(args.results, chunks, args.query_samples)
+    faiss.omp_set_num_threads(1)
+    print(f"{len(chunks)} chunks, {len(queries)} queries\n")
+    print(f"{'model':<11}{'backend':<11}{'dims':>6}{'chunks/s':>10}{'bulk/s':>9}{f'recall@{args.k}':>11}{f'MRR@{args.k}':>9}")
+
+    reference = None
+    for model_key in args.models:
+        for backend in args.backends:
+            try:
+                chunks_per_s, bulk_chunks_per_s, dims, labels = run_backend(model_key, backend, chunks, queries, args)
+            except Exception as e:
+                print(f"{model_key:<11}{backend:<11}  failed: {e}")
+                continue
+            if (model_key, backend) == (embedding_backends.DEFAULT_MODEL, embedding_backends.DEFAULT_BACKEND):
+                reference = labels
+            if reference is None:
+                quality = f"{'-':>11}{'-':>9}"
+            else:
+                recall = np.mean([len(set(row) & set(ref)) / args.k for row, ref in zip(labels, reference)])
+                ranks = [list(row).index(ref[0]) + 1 if ref[0] in row else None for row, ref in zip(labels, reference)]
+                mrr = np.mean([1 / rank if rank else 0.0 for rank in ranks])
+                quality = f"{recall:>11.3f}{mrr:>9.3f}"
+            print(f"{model_key:<11}{backend:<11}{dims:>6}{chunks_per_s:>10.1f}{bulk_chunks_per_s:>9.1f}{quality}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    # The reference backend runs first so every other row can be compared with it
+    parser.add_argument("--models", nargs="+", default=["bge-large", "bge-base", "bge-small"],
+                        choices=list(embedding_backends.MODELS))
+    parser.add_argument("--backends", nargs="+", default=list(embedding_backends.BACKENDS),
+                        choices=embedding_backends.BACKENDS)
+    parser.add_argument("--cache-dir", default="embedding_cache")
+    parser.add_argument("--results", default="results.json", help="saved responses whose questions become queries")
+    parser.add_argument("--max-chunks", type=int, default=1000)
+    parser.add_argument("--query-samples", type=int, default=100, help="chunk sentences added as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32, help="chunks embedded once before timing")
+    parser.add_argument("--device", default="cpu", help="torch backend device, e.g. cuda")
+    parser.add_argument("--export-dir", default="embedding_models")
+    parser.add_argument("--onnx-quantization", default="avx512_vnni", choices=embedding_backends.ONNX_QUANTIZATION_CONFIGS)
+    main(parser.parse_args())
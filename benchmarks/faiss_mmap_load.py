@@ -0,0 +1,116 @@
+"""Benchmark cached FAISS index loading: regular read vs read-only memory map.
+
+Builds synthetic flat indexes (bge-large dimension) of several sizes, then starts
+1, 4 and 8 worker processes that all open the same index at once, run one search
+and report load latency plus the memory the index added to the process. PSS
+splits shared pages between the processes mapping them, so with mmap the total
+PSS across workers stays near one copy of the index while RSS counts it in every
+worker.
+
+    python benchmarks/faiss_mmap_load.py
+    python benchmarks/faiss_mmap_load.py --sizes 10000 200000 --workers 1 4 8
+
+Memory figures come from /proc/self/smaps_rollup and are Linux-only. The page
+cache is warm after the first run, which is the steady state for repeated loads.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIMENSION = 1024  # BAAI/bge-large-en-v1.5
+
+
+def read_memory_kb():
+    """Rss, Pss and private kB of the current process"""
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {"rss": 0, "pss": 0, "private": 0}
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    }
+
+
+def load_worker(path, mmap, barrier, results):
+    import numpy as np
+    import faiss_store
+
+    before = read_memory_kb()
+    barrier.wait()
+    start = time.perf_counter()
+    index, mapped = faiss_store.read_index(path, mmap=mmap)
+    load_ms = (time.perf_counter() - start) * 1000
+    # One exhaustive search touches every vector, as the first real query would
+    index.search(np.random.rand(1, DIMENSION).astype("float32"), 5)
+    # Measure only once every worker holds the index, so shared pages are split between all of them
+    barrier.wait()
+    after = read_memory_kb()
+    barrier.wait()
+    results.put({"load_ms": load_ms, "mapped": mapped,
+                 **{key: after[key] - before[key] for key in after}})
+
+
+def run_workers(path, mmap, workers):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=load_worker, args=(path, mmap, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measurements
+
+
+def build_index(path, size):
+    import faiss
+    import numpy as np
+    import faiss_store
+
+    index = faiss.IndexFlatL2(DIMENSION)
+    rng = np.random.default_rng(0)
+    for start in range(0, size, 50000):
+        index.add(rng.random((min(50000, size - start), DIMENSION), dtype=np.float32))
+    faiss_store.write_index(index, path)
+
+
+def main(args):
+    print(f"{'vectors':>9}{'index MB':>10}{'mode':>6}{'workers':>9}{'load p50 ms':>13}{'load max ms':>13}"
+          f"{'RSS MB':>9}{'PSS MB':>9}{'private MB':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = os.path.join(directory, f"index_{size}.faiss")
+            build_index(path, size)
+            index_mb = os.path.getsize(path) / (1024 * 1024)
+            for mmap in (False, True):
+                for workers in args.workers:
+                    measurements = run_workers(path, mmap, workers)
+                    load_ms = [m["load_ms"] for m in measurements]
+                    # "copy": faiss without IO_FLAG_MMAP_IFC still copies flat codes on an mmap read
+                    mode = "read" if not mmap else "mmap" if all(m["mapped"] for m in measurements) else "copy"
+                    print(f"{size:>9}{index_mb:>10.1f}{mode:>6}{workers:>9}"
+                          f"{statistics.median(load_ms):>13.1f}{max(load_ms):>13.1f}"
+                          f"{sum(m['rss'] for m in measurements) / 1024:>9.1f}"
+                          f"{sum(m['pss'] for m in measurements) / 1024:>9.1f}"
+                          f"{sum(m['private'] for m in measurements) / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 250000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""Query latency vs recall for each index tier (INDEX_TYPE): flat, IVF and HNSW.
+
+Builds each tier with faiss_store.build_index over clustered synthetic vectors
+(bge-large dimension) at several chunk counts, sweeps the query-time knob (IVF
+nprobe, HNSW efSearch) and reports single-query latency, as one retrieval call
+issues it, and recall@k against exact flat search.
+
+    python benchmarks/index_tiers.py
+    python benchmarks/index_tiers.py --sizes 2000 20000 100000 --k 10
+
+Pass --cache-dir to also run on the float vectors of real cached documents.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss_store  # noqa: E402
+
+DIMENSION = 1024  # BAAI/bge-large-en-v1.5
+
+
+def clustered_vectors(size, clusters=64, seed=0):
+    """Gaussian blobs: closer to document embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIMENSION)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)] + 0.5 * rng.standard_normal((size, DIMENSION)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, labels = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(labels[0]) & set(expected))
+    return statistics.median(latencies), hits / (len(queries) * k)
+
+
+def run(label, vectors, args):
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, args.k)
+
+    tiers = [("flat", None, [None]), ("ivf", "nprobe", args.nprobe), ("hnsw", "hnsw_ef_search", args.ef_search)]
+    for index_type, knob, values in tiers:
+        start = time.perf_counter()
+        index, params = faiss_store.build_index(vectors, faiss.METRIC_L2, index_type, hnsw_m=args.hnsw_m)
+        build_s = time.perf_counter() - start
+        for value in values:
+            if knob:
+                if knob == "nprobe" and value > params["nlist"]:
+                    continue
+                faiss_store.apply_search_params(index, {knob: value})
+            p50_ms, recall = measure(index, queries, truth, args.k)
+            setting = f"{knob}={value}" if knob else "exact"
+            print(f"{label:<14}{len(vectors):>8}{params['factory']:>14}{setting:>20}{build_s:>9.2f}"
+                  f"{p50_ms:>10.3f}{recall:>10.3f}")
+
+
+def main(args):
+    faiss.omp_set_num_threads(args.threads)
+    print(f"{'data':<14}{'chunks':>8}{'factory':>14}{'setting':>20}{'build s':>9}{'p50 ms':>10}"
+          f"{f'recall@{args.k}':>10}")
+    for size in args.sizes:
+        run("synthetic", clustered_vectors(size), args)
+    if args.cache_dir:
+        for entry in sorted(f for f in os.listdir(args.cache_dir) if f.endswith(".faiss")):
+            index, _ = faiss_store.read_vector_index(os.path.join(args.cache_dir, entry), mmap=False)
+            if index.ntotal > args.k:
+                run(entry[:12], index.reconstruct_n(0, index.ntotal), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 100000])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=1, help="faiss OpenMP threads per search")
+    parser.add_argument("--cache-dir", help="also benchmark cached documents, e.g. embedding_cache")
+    main(parser.parse_args())
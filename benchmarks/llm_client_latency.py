@@ -0,0 +1,135 @@
+"""Benchmark NVIDIA LLM-call latency: per-call httpx client vs the shared pooled client.
+
+Starts a local mock chat-completions server, then fires the same batch of calls
+twice: once opening a fresh httpx.AsyncClient per call (the old behaviour) and
+once through api_main_v2.enhanced_nvidia_llm_call with the app-lifetime pool.
+
+    python benchmarks/llm_client_latency.py --calls 200 --concurrency 10
+    python benchmarks/llm_client_latency.py --certfile cert.pem --keyfile key.pem
+
+Pass --certfile/--keyfile to serve the mock over TLS, which is where the saved
+handshake cost shows up. The certificate is trusted via SSL_CERT_FILE, so make it
+self-signed for 127.0.0.1:
+
+    openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=127.0.0.1 \
+        -addext subjectAltName=IP:127.0.0.1 -keyout key.pem -out cert.pem
+
+uvicorn only speaks HTTP/1.1; to measure HTTP/2 multiplexing point --url at an
+h2-capable mock (e.g. hypercorn) instead.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MOCK_ANSWER = "The grace period for premium payment is thirty days."
+
+
+def start_mock_server(port, latency_ms, certfile=None, keyfile=None):
+    """Run a minimal chat-completions mock in a background thread"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    mock = FastAPI()
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions():
+        await asyncio.sleep(latency_ms / 1000)
+        return {"choices": [{"message": {"role": "assistant", "content": MOCK_ANSWER}}]}
+
+    config = uvicorn.Config(mock, host="127.0.0.1", port=port, log_level="warning",
+                            ssl_certfile=certfile, ssl_keyfile=keyfile)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_batch(call, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*[timed() for _ in range(calls)])
+    return latencies
+
+
+async def main(args):
+    payload = {
+        "model": "meta/llama-4-maverick-17b-128e-instruct",
+        "messages": [{"role": "user", "content": "What is the grace period?"}],
+        "max_tokens": 64,
+        "stream": False
+    }
+    headers = {"Authorization": "Bearer benchmark", "Accept": "application/json"}
+
+    async def per_call_client():
+        async with httpx.AsyncClient(timeout=40) as client:
+            response = await client.post(args.url, headers=headers, json=payload)
+            response.raise_for_status()
+
+    import api_main_v2
+    api_main_v2.nvidia_clients.limits = httpx.Limits(max_connections=args.concurrency,
+                                                     max_keepalive_connections=args.concurrency)
+
+    context = "The policy allows a grace period of thirty days for premium payment. " * 10
+
+    async def pooled_client():
+        await api_main_v2.enhanced_nvidia_llm_call(context, "What is the grace period?",
+                                                   "policy_time", "policy", "benchmark")
+
+    results = {}
+    for label, call in [("per-call client", per_call_client), ("shared pool", pooled_client)]:
+        await run_batch(call, min(args.concurrency, args.calls), args.concurrency)  # warm-up
+        latencies = await run_batch(call, args.calls, args.concurrency)
+        results[label] = latencies
+
+    await api_main_v2.nvidia_clients.aclose()
+
+    print(f"\n=== LLM call latency ({args.calls} calls, concurrency {args.concurrency}, "
+          f"mock latency {args.latency_ms}ms, http2={api_main_v2.nvidia_clients.http2}) ===")
+    print(f"{'mode':<18}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for label, latencies in results.items():
+        print(f"{label:<18}{percentile(latencies, 50):>10.1f}{percentile(latencies, 95):>10.1f}"
+              f"{statistics.mean(latencies):>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=int, default=50, help="simulated model latency")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--url", help="use an external mock instead of starting one")
+    args = parser.parse_args()
+
+    if not args.url:
+        scheme = "https" if args.certfile else "http"
+        args.url = f"{scheme}://127.0.0.1:{args.port}/v1/chat/completions"
+        start_mock_server(args.port, args.latency_ms, args.certfile, args.keyfile)
+    if args.certfile:
+        os.environ["SSL_CERT_FILE"] = args.certfile
+    # Must be set before api_main_v2 is imported
+    os.environ["NVIDIA_API_URL"] = args.url
+    asyncio.run(main(args))
@@ -0,0 +1,143 @@
+"""Pages/sec of page-parallel PDF extraction (pdf_extract) against PyMuPDFLoader.
+
+Extracts each PDF with the current loader, then the way ingestion does: fixed
+ranges of --pages-per-task pages (PDF_PAGES_PER_TASK) through pdf_extract.extract_pages
+on a process pool of 1, 2, 4 and 8 workers, one range in flight per worker, results
+taken in page order. Each pool runs with table extraction off and on (PDF_TABLES),
+and reports the table chunks found. Pools are started and warmed before timing, as
+the server's parse pool is. Runs without tables are checked against the loader's
+output: same page order, text and (source, page) metadata.
+
+The synthetic PDF draws a ruled table on every --table-every'th page.
+
+    python benchmarks/pdf_extract_pages.py                      # synthetic 500-page PDF
+    python benchmarks/pdf_extract_pages.py --pdf policy.pdf principia.pdf --workers 1 2 4 8
+
+PDFs can also be given as URLs; they are downloaded once into a temp directory.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import requests
+from langchain_community.document_loaders import PyMuPDFLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_extract  # noqa: E402
+
+PARAGRAPH = ("The Company shall indemnify the Insured Person for medical expenses incurred for hospitalisation "
+             "during the policy period, subject to the sum insured, sub-limits and waiting periods. ")
+
+
+def draw_table(page, top, rows=8, columns=3, row_height=20, column_width=165, left=50):
+    for row in range(rows + 1):
+        page.draw_line((left, top + row * row_height), (left + columns * column_width, top + row * row_height))
+    for column in range(columns + 1):
+        page.draw_line((left + column * column_width, top), (left + column * column_width, top + rows * row_height))
+    for row in range(rows):
+        for column in range(columns):
+            text = f"Plan {'ABC'[column]}" if row == 0 else f"{row * 10 + column} days"
+            page.insert_text((left + column * column_width + 4, top + row * row_height + 14), text, fontsize=9)
+
+
+def synthetic_pdf(path, pages, table_every):
+    with fitz.open() as doc:
+        for number in range(pages):
+            page = doc.new_page()
+            if table_every and number % table_every == 0:
+                page.insert_textbox(fitz.Rect(50, 50, 545, 420), f"Section {number + 1}\n" + PARAGRAPH * 12, fontsize=9)
+                draw_table(page, top=440)
+            else:
+                page.insert_textbox(fitz.Rect(50, 50, 545, 790), f"Section {number + 1}\n" + PARAGRAPH * 24, fontsize=9)
+        doc.save(path)
+
+
+def resolve_pdfs(paths, directory, pages, table_every):
+    if not paths:
+        path = os.path.join(directory, f"synthetic_{pages}.pdf")
+        synthetic_pdf(path, pages, table_every)
+        return [path]
+    resolved = []
+    for path in paths:
+        if path.startswith(("http://", "https://")):
+            local = os.path.join(directory, f"download_{len(resolved)}.pdf")
+            with open(local, "wb") as f:
+                f.write(requests.get(path, timeout=120).content)
+            path = local
+        resolved.append(path)
+    return resolved
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def extract_in_tasks(path, executor, workers, pages_per_task, tables=False):
+    """produce_pdf_pages' schedule: at most one range in flight per worker, consumed in page order"""
+    page_count = pdf_extract.count_pages(path)
+    in_flight = deque()
+    documents = []
+    for first in range(0, page_count, pages_per_task):
+        in_flight.append(executor.submit(pdf_extract.extract_pages, path, first, first + pages_per_task, tables))
+        if len(in_flight) >= workers:
+            documents.extend(in_flight.popleft().result())
+    while in_flight:
+        documents.extend(in_flight.popleft().result())
+    return documents
+
+
+def same_output(expected, actual):
+    return len(expected) == len(actual) and all(
+        # Newer PyMuPDFLoader versions strip the page text; the splitter drops that whitespace anyway
+        a.page_content.strip() == b.page_content.strip()
+        and (a.metadata.get("source"), a.metadata.get("page")) == (b.metadata.get("source"), b.metadata.get("page"))
+        for a, b in zip(expected, actual)
+    )
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'pdf':<24}{'pages':>7}{'loader':>10}{'workers':>9}{'tables':>8}{'seconds':>9}{'pages/s':>10}"
+              f"{'speedup':>9}{'table chunks':>14}{'same':>6}")
+        for path in resolve_pdfs(args.pdf, directory, args.pages, args.table_every):
+            name = os.path.basename(path)[:22]
+            baseline_s, expected = timed(lambda: PyMuPDFLoader(path).load(), args.repeat)
+            pages = len(expected)
+            print(f"{name:<24}{pages:>7}{'PyMuPDF':>10}{1:>9}{'off':>8}{baseline_s:>9.2f}{pages / baseline_s:>10.1f}"
+                  f"{1.0:>9.2f}{'-':>14}{'-':>6}")
+            for workers in args.workers:
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    list(executor.map(pdf_extract.count_pages, [path] * workers))  # start and warm every worker
+                    for tables in (False, True):
+                        seconds, documents = timed(
+                            lambda: extract_in_tasks(path, executor, workers, args.pages_per_task, tables), args.repeat)
+                        table_chunks = sum(1 for document in documents if document.metadata.get("content_type") == "table")
+                        # Table chunks replace part of the page text, so only runs without tables match the loader
+                        same = "-" if tables else "yes" if same_output(expected, documents) else "NO"
+                        print(f"{name:<24}{pages:>7}{'parallel':>10}{workers:>9}{'on' if tables else 'off':>8}"
+                              f"{seconds:>9.2f}{pages / seconds:>10.1f}{baseline_s / seconds:>9.2f}{table_chunks:>14}{same:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDF paths or URLs (default: a synthetic PDF)")
+    parser.add_argument("--pages", type=int, default=500, help="pages of the synthetic PDF")
+    parser.add_argument("--table-every", type=int, default=10, help="synthetic pages per ruled table (0: none)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages-per-task", type=int, default=int(os.getenv("PDF_PAGES_PER_TASK", 16)),
+                        help="pages per parse task (default: PDF_PAGES_PER_TASK or 16)")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
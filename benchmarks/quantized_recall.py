@@ -0,0 +1,90 @@
+"""Recall@k of quantized cache entries (INDEX_QUANTIZATION) against the exact flat index.
+
+For every cached document under embedding_cache/, rebuilds each compressed mode
+from the document's float vectors and compares its top-k with exact search.
+Queries are chunk vectors sampled from the same document, with the query chunk
+itself excluded from both result lists.
+
+    python benchmarks/quantized_recall.py
+    python benchmarks/quantized_recall.py --k 5 10 --queries 200 --rerank-factor 4
+"""
+import argparse
+import os
+import sys
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss_store  # noqa: E402
+
+
+def exact_vectors(entry_path):
+    index, _ = faiss_store.read_vector_index(entry_path, mmap=False)
+    if index.ntotal == 0:
+        return None, None
+    if faiss_store.read_manifest(entry_path)["quantization"] != "none" and not isinstance(index, faiss_store.RerankedIndex):
+        return None, None  # stored without float vectors; nothing exact to compare against
+    return index.reconstruct_n(0, index.ntotal), index.metric_type
+
+
+def search_excluding_self(index, queries, query_ids, k):
+    _, labels = index.search(queries, k + 1)
+    return [[label for label in row if label != query_id][:k] for row, query_id in zip(labels, query_ids)]
+
+
+def main(args):
+    entries = sorted(f for f in os.listdir(args.cache_dir) if f.endswith(".faiss"))
+    modes = [("sq8", 0), ("sq8", args.rerank_factor), ("pq", 0), ("pq", args.rerank_factor)]
+    totals = {(mode, factor, k): [] for mode, factor in modes for k in args.k}
+    bytes_per_vector = {}
+    dimension = None
+    rng = np.random.default_rng(0)
+
+    print(f"{'document':<20}{'chunks':>8}{'mode':>6}{'rerank':>8}{'B/vector':>10}"
+          + "".join(f"{f'recall@{k}':>11}" for k in args.k))
+    for entry in entries:
+        vectors, metric = exact_vectors(os.path.join(args.cache_dir, entry))
+        if vectors is None or len(vectors) <= max(args.k):
+            continue
+        dimension = vectors.shape[1]
+        flat = faiss.IndexFlat(dimension, metric)
+        flat.add(vectors)
+        query_ids = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+        queries = vectors[query_ids]
+        truth = {k: search_excluding_self(flat, queries, query_ids, k) for k in args.k}
+
+        for mode, factor in modes:
+            compressed, _, applied = faiss_store.quantize_index(flat, mode, args.pq_subquantizers)
+            if applied != mode:
+                continue  # too few chunks to train PQ
+            index = faiss_store.RerankedIndex(compressed, vectors, factor) if factor else compressed
+            bytes_per_vector[mode] = compressed.sa_code_size()
+            row = f"{entry[:18]:<20}{len(vectors):>8}{mode:>6}{factor or '-':>8}{compressed.sa_code_size():>10}"
+            for k in args.k:
+                found = search_excluding_self(index, queries, query_ids, k)
+                recalls = [len(set(a) & set(t)) / len(t) for a, t in zip(found, truth[k]) if t]
+                totals[(mode, factor, k)].extend(recalls)
+                row += f"{np.mean(recalls):>11.3f}"
+            print(row)
+
+    if dimension is None:
+        print("No cached documents with float vectors found.")
+        return
+    print(f"\n=== Mean over all queries (float32 = {4 * dimension} B/vector) ===")
+    for mode, factor in modes:
+        if not totals[(mode, factor, args.k[0])]:
+            continue
+        print(f"{mode:>6} rerank={factor or '-':<4} {bytes_per_vector[mode]:>6} B/vector  "
+              + "  ".join(f"recall@{k}={np.mean(totals[(mode, factor, k)]):.3f}" for k in args.k))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cache-dir", default="embedding_cache")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--queries", type=int, default=100, help="sampled query chunks per document")
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--pq-subquantizers", type=int, default=64)
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+"""Document URL identity and HTTP revalidation.
+
+A document URL is normalized before it keys the alias index, so refreshed
+signatures on the same object map to one entry. The validators recorded from
+the response headers decide whether that entry can be reused without
+downloading the body again.
+"""
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# Signed-URL parameters that change on every token refresh without changing the document
+VOLATILE_QUERY_PARAMS = {
+    # Azure SAS
+    'sv', 'st', 'se', 'sr', 'sp', 'sig', 'spr', 'sip', 'si', 'ss', 'srt', 'sdd',
+    'skoid', 'sktid', 'skt', 'ske', 'sks', 'skv',
+    # CloudFront / generic signed URLs
+    'expires', 'signature', 'key-pair-id', 'policy'
+}
+VOLATILE_QUERY_PREFIXES = ('x-amz-', 'x-goog-')
+# Names like 'policy' or 'sp' are ordinary parameters on unsigned URLs, so the volatile
+# ones are only dropped from a URL that carries one of these signatures
+SIGNATURE_QUERY_PARAMS = {'sig', 'signature', 'x-amz-signature', 'x-goog-signature'}
+
+
+def is_volatile_param(name):
+    name = name.lower()
+    return name in VOLATILE_QUERY_PARAMS or name.startswith(VOLATILE_QUERY_PREFIXES)
+
+
+def normalize_document_url(url):
+    """Normalize a document URL so refreshed signatures map to the same alias"""
+    try:
+        parsed = urlparse(url.strip())
+        params = parse_qsl(parsed.query, keep_blank_values=True)
+        signed = any(name.lower() in SIGNATURE_QUERY_PARAMS for name, _ in params)
+        query = sorted((name, value) for name, value in params if not (signed and is_volatile_param(name)))
+        return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, parsed.params, urlencode(query), ''))
+    except Exception:
+        return url
+
+
+def extract_http_validators(headers):
+    """Pick the cache validators (ETag, Last-Modified, Content-Length) out of response headers"""
+    return {
+        "etag": headers.get('ETag'),
+        "last_modified": headers.get('Last-Modified'),
+        "content_length": headers.get('Content-Length')
+    }
+
+
+def validators_match(stored, current):
+    """True only when the validators prove the document has not changed"""
+    if not stored or not current:
+        return False
+    if stored.get("etag") and current.get("etag"):
+        return stored["etag"] == current["etag"]
+    if stored.get("last_modified") and current.get("last_modified"):
+        return (stored["last_modified"] == current["last_modified"]
+                and stored.get("content_length") == current.get("content_length"))
+    return False
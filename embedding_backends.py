@@ -0,0 +1,160 @@
+"""Embedding backends selectable by config (EMBEDDING_MODEL, EMBEDDING_BACKEND).
+
+Every backend goes through sentence-transformers, so a model gets the same
+checkpoint and pooling whichever runtime runs the forward pass:
+
+- torch: the PyTorch model on GPU when available, else CPU
+- onnx-int8: an ONNX Runtime export with dynamic int8 weight quantization, exported
+  once into EMBEDDING_EXPORT_DIR and reused; CPU only
+- openvino: the OpenVINO export of the same model; CPU only
+
+The quantized and smaller models do not produce the same vectors as bge-large on
+torch, so each combination has a tag (backend_tag) that goes into the document cache
+key and the query-embedding memo; entries built by one backend are never searched
+with query vectors from another.
+
+BulkEmbedder embeds a document's chunks at ingestion: chunks are sorted by token
+length and cut into batches under a per-device token budget, so short chunks are
+not padded to the longest one in the document and GPU batches stay full.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+MODELS = {
+    "bge-large": "BAAI/bge-large-en-v1.5",  # 1024 dims
+    "bge-base": "BAAI/bge-base-en-v1.5",    # 768 dims
+    "bge-small": "BAAI/bge-small-en-v1.5",  # 384 dims
+}
+BACKENDS = ("torch", "onnx-int8", "openvino")
+DEFAULT_MODEL = "bge-large"
+DEFAULT_BACKEND = "torch"
+ONNX_QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+# Padded tokens per ingestion batch: 64 x 512-token chunks on a GPU, 16 on CPU
+BATCH_TOKENS = {"cuda": 32768, "cpu": 8192}
+MAX_BATCH_SIZE = 256
+
+
+def check_backend(model_key, backend):
+    if model_key not in MODELS:
+        raise ValueError(f"Unknown embedding model {model_key!r}; expected one of {', '.join(MODELS)}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def backend_tag(model_key, backend):
+    """Identity of the vectors a model/backend pair produces"""
+    check_backend(model_key, backend)
+    return f"{MODELS[model_key]}:{backend}:normalized"
+
+
+# Cache entries written before backends were selectable carry no tag and hold these vectors
+DEFAULT_TAG = backend_tag(DEFAULT_MODEL, DEFAULT_BACKEND)
+
+
+def onnx_int8_file_name(quantization_config):
+    """Where sentence-transformers writes a dynamically quantized export, relative to the model directory"""
+    return f"onnx/model_qint8_{quantization_config}.onnx"
+
+
+def export_onnx_int8(model_key, export_dir, quantization_config="avx512_vnni"):
+    """Export model_key to ONNX with int8 dynamic quantization, once; returns the model directory.
+
+    The export is built in a temp directory and renamed into place, so workers
+    starting together never load a half-written model.
+    """
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    model_dir = os.path.join(export_dir, f"{model_key}-onnx")
+    file_name = onnx_int8_file_name(quantization_config)
+    if os.path.exists(os.path.join(model_dir, file_name)):
+        return model_dir
+
+    os.makedirs(export_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=export_dir, prefix=f".{model_key}-onnx.")
+    try:
+        model = SentenceTransformer(MODELS[model_key], backend="onnx", device="cpu")
+        model.save_pretrained(tmp_dir)
+        export_dynamic_quantized_onnx_model(model, quantization_config, tmp_dir)
+        try:
+            os.replace(tmp_dir, model_dir)
+            return model_dir
+        except OSError:
+            # Another worker's export (or one for another CPU config) got there first
+            if not os.path.isdir(model_dir):
+                raise
+        if not os.path.exists(os.path.join(model_dir, file_name)):
+            # Exported earlier for another CPU config: add this quantization next to it
+            partial_path = os.path.join(model_dir, f"{file_name}.{os.getpid()}.tmp")
+            shutil.copy2(os.path.join(tmp_dir, file_name), partial_path)
+            os.replace(partial_path, os.path.join(model_dir, file_name))
+        return model_dir
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_embeddings(model_key=DEFAULT_MODEL, backend=DEFAULT_BACKEND, device="cpu",
+                    export_dir="embedding_models", quantization_config="avx512_vnni"):
+    """HuggingFaceEmbeddings for a model/backend pair; vectors are always L2-normalized"""
+    check_backend(model_key, backend)
+    encode_kwargs = {"normalize_embeddings": True}
+    if backend == "torch":
+        return HuggingFaceEmbeddings(model_name=MODELS[model_key], model_kwargs={"device": device},
+                                     encode_kwargs=encode_kwargs)
+    if backend == "openvino":
+        return HuggingFaceEmbeddings(model_name=MODELS[model_key],
+                                     model_kwargs={"backend": "openvino", "device": "cpu"},
+                                     encode_kwargs=encode_kwargs)
+
+    if quantization_config not in ONNX_QUANTIZATION_CONFIGS:
+        raise ValueError(f"Unknown ONNX quantization config {quantization_config!r}; "
+                         f"expected one of {', '.join(ONNX_QUANTIZATION_CONFIGS)}")
+    model_dir = export_onnx_int8(model_key, export_dir, quantization_config)
+    return HuggingFaceEmbeddings(
+        model_name=model_dir,
+        model_kwargs={"backend": "onnx", "device": "cpu",
+                      "model_kwargs": {"file_name": onnx_int8_file_name(quantization_config)}},
+        encode_kwargs=encode_kwargs
+    )
+
+
+class BulkEmbedder:
+    """Length-bucketed batch embedding of many texts through a HuggingFaceEmbeddings model"""
+
+    def __init__(self, embeddings, device="cpu", batch_tokens=0):
+        self.model = embeddings.client  # the SentenceTransformer
+        self.encode_kwargs = embeddings.encode_kwargs
+        self.batch_tokens = batch_tokens or BATCH_TOKENS.get(device.split(":")[0], BATCH_TOKENS["cpu"])
+
+    def token_lengths(self, texts):
+        encoded = self.model.tokenizer(texts, truncation=True, max_length=self.model.max_seq_length,
+                                       return_attention_mask=False, return_token_type_ids=False)
+        return np.array([len(ids) for ids in encoded["input_ids"]])
+
+    def batches(self, texts):
+        """Positions of texts grouped into batches of similar token length, shortest first"""
+        lengths = self.token_lengths(texts)
+        order = np.argsort(lengths, kind="stable")
+        batch = []
+        for position in order:
+            # Sorted ascending, so this text sets the padded length of the whole batch
+            if batch and ((len(batch) + 1) * lengths[position] > self.batch_tokens or len(batch) == MAX_BATCH_SIZE):
+                yield batch
+                batch = []
+            batch.append(int(position))
+        if batch:
+            yield batch
+
+    def embed_batches(self, texts):
+        """Yield (positions, vectors) per batch as each one finishes"""
+        # Same preprocessing as HuggingFaceEmbeddings.embed_documents, so vectors match query embeddings
+        texts = [text.replace("\n", " ") for text in texts]
+        for positions in self.batches(texts):
+            vectors = self.model.encode([texts[position] for position in positions], batch_size=len(positions),
+                                        show_progress_bar=False, convert_to_numpy=True, **self.encode_kwargs)
+            yield positions, vectors.astype(np.float32, copy=False)
@@ -0,0 +1,532 @@
+"""On-disk layout of cached FAISS vectorstores.
+
+Index files are always replaced atomically (write to a temp file, then os.replace),
+never rewritten in place, so they can be memory-mapped read-only: every uvicorn
+worker that opens the same index shares its page-cache pages instead of holding a
+private copy, and a concurrent save never truncates a file another worker has mapped.
+
+Large documents get an approximate index structure (IVF, then HNSW, by chunk count)
+instead of exact flat search. Quantized entries (opt-in) store an int8 scalar-quantized or product-quantized
+index plus the float vectors in vectors.npy; searches shortlist candidates on the
+compressed codes and re-rank them exactly against the memory-mapped floats, so only
+the codes are private memory. index.json records how the entry was built.
+
+Chunks are kept next to the index in a columnar chunk store instead of a pickled
+docstore: all chunk texts in one UTF-8 blob with an offsets array, and metadata as
+dictionary-encoded columns. Row i of the index is chunk i, and a Document is only
+built when a search returns it.
+
+A new entry is written into a temp directory and renamed into place only when
+complete (commit_directory), so a crash mid-save never leaves a half-written entry
+that a worker could load; staging directories a crash leaves behind are swept at
+startup (sweep_staging_directories). Ingestion of a large document checkpoints its embedded
+batches in a sibling directory (IngestionCheckpoint) so a retry resumes from them; one
+abandoned for much longer, and not under ingestion, is swept too (sweep_ingestion_checkpoints).
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+
+INDEX_FILE = "index.faiss"
+INDEX_MANIFEST_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "sq8", "pq")
+PQ_MIN_VECTORS = 1024  # fewer vectors can't train 256 centroids per sub-quantizer well
+CHUNK_TEXT_FILE = "chunks.bin"
+CHUNK_OFFSETS_FILE = "chunks.offsets.npy"
+CHUNK_METADATA_FILE = "chunks.meta.npz"
+
+# IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat codes zero-copy; plain IO_FLAG_MMAP
+# only maps inverted lists and still copies IndexFlat codes into RAM.
+ZERO_COPY_MMAP = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+MMAP_FLAGS = (faiss.IO_FLAG_MMAP_IFC if ZERO_COPY_MMAP else faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def replace_file(path, write):
+    """Call write(tmp_path) and atomically move the result to path"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def commit_directory(tmp_dir, directory):
+    """Publish a fully written directory at directory by renaming it into place.
+
+    An existing directory is renamed aside first and removed after the swap;
+    processes that have its files mapped keep reading them until they close.
+    """
+    if not os.path.exists(directory):
+        os.replace(tmp_dir, directory)
+        return
+    retired = tempfile.mkdtemp(dir=os.path.dirname(directory) or ".", prefix=".retired-")
+    os.replace(directory, os.path.join(retired, "entry"))
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+STAGING_PREFIXES = (".building-", ".retired-")
+
+
+def sweep_staging_directories(directory, min_age_seconds):
+    """Remove staging directories left by crashed saves and commits; returns how many were removed.
+
+    Only directories untouched for min_age_seconds go, so a save still running in another
+    worker keeps its staging directory.
+    """
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if name.startswith(STAGING_PREFIXES) and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path)
+                removed += 1
+        except OSError:
+            continue  # gone already, or removed by another worker sweeping at the same time
+    return removed
+
+
+CHECKPOINT_SUFFIX = ".partial"
+
+
+def sweep_ingestion_checkpoints(directory, min_age_seconds, try_lock):
+    """Remove ingestion checkpoints (<entry>.partial) untouched for min_age_seconds; returns how many were removed.
+
+    try_lock(entry_path) takes the entry's ingestion lock without waiting and returns the
+    callable that releases it, or None while an ingestion holds it; that checkpoint is kept,
+    however old it is.
+    """
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if not (name.endswith(CHECKPOINT_SUFFIX) and os.path.isdir(path) and os.path.getmtime(path) < cutoff):
+                continue
+            release = try_lock(path[:-len(CHECKPOINT_SUFFIX)])
+            if release is None:
+                continue
+            try:
+                shutil.rmtree(path)
+                removed += 1
+            finally:
+                release()
+        except OSError:
+            continue
+    return removed
+
+
+def write_index(index, path):
+    replace_file(path, lambda tmp_path: faiss.write_index(index, tmp_path))
+
+
+def read_index(path, mmap=True):
+    """Read a FAISS index, memory-mapped when requested.
+
+    Returns (index, mapped) where mapped tells whether the vectors stay in the page
+    cache rather than process memory. Mapped indexes are read-only.
+    """
+    if mmap:
+        try:
+            index = faiss.read_index(path, MMAP_FLAGS)
+            return index, ZERO_COPY_MMAP or faiss.try_extract_index_ivf(index) is not None
+        except RuntimeError:
+            # Index types without mmap support fall back to a regular read
+            pass
+    return faiss.read_index(path), False
+
+
+class RerankedIndex:
+    """Compressed FAISS index whose shortlist is re-ranked with exact float distances.
+
+    Implements the subset of the faiss.Index interface that LangChain's FAISS wrapper
+    and the batched retrieval use: search, reconstruct, reconstruct_n, ntotal, d, metric_type.
+    """
+
+    def __init__(self, compressed, vectors, rerank_factor):
+        self.compressed = compressed
+        self.vectors = vectors  # float32 (ntotal, d), usually a read-only memmap
+        self.rerank_factor = rerank_factor
+        self.d = compressed.d
+        self.metric_type = compressed.metric_type
+        self.is_trained = True
+
+    @property
+    def ntotal(self):
+        return self.compressed.ntotal
+
+    def search(self, x, k):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        inner_product = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        _, shortlists = self.compressed.search(x, min(self.ntotal, k * self.rerank_factor))
+        distances = np.full((len(x), k), -np.inf if inner_product else np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        for row, (query, candidates) in enumerate(zip(x, shortlists)):
+            # Sorted row order keeps the memmap reads sequential
+            candidates = np.sort(candidates[candidates >= 0])
+            exact = np.asarray(self.vectors[candidates], dtype=np.float32)
+            if inner_product:
+                scores = exact @ query
+                order = np.argsort(-scores)[:k]
+            else:
+                scores = ((exact - query) ** 2).sum(axis=1)
+                order = np.argsort(scores)[:k]
+            distances[row, :len(order)] = scores[order]
+            labels[row, :len(order)] = candidates[order]
+        return distances, labels
+
+    def reconstruct(self, key):
+        return np.array(self.vectors[key], dtype=np.float32)
+
+    def reconstruct_n(self, start, n):
+        return np.array(self.vectors[start:start + n], dtype=np.float32)
+
+
+def choose_index_type(ntotal, ivf_min_vectors, hnsw_min_vectors):
+    """Exact flat search for small documents, IVF for mid-sized ones, HNSW for the largest"""
+    if ntotal >= hnsw_min_vectors:
+        return "hnsw"
+    if ntotal >= ivf_min_vectors:
+        return "ivf"
+    return "flat"
+
+
+def code_bytes_per_vector(index):
+    """Size of one stored code; HNSW keeps its codes in a storage index, and some types have no codec"""
+    try:
+        return getattr(index, "storage", index).sa_code_size()
+    except RuntimeError:
+        return index.d * 4
+
+
+def build_index(vectors, metric, index_type="flat", quantization="none", pq_subquantizers=64, hnsw_m=32,
+                hnsw_ef_construction=80):
+    """Build a cache index over float vectors.
+
+    index_type picks the structure (flat, ivf, hnsw) and quantization the stored codes
+    (none, sq8, pq). Returns (index, params) where params are the build settings to persist;
+    PQ falls back to sq8 when there are too few vectors to train it, the dimension
+    doesn't split evenly, or the structure can't keep the metric (HNSW over PQ is L2-only).
+    """
+    ntotal, dimension = vectors.shape
+    if quantization == "pq" and (ntotal < PQ_MIN_VECTORS or dimension % pq_subquantizers):
+        quantization = "sq8"
+    codes = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{pq_subquantizers}"}[quantization]
+    params = {"index_type": index_type, "quantization": quantization}
+    if quantization == "pq":
+        params["pq_subquantizers"] = pq_subquantizers
+    
+    if index_type == "ivf":
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+        nlist = int(max(1, min(4 * np.sqrt(ntotal), ntotal // 39)))
+        factory = f"IVF{nlist},{codes}"
+        params["nlist"] = nlist
+    elif index_type == "hnsw":
+        factory = f"HNSW{hnsw_m}" if quantization == "none" else f"HNSW{hnsw_m}_{codes}"
+        params.update(hnsw_m=hnsw_m, hnsw_ef_construction=hnsw_ef_construction)
+    else:
+        factory = codes
+    params["factory"] = factory
+    
+    index = faiss.index_factory(dimension, factory, metric)
+    if index.metric_type != metric:
+        return build_index(vectors, metric, index_type, "sq8", pq_subquantizers, hnsw_m, hnsw_ef_construction)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = hnsw_ef_construction
+    index.train(vectors)
+    index.add(vectors)
+    if index_type == "ivf":
+        # LangChain's MMR reconstructs result vectors by id
+        faiss.extract_index_ivf(index).make_direct_map()
+    params["code_bytes_per_vector"] = code_bytes_per_vector(index)
+    return index, params
+
+
+def apply_search_params(index, params):
+    """Set persisted query-time parameters (IVF nprobe, HNSW efSearch) on a loaded index"""
+    if isinstance(index, RerankedIndex):
+        index = index.compressed
+    if params.get("nprobe"):
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    if params.get("hnsw_ef_search"):
+        index.hnsw.efSearch = params["hnsw_ef_search"]
+
+
+def quantize_index(index, quantization, pq_subquantizers=64):
+    """Build a compressed flat copy of a float index: "sq8" (int8 per dimension) or "pq".
+
+    Returns (compressed_index, float_vectors, applied_quantization).
+    """
+    vectors = index.reconstruct_n(0, index.ntotal)
+    compressed, params = build_index(vectors, index.metric_type, "flat", quantization, pq_subquantizers)
+    return compressed, vectors, params["quantization"]
+
+
+def write_vector_index(directory, index, index_type="flat", quantization="none", rerank_factor=4,
+                       pq_subquantizers=64, ivf_nprobe=0, hnsw_m=32, hnsw_ef_search=64):
+    """Write a cache entry's index built from a flat float index; returns its manifest.
+
+    The manifest (index.json) holds the build and search parameters, so the entry is
+    read back exactly as it was built whatever the current settings are.
+    """
+    vectors_path = os.path.join(directory, VECTORS_FILE)
+    manifest = {"index_type": "flat", "quantization": "none", "factory": "Flat"}
+    if index.ntotal and (index_type != "flat" or quantization != "none"):
+        vectors = index.reconstruct_n(0, index.ntotal)
+        index, params = build_index(vectors, index.metric_type, index_type, quantization, pq_subquantizers, hnsw_m)
+        manifest.update(params)
+        if index_type == "ivf":
+            manifest["nprobe"] = ivf_nprobe or max(1, manifest["nlist"] // 8)
+        elif index_type == "hnsw":
+            manifest["hnsw_ef_search"] = hnsw_ef_search
+        apply_search_params(index, manifest)
+    manifest.update(ntotal=index.ntotal, dimension=index.d,
+                    metric="ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2")
+    
+    # Quantized codes only shortlist; exact float vectors re-rank the shortlist
+    reranked = manifest["quantization"] != "none" and rerank_factor > 0
+    if reranked:
+        manifest["rerank_factor"] = rerank_factor
+        def write_vectors(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, vectors)
+        replace_file(vectors_path, write_vectors)
+    write_index(index, os.path.join(directory, INDEX_FILE))
+    
+    def write_manifest(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    replace_file(os.path.join(directory, INDEX_MANIFEST_FILE), write_manifest)
+    if not reranked and os.path.exists(vectors_path):
+        os.remove(vectors_path)
+    return manifest
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, INDEX_MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"index_type": "flat", "quantization": "none"}
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_vector_index(directory, mmap=True):
+    """Read a cache entry's index as written by write_vector_index; returns (index, mapped)"""
+    manifest = read_manifest(directory)
+    index, mapped = read_index(os.path.join(directory, INDEX_FILE), mmap=mmap)
+    apply_search_params(index, manifest)
+    if manifest["quantization"] != "none" and manifest.get("rerank_factor"):
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        index = RerankedIndex(index, vectors, manifest["rerank_factor"])
+    return index, mapped
+
+
+def resident_vector_bytes(index, mapped=False):
+    """Private memory held by an index's codes; re-rank vectors are memory-mapped and not counted"""
+    if mapped:
+        return 0
+    if isinstance(index, RerankedIndex):
+        index = index.compressed
+    code_bytes = code_bytes_per_vector(index)
+    hnsw = getattr(index, "hnsw", None)
+    # HNSW graph links: ~2*M neighbour ids on the base layer
+    link_bytes = 2 * hnsw.nb_neighbors(0) * 4 if hnsw is not None else 0
+    return index.ntotal * (code_bytes + link_bytes)
+
+
+def has_chunk_store(directory):
+    return all(os.path.exists(os.path.join(directory, name))
+               for name in (CHUNK_TEXT_FILE, CHUNK_OFFSETS_FILE, CHUNK_METADATA_FILE))
+
+
+def _encode_column(documents, name):
+    """Dictionary-encode one metadata key: per-chunk int32 codes into a list of distinct JSON values"""
+    dictionary = {}
+    codes = np.full(len(documents), -1, dtype=np.int32)  # -1: key absent from this chunk
+    for position, document in enumerate(documents):
+        if name in document.metadata:
+            value = json.dumps(document.metadata[name], sort_keys=True, default=str)
+            codes[position] = dictionary.setdefault(value, len(dictionary))
+    return codes, list(dictionary)
+
+
+def write_chunk_store(directory, documents):
+    """Write documents, in index row order, as a chunk store"""
+    encoded = [document.page_content.encode("utf-8") for document in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    
+    names = sorted({name for document in documents for name in document.metadata})
+    arrays = {}
+    columns = []
+    for column, name in enumerate(names):
+        arrays[f"codes_{column}"], values = _encode_column(documents, name)
+        columns.append({"name": name, "values": values})
+    arrays["columns"] = np.array(json.dumps(columns))
+    
+    def write_text(tmp_path):
+        with open(tmp_path, "wb") as f:
+            for text in encoded:
+                f.write(text)
+    
+    def write_offsets(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, offsets)
+    
+    def write_metadata(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+    
+    replace_file(os.path.join(directory, CHUNK_TEXT_FILE), write_text)
+    replace_file(os.path.join(directory, CHUNK_METADATA_FILE), write_metadata)
+    # Offsets last: they define the chunk count readers see
+    replace_file(os.path.join(directory, CHUNK_OFFSETS_FILE), write_offsets)
+
+
+class ChunkStore(Docstore):
+    """Read-only docstore over a chunk store; ids are index row numbers as strings"""
+
+    def __init__(self, directory):
+        self.offsets = np.load(os.path.join(directory, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, CHUNK_TEXT_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        with np.load(os.path.join(directory, CHUNK_METADATA_FILE), allow_pickle=False) as metadata:
+            columns = json.loads(str(metadata["columns"]))
+            self._columns = [
+                (column["name"], metadata[f"codes_{index}"], [json.loads(value) for value in column["values"]])
+                for index, column in enumerate(columns)
+            ]
+        # Text and offsets stay in the page cache; only the metadata columns are private memory
+        self.resident_bytes = sum(codes.nbytes for _, codes, _ in self._columns)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, position):
+        return bytes(self._text[int(self.offsets[position]):int(self.offsets[position + 1])]).decode("utf-8")
+
+    def metadata(self, position):
+        return {name: values[codes[position]] for name, codes, values in self._columns if codes[position] >= 0}
+
+    def search(self, search):
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        return Document(page_content=self.text(position), metadata=self.metadata(position))
+
+
+class RowIds(Mapping):
+    """index_to_docstore_id for a chunk store: row i maps to chunk id str(i), without a dict per row"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.size:
+            raise KeyError(row)
+        return str(row)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+def chunk_digest(document):
+    """16-byte hash of a chunk's text and metadata; a checkpointed vector is only reused for the same chunk"""
+    digest = hashlib.sha256(document.page_content.encode("utf-8"))
+    digest.update(json.dumps(document.metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.digest()[:16]
+
+
+class IngestionCheckpoint:
+    """Embedded chunks of an unfinished ingestion, saved every few batches so a retry resumes.
+
+    Chunks are numbered in the order ingestion produces them, which is deterministic
+    for a document. Each save writes one segment file (positions, chunk digests and
+    vectors) atomically; a retry reuses a saved vector only when the chunk at that
+    position has the same digest, so a changed chunking re-embeds instead of mixing
+    vectors of different chunks.
+    """
+
+    def __init__(self, directory, every_batches):
+        self.directory = directory
+        self.every_batches = every_batches
+        self._saved = {}  # position -> (digest, vector) from earlier attempts
+        self._pending = []  # (positions, digests, vectors) not yet written
+        self._segments = 0
+
+    def load(self):
+        """Read the segments of earlier attempts; returns how many chunks they cover"""
+        try:
+            segments = sorted(name for name in os.listdir(self.directory) if name.startswith("segment-"))
+        except OSError:
+            segments = []
+        for name in segments:
+            try:
+                with np.load(os.path.join(self.directory, name), allow_pickle=False) as segment:
+                    # Later segments win: they re-embedded chunks whose digest changed
+                    for position, digest, vector in zip(segment["positions"], segment["digests"], segment["vectors"]):
+                        self._saved[int(position)] = (digest.tobytes(), vector)
+            except (OSError, ValueError, KeyError):
+                continue  # unreadable segment: its chunks are embedded again
+        self._segments = len(segments)
+        return len(self._saved)
+
+    def saved_vector(self, position, digest):
+        saved = self._saved.get(position)
+        return saved[1] if saved is not None and saved[0] == digest else None
+
+    def add(self, positions, digests, vectors):
+        """Record one embedded batch; every every_batches batches are written as a segment"""
+        digests = np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(-1, 16)
+        self._pending.append((np.asarray(positions, dtype=np.int64), digests, vectors))
+        if len(self._pending) >= self.every_batches:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        positions, digests, vectors = (np.concatenate(column) for column in zip(*self._pending))
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, positions=positions, digests=digests, vectors=vectors)
+        replace_file(os.path.join(self.directory, f"segment-{self._segments:06d}.npz"), write)
+        self._segments += 1
+        self._pending = []
+
+    def discard(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
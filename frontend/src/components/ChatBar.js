@@ -1,5 +1,4 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 
 const ChatBar = () => {
   const [url, setUrl] = useState('');
@@ -21,14 +20,47 @@ const ChatBar = () => {
     setHistory(newHistory);
 
     try {
-      const response = await axios.post('http://localhost:8000/hackrx/run', {
-        documents: url,
-        questions: [question],
+      // Stream the answer token by token instead of waiting for the whole request
+      const response = await fetch('http://localhost:8000/hackrx/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ documents: url, questions: [question], stream: true }),
       });
-      const answer = response.data.answers[0];
-      setHistory([...newHistory, { type: 'bot', message: answer }]);
+      if (!response.ok) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let partial = '';
+      const showAnswer = (message) => setHistory([...newHistory, { type: 'bot', message }]);
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const name = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+          if (name === 'token') {
+            partial += data.token;
+            showAnswer(partial);
+          } else if (name === 'reset') {
+            // The LLM call is retried and streams its answer again from the start
+            partial = '';
+            showAnswer(partial);
+          } else if (name === 'answer') {
+            showAnswer(data.answer);
+          } else if (name === 'error') {
+            throw new Error(data.error);
+          }
+        }
+      }
     } catch (err) {
-      const errorMessage = err.response ? err.response.data.error : 'An unexpected error occurred.';
+      const errorMessage = err.message || 'An unexpected error occurred.';
       setError(errorMessage);
       setHistory([...newHistory, { type: 'bot', message: `Error: ${errorMessage}` }]);
     } finally {
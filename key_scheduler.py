@@ -0,0 +1,145 @@
+"""Per-key scheduling of LLM calls across the NVIDIA_KEYS pool.
+
+Each call reserves the least-loaded healthy key: fewest calls in flight, then
+fewest tokens spent in the last minute. A key is skipped while it is at its
+concurrency limit, over its per-minute token budget, cooling down after a 429,
+or while its circuit is open after repeated server-side failures.
+
+Only the key's own faults count toward its circuit: transport errors and 5xx
+responses. A 4xx other than 429 means the request itself was rejected (an
+oversized context, a malformed payload), so it fails that request without
+taking a healthy key out of rotation.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class NvidiaKeyState:
+    """Load, throttling and circuit-breaker state of one API key"""
+
+    def __init__(self, label, value):
+        self.label = label
+        self.value = value
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.blocked_until = 0.0
+        self.token_log = deque()  # (timestamp, tokens) within the last minute
+        self.requests = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def tokens_last_minute(self, now):
+        while self.token_log and now - self.token_log[0][0] > 60:
+            self.token_log.popleft()
+        return sum(tokens for _, tokens in self.token_log)
+
+    def is_available(self, now, estimated_tokens, max_concurrency, tokens_per_minute):
+        if now < self.blocked_until or self.in_flight >= max_concurrency:
+            return False
+        if tokens_per_minute and self.tokens_last_minute(now) + estimated_tokens > tokens_per_minute:
+            # Always let an idle key through so one oversized prompt can't starve forever
+            return self.in_flight == 0 and not self.token_log
+        return True
+
+
+class NvidiaKeyScheduler:
+    """Dispatch each LLM call to the least-loaded healthy key"""
+
+    def __init__(self, keys, max_concurrency=8, tokens_per_minute=0, failure_threshold=3, cooldown_seconds=30):
+        self.keys = [NvidiaKeyState(label, value) for label, value in keys if value]
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute  # 0 = unlimited
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._changed = asyncio.Condition()
+
+    def has_keys(self):
+        return bool(self.keys)
+
+    def _pick(self, now, estimated_tokens):
+        candidates = [key for key in self.keys
+                      if key.is_available(now, estimated_tokens, self.max_concurrency, self.tokens_per_minute)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda key: (key.in_flight, key.tokens_last_minute(now), key.requests))
+
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens=0):
+        """Reserve a key for one call, waiting while every key is busy, throttled or open"""
+        async with self._changed:
+            while True:
+                now = time.monotonic()
+                key = self._pick(now, estimated_tokens)
+                if key is not None:
+                    break
+                reopen = [k.blocked_until - now for k in self.keys if k.blocked_until > now]
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=min(reopen) if reopen else 1.0)
+                except asyncio.TimeoutError:
+                    pass
+            key.in_flight += 1
+            key.requests += 1
+            key.token_log.append((now, estimated_tokens))
+        try:
+            yield key
+        finally:
+            async with self._changed:
+                key.in_flight -= 1
+                self._changed.notify_all()
+
+    def record_success(self, key, estimated_tokens=0, actual_tokens=None):
+        key.consecutive_failures = 0
+        if actual_tokens:
+            # Correct the budget reservation with the usage the API reported
+            key.token_log.append((time.monotonic(), actual_tokens - estimated_tokens))
+
+    def record_throttled(self, key, retry_after=None):
+        """Back off a key that returned 429, honouring Retry-After when given"""
+        key.throttled += 1
+        try:
+            delay = float(retry_after) if retry_after else self.cooldown_seconds / 3
+        except ValueError:
+            delay = self.cooldown_seconds / 3
+        key.blocked_until = max(key.blocked_until, time.monotonic() + delay)
+        logger.warning(f"⏳ {key.label} throttled, cooling down for {delay:.0f}s")
+
+    def record_failure(self, key):
+        """Count a failed call and open the circuit after repeated failures"""
+        key.failures += 1
+        key.consecutive_failures += 1
+        if key.consecutive_failures >= self.failure_threshold:
+            key.blocked_until = time.monotonic() + self.cooldown_seconds
+            # Half-open: the next call after the cooldown is a single trial
+            key.consecutive_failures = self.failure_threshold - 1
+            logger.warning(f"🔌 Circuit open for {key.label} for {self.cooldown_seconds:.0f}s")
+
+    def record_error_status(self, key, status_code, retry_after=None):
+        """Account a non-200 response to the key that returned it; 4xx other than 429 leave the key untouched"""
+        if status_code == 429:
+            self.record_throttled(key, retry_after)
+        elif status_code >= 500:
+            self.record_failure(key)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            key.label: {
+                "in_flight": key.in_flight,
+                "requests": key.requests,
+                "throttled": key.throttled,
+                "failures": key.failures,
+                "tokens_last_minute": key.tokens_last_minute(now),
+                "available": now >= key.blocked_until
+            }
+            for key in self.keys
+        }
+
+
+def is_request_rejected(status_code):
+    """4xx other than 429: the payload was refused, so neither a retry nor another key will help"""
+    return 400 <= status_code < 500 and status_code != 429
@@ -0,0 +1,66 @@
+"""Convert cached vectorstores from Euclidean (L2) to normalized inner-product indexes.
+
+Entries built before INDEX_METRIC=ip store raw vectors in an L2 index. This rewrites
+each one in place: vectors are L2-normalized and re-added to an inner-product index of
+the same type (flat, IVF, HNSW) and quantization, as recorded in its index.json. Chunk
+stores are untouched, and every file is replaced atomically, so the server can keep
+running; workers pick up the converted index on their next load from disk.
+
+    python migrate_index_metric.py                  # migrate embedding_cache/
+    python migrate_index_metric.py --dry-run
+    python migrate_index_metric.py --cache-dir /path/to/embedding_cache
+
+Entries quantized without re-rank vectors have no float copy to convert; delete them
+and they will be re-ingested on the next request for their document.
+"""
+import argparse
+import os
+
+import faiss
+
+import faiss_store
+
+
+def migrate_entry(entry_path, dry_run=False):
+    manifest = faiss_store.read_manifest(entry_path)
+    index, _ = faiss_store.read_vector_index(entry_path, mmap=False)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return "already ip"
+    if manifest["quantization"] != "none" and not isinstance(index, faiss_store.RerankedIndex):
+        return "skipped: no float vectors, delete to re-ingest"
+    if dry_run:
+        return f"would migrate {index.ntotal} vectors ({manifest.get('factory', 'Flat')})"
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    faiss.normalize_L2(vectors)
+    normalized = faiss.IndexFlatIP(index.d)
+    normalized.add(vectors)
+    migrated = faiss_store.write_vector_index(
+        entry_path, normalized,
+        index_type=manifest.get("index_type", "flat"),
+        quantization=manifest.get("quantization", "none"),
+        rerank_factor=manifest.get("rerank_factor", 4),
+        pq_subquantizers=manifest.get("pq_subquantizers", 64),
+        ivf_nprobe=manifest.get("nprobe", 0),
+        hnsw_m=manifest.get("hnsw_m", 32),
+        hnsw_ef_search=manifest.get("hnsw_ef_search", 64)
+    )
+    return f"migrated {index.ntotal} vectors ({migrated['factory']}, {migrated['metric']})"
+
+
+def main(args):
+    entries = sorted(f for f in os.listdir(args.cache_dir) if f.endswith(".faiss"))
+    print(f"🔄 Checking {len(entries)} cache entries in {args.cache_dir}")
+    for entry in entries:
+        try:
+            status = migrate_entry(os.path.join(args.cache_dir, entry), args.dry_run)
+        except Exception as e:
+            status = f"failed: {e}"
+        print(f"{entry}: {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cache-dir", default="embedding_cache")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    main(parser.parse_args())
@@ -0,0 +1,160 @@
+"""Page-parallel PDF text extraction with PyMuPDF.
+
+PyMuPDFLoader walks every page of a PDF in one thread. Here the page range is cut
+into fixed slices (PDF_PAGES_PER_TASK pages in the server), each extracted by
+extract_pages in a parse-pool process with its own fitz document, and the slices
+are consumed back in page order. Each
+page becomes one Document with the same text and metadata (source, file_path,
+page, total_pages, plus the PDF's string/int metadata) as PyMuPDFLoader emits.
+
+With tables=True, tables found by PyMuPDF's find_tables are taken out of the page
+text and emitted as their own Documents (content_type "table"): groups of rows as a
+markdown table, each group repeating the header row, so a chunk retrieved on its own
+still says which column is Plan A and which is Plan B. find_tables costs far more
+than the page text, so it only runs on pages whose rulings form a grid (has_rulings);
+its default "lines" strategy finds nothing elsewhere.
+"""
+import fitz  # PyMuPDF
+from langchain.schema import Document
+
+# Below the smallest ingestion chunk_size, so the splitter keeps each table chunk whole
+TABLE_CHUNK_CHARS = 1200
+TABLES_SUPPORTED = hasattr(fitz.Page, "find_tables")  # PyMuPDF >= 1.23
+# Distinct horizontal and distinct vertical rulings a page must draw before find_tables runs
+TABLE_MIN_RULINGS = 2
+# A rectangle or line spanning this much of the page is a page border, not a table ruling
+PAGE_BORDER_FRACTION = 0.9
+
+
+def count_pages(file_path):
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+
+def page_metadata(doc, file_path, page_number):
+    return dict(
+        {
+            "source": file_path,
+            "file_path": file_path,
+            "page": page_number,
+            "total_pages": doc.page_count,
+        },
+        **{key: value for key, value in doc.metadata.items() if isinstance(value, (str, int))}
+    )
+
+
+def _cell(value):
+    return " ".join((value or "").split())
+
+
+def _markdown_row(cells):
+    return "| " + " | ".join(cell.replace("|", "/") for cell in cells) + " |"
+
+
+def table_chunks(table, table_number, page_number):
+    """Markdown texts of a table's rows in groups of about TABLE_CHUNK_CHARS, each with the header row"""
+    rows = [[_cell(value) for value in row] for row in table.extract()]
+    if table.header.external:
+        names = table.header.names
+    elif rows:
+        names, rows = rows[0], rows[1:]
+    else:
+        return []
+    header = [_cell(name) or f"Column {index + 1}" for index, name in enumerate(names)]
+    heading = "\n".join([_markdown_row(header), _markdown_row(["---"] * len(header))])
+
+    chunks = []
+    group, first_row, size = [], 1, 0
+    for number, row in enumerate(rows, start=1):
+        line = _markdown_row(row)
+        if group and size + len(line) > TABLE_CHUNK_CHARS:
+            chunks.append((first_row, number - 1, group))
+            group, first_row, size = [], number, 0
+        group.append(line)
+        size += len(line) + 1
+    if group:
+        chunks.append((first_row, len(rows), group))
+    return [(f"Table {table_number} on page {page_number + 1}, rows {first}-{last}:\n{heading}\n" + "\n".join(lines),
+             f"{first}-{last}")
+            for first, last, lines in chunks]
+
+
+def _ruling(x0, y0, x1, y1):
+    """("h", y) or ("v", x) for an axis-aligned segment, None for slanted lines and dots"""
+    if abs(y1 - y0) < 1 <= abs(x1 - x0):
+        return "h", round(y0)
+    if abs(x1 - x0) < 1 <= abs(y1 - y0):
+        return "v", round(x0)
+    return None
+
+
+def has_rulings(page, min_rulings=TABLE_MIN_RULINGS):
+    """Whether the page's vector graphics draw a grid: min_rulings distinct horizontal and vertical rulings each.
+
+    Rectangles and lines that span most of the page are borders and don't count, so a framed
+    page with a rule under its heading is not mistaken for a table.
+    """
+    page_width, page_height = page.rect.width, page.rect.height
+    rulings = {"h": set(), "v": set()}
+    for drawing in page.get_cdrawings():
+        for item in drawing["items"]:
+            if item[0] in ("re", "qu"):
+                rect = fitz.Rect(item[1]) if item[0] == "re" else fitz.Quad(item[1]).rect
+                if (rect.width >= PAGE_BORDER_FRACTION * page_width
+                        and rect.height >= PAGE_BORDER_FRACTION * page_height):
+                    continue
+                edges = [(rect.x0, rect.y0, rect.x1, rect.y0), (rect.x0, rect.y1, rect.x1, rect.y1),
+                         (rect.x0, rect.y0, rect.x0, rect.y1), (rect.x1, rect.y0, rect.x1, rect.y1)]
+            elif item[0] == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if (abs(x1 - x0) >= PAGE_BORDER_FRACTION * page_width
+                        or abs(y1 - y0) >= PAGE_BORDER_FRACTION * page_height):
+                    continue
+                edges = [(x0, y0, x1, y1)]
+            else:
+                continue
+            for edge in edges:
+                ruling = _ruling(*edge)
+                if ruling:
+                    rulings[ruling[0]].add(ruling[1])
+            if len(rulings["h"]) >= min_rulings and len(rulings["v"]) >= min_rulings:
+                return True
+    return False
+
+
+def _text_outside(page, rects):
+    """Page text without the blocks that sit inside any of rects"""
+    blocks = []
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        center = fitz.Point((x0 + x1) / 2, (y0 + y1) / 2)
+        if block_type == 0 and not any(center in rect for rect in rects):
+            blocks.append(text)
+    return "".join(text if text.endswith("\n") else text + "\n" for text in blocks)
+
+
+def extract_page(doc, file_path, page_number, tables=False):
+    """The page's text Document, followed by one Document per table chunk when tables is set"""
+    page = doc[page_number]
+    metadata = page_metadata(doc, file_path, page_number)
+    found = page.find_tables().tables if tables and TABLES_SUPPORTED and has_rulings(page) else []
+    # Tables without body rows stay in the page text
+    chunked = [(number, table, table_chunks(table, number, page_number)) for number, table in enumerate(found, start=1)]
+    chunked = [(number, table, chunks) for number, table, chunks in chunked if chunks]
+    if not chunked:
+        return [Document(page_content=page.get_text(), metadata=metadata)]
+
+    rects = [fitz.Rect(table.bbox) | fitz.Rect(table.header.bbox) for _, table, _ in chunked]
+    documents = [Document(page_content=_text_outside(page, rects), metadata=metadata)]
+    for table_number, _, chunks in chunked:
+        for text, rows in chunks:
+            documents.append(Document(page_content=text, metadata=dict(
+                metadata, content_type="table", table=table_number, table_rows=rows)))
+    return documents
+
+
+def extract_pages(file_path, start, stop, tables=False):
+    """Documents for pages [start, stop) of a PDF in page order, one per page plus any table chunks"""
+    with fitz.open(file_path) as doc:
+        return [document for page_number in range(start, min(stop, doc.page_count))
+                for document in extract_page(doc, file_path, page_number, tables)]
+
@@ -0,0 +1,188 @@
+"""Per-question retrieval planning: question type, retrieval depth and keyword probes.
+
+Everything here is a pure function of the question text and the document type, so a
+request's queries can be planned up front (plan_request_queries) and embedded and
+searched in one batch before any question is answered.
+"""
+
+# === Enhanced Question Classification ===
+def classify_question(question, document_type):
+    """Enhanced question classification with table detection"""
+    question_lower = question.lower()
+    
+    if document_type == "policy":
+        if any(word in question_lower for word in ['sub-limit', 'room rent', 'icu charges', 'plan a', 'plan b', 'table', 'charges per day']):
+            return "policy_table"
+        elif any(word in question_lower for word in ['is', 'does', 'can', 'will', 'are', 'has', 'covered']):
+            return "policy_yes_no"
+        elif any(word in question_lower for word in ['list', 'documents', 'what are', 'give me']):
+            return "policy_list"
+        elif any(word in question_lower for word in ['when', 'how long', 'period', 'time']):
+            return "policy_time"
+        else:
+            return "policy_general"
+    
+    elif document_type == "academic":
+        if any(word in question_lower for word in ['how does', 'explain', 'demonstrate', 'derive', 'why']):
+            return "academic_explanation"
+        elif any(word in question_lower for word in ['what is', 'define', 'who was', 'what are']):
+            return "academic_definition"
+        elif 'three laws' in question_lower or 'laws of motion' in question_lower:
+            return "academic_laws"
+        else:
+            return "academic_general"
+    
+    elif document_type == "legal":
+        if any(word in question_lower for word in ['article', 'which article', 'under which']):
+            return "legal_article"
+        elif any(word in question_lower for word in ['is', 'can', 'legal', 'allowed']):
+            return "legal_yes_no"
+        else:
+            return "legal_general"
+    
+    elif document_type in ["presentation", "spreadsheet", "image", "document"]:
+        if any(word in question_lower for word in ['what is', 'what are', 'list', 'show']):
+            return f"{document_type}_info"
+        elif any(word in question_lower for word in ['how', 'why', 'explain']):
+            return f"{document_type}_explanation"
+        else:
+            return f"{document_type}_general"
+    
+    else:
+        return "general_inquiry"
+
+
+# === Question Preprocessing ===
+def preprocess_question(question):
+    """Expand abbreviations and add context"""
+    expansions = {
+        "IVF": "In Vitro Fertilization (IVF)",
+        "OPD": "Outpatient Department (OPD)",
+        "ICU": "Intensive Care Unit (ICU)",
+        "Rs": "Rupees",
+        "C-section": "Caesarean section",
+        "AYUSH": "Ayurveda, Yoga, Unani, Siddha, and Homeopathy (AYUSH)",
+        "ECG": "Electrocardiogram (ECG)",
+        "IONM": "Intra Operative Neuro Monitoring (IONM)",
+        "PED": "Pre-Existing Disease (PED)",
+        "NCD": "No Claim Discount (NCD)",
+        "TPA": "Third Party Administrator (TPA)"
+    }
+    
+    processed_question = question
+    for abbr, full in expansions.items():
+        if abbr in processed_question and full not in processed_question:
+            processed_question = processed_question.replace(abbr, full)
+    
+    return processed_question
+
+
+# === Enhanced Retrieval Parameters ===
+def get_adaptive_retrieval_params(question_type, document_type):
+    """Get enhanced retrieval parameters with special handling for different file types - increased by 30%"""
+    
+    if document_type == "policy":
+        if question_type == "policy_table":
+            params = {"k": 26, "lambda_mult": 0.9}
+        elif question_type == "policy_list":
+            params = {"k": 24, "lambda_mult": 0.8}
+        elif question_type in ["policy_yes_no", "policy_time"]:
+            params = {"k": 20, "lambda_mult": 0.6}
+        else:
+            params = {"k": 21, "lambda_mult": 0.7}
+    
+    elif document_type == "academic":
+        if question_type == "academic_explanation":
+            params = {"k": 40, "lambda_mult": 0.8}
+        elif question_type == "academic_laws":
+            params = {"k": 33, "lambda_mult": 0.7}
+        elif question_type == "academic_definition":
+            params = {"k": 24, "lambda_mult": 0.6}
+        else:
+            params = {"k": 26, "lambda_mult": 0.7}
+    
+    elif document_type == "legal":
+        if question_type == "legal_article":
+            params = {"k": 24, "lambda_mult": 0.7}
+        else:
+            params = {"k": 20, "lambda_mult": 0.6}
+    
+    elif document_type in ["presentation", "spreadsheet"]:
+        params = {"k": 16, "lambda_mult": 0.8}
+    
+    elif document_type == "image":
+        params = {"k": 11, "lambda_mult": 0.9}
+    
+    elif document_type == "document":
+        params = {"k": 21, "lambda_mult": 0.7}
+    
+    else:
+        params = {"k": 20, "lambda_mult": 0.6}
+    
+    return params
+
+
+# === Retrieval Keywords ===
+def get_retrieval_keywords(question, question_type):
+    """Keyword probes that enhanced_hybrid_retrieval searches for alongside the question"""
+    keywords = []
+    question_lower = question.lower()
+    
+    # File-type specific keywords
+    if question_type.startswith("presentation"):
+        keywords.extend(['slide', 'presentation', 'title', 'bullet', 'overview'])
+    elif question_type.startswith("spreadsheet"):
+        keywords.extend(['table', 'data', 'column', 'row', 'chart', 'value'])
+    elif question_type.startswith("image"):
+        keywords.extend(['image', 'picture', 'visual', 'diagram', 'figure'])
+    elif question_type == "policy_table" or any(word in question_lower for word in ['sub-limit', 'room rent', 'icu charges', 'plan a']):
+        keywords.extend(['table of benefits', 'plan a', 'plan b', 'room charges', 'icu charges', 'per day per insured person', 'up to', '% of si'])
+    elif 'grace period' in question_lower:
+        keywords.extend(['grace period', 'premium payment', 'thirty days'])
+    elif 'waiting period' in question_lower:
+        keywords.extend(['waiting period', 'continuous coverage', 'months'])
+    elif 'three laws' in question_lower:
+        keywords.extend(['law i', 'law ii', 'law iii', 'first law', 'second law', 'third law', 'laws of motion'])
+    elif 'newton' in question_lower:
+        keywords.extend(['newton', 'principia', 'proposition', 'theorem'])
+    
+    # Use extracted keywords or fall back to question words
+    if not keywords:
+        keywords = [word for word in question.split() if len(word) > 3][:4]
+    
+    return keywords[:3]
+
+
+# === Batched Query Embedding ===
+class PrecomputedQueries:
+    """Query vectors and nearest neighbours computed in one batch for a whole request"""
+
+    def __init__(self, vectors, neighbors, top_scores=None):
+        self.vectors = vectors  # query -> embedding
+        self.neighbors = neighbors  # query -> (k searched, docs nearest first)
+        self.top_scores = top_scores or {}  # query -> cosine of the nearest chunk (inner-product indexes)
+
+    def vector(self, query):
+        return self.vectors.get(query)
+
+    def top_score(self, query):
+        return self.top_scores.get(query)
+
+    def similar(self, query, k):
+        searched_k, docs = self.neighbors.get(query, (0, None))
+        if docs is None or searched_k < k:
+            return None
+        return docs[:k]
+
+
+def plan_request_queries(questions, document_type):
+    """Collect every (query, k) that the request's hybrid retrieval will search for"""
+    query_ks = {}
+    for question in questions:
+        processed_q = preprocess_question(question)
+        question_type = classify_question(processed_q, document_type)
+        k = get_adaptive_retrieval_params(question_type, document_type)["k"]
+        query_ks[processed_q] = max(query_ks.get(processed_q, 0), k // 3)
+        for keyword in get_retrieval_keywords(processed_q, question_type):
+            query_ks[keyword] = max(query_ks.get(keyword, 0), k // 6)
+    return query_ks
@@ -0,0 +1,17 @@
+"""Local run of the API behind an ngrok tunnel.
+
+This is the main script rather than api_main_v2 because parse workers start from a
+forkserver (or spawn) and re-import the main script: it must not load torch or the
+embedding model at import time, so everything happens under the __main__ guard.
+"""
+
+if __name__ == "__main__":
+    import uvicorn
+    from pyngrok import ngrok
+
+    from api_main_v2 import app, logger
+
+    public_url = ngrok.connect("8000")
+    logger.info(f"🌍 Ngrok tunnel running at: {public_url}")
+
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,9 @@
+"""Offline unit tests: no server, embedding model, LLM key or network.
+
+Server logic under test lives in modules that api_main_v2 imports (faiss_store,
+key_scheduler, ...), so it can be imported here without loading torch or a model.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
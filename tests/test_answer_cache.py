@@ -0,0 +1,92 @@
+"""AnswerCache: keys, TTL, LRU bound, invalidation and semantic matching of rephrased questions"""
+import time
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+from answer_cache import AnswerCache, normalize_question  # noqa: E402
+
+CONFIG = {"prompt_version": "v1", "model": "m", "sampling": {"top_p": 0.9}}
+
+
+def make_cache(tmp_path, ttl_seconds=3600, max_entries=100, semantic_threshold=0.0):
+    return AnswerCache(str(tmp_path / "answers.sqlite3"), ttl_seconds, max_entries, semantic_threshold, CONFIG)
+
+
+def put(cache, question, answer, content_hash="doc", question_type="policy_time", vector=None):
+    key = cache.make_key(content_hash, question, question_type, "policy")
+    cache.put(key, content_hash, question, answer, "policy", vector, question_type)
+    return key
+
+
+def test_normalize_question():
+    assert normalize_question("  What is the   Grace Period?? ") == "what is the grace period"
+
+
+def test_key_covers_question_document_and_prompt_config(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.make_key("doc", "What is the grace period?", "policy_time", "policy")
+    assert key == cache.make_key("doc", "what is the grace period", "policy_time", "policy")
+    assert key != cache.make_key("other", "What is the grace period?", "policy_time", "policy")
+    assert key != cache.make_key("doc", "What is the grace period?", "policy_general", "policy")
+    other_model = AnswerCache(str(tmp_path / "other.sqlite3"), 3600, 100, 0.0, {**CONFIG, "model": "n"})
+    assert key != other_model.make_key("doc", "What is the grace period?", "policy_time", "policy")
+
+
+def test_get_put_and_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    key = put(cache, "What is the grace period?", "Thirty days.")
+    assert cache.get(key) == "Thirty days."
+    assert cache.get("missing") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache._conn.execute("UPDATE answers SET created_at = ?", (time.time() - 61,))
+    assert cache.get(key) is None
+
+
+def test_lru_bound_keeps_recent_hits(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    first = put(cache, "first", "1")
+    second = put(cache, "second", "2")
+    cache._conn.execute("UPDATE answers SET accessed_at = accessed_at - 10")
+    assert cache.get(first) == "1"  # recency is written back on the next put
+    put(cache, "third", "3")
+    assert cache.get(first) == "1"
+    assert cache.get(second) is None
+
+
+def test_invalidate_drops_one_documents_answers(tmp_path):
+    cache = make_cache(tmp_path)
+    stale = put(cache, "What is the grace period?", "Thirty days.", content_hash="doc")
+    kept = put(cache, "What is the grace period?", "Fifteen days.", content_hash="other")
+    assert cache.invalidate("doc") == 1
+    assert cache.get(stale) is None
+    assert cache.get(kept) == "Fifteen days."
+    cache.clear()
+    assert cache.get(kept) is None
+
+
+def test_semantic_match_within_document_and_question_type(tmp_path):
+    cache = make_cache(tmp_path, semantic_threshold=0.9)
+    vector = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+    put(cache, "What is the grace period?", "Thirty days.", vector=vector)
+
+    close = np.array([1.0, 0.1, 0.0, 0.0], dtype=np.float32)
+    far = np.array([0.0, 1.0, 0.0, 0.0], dtype=np.float32)
+    assert cache.find_similar("doc", "policy", "policy_time", close) == "Thirty days."
+    assert cache.find_similar("doc", "policy", "policy_time", far) is None
+    assert cache.find_similar("doc", "policy", "policy_list", close) is None
+    assert cache.find_similar("other", "policy", "policy_time", close) is None
+    assert cache.stats()["semantic"]["hits"] == 1
+
+    cache.invalidate("doc")
+    assert cache.find_similar("doc", "policy", "policy_time", close) is None
+
+
+def test_semantic_matching_is_off_at_zero_threshold(tmp_path):
+    cache = make_cache(tmp_path)
+    vector = np.array([1.0, 0.0], dtype=np.float32)
+    put(cache, "What is the grace period?", "Thirty days.", vector=vector)
+    assert cache.find_similar("doc", "policy", "policy_time", vector) is None
@@ -0,0 +1,64 @@
+"""Document URL normalization and HTTP validators that decide whether a cached entry is reused"""
+import pytest
+
+from document_urls import extract_http_validators, normalize_document_url, validators_match
+
+
+@pytest.mark.parametrize("first, second", [
+    # Azure SAS token refreshed
+    ("https://acct.blob.core.windows.net/docs/policy.pdf?sv=2023-01-03&st=2025-01-01&se=2025-01-02&sr=b&sp=r&sig=AAA",
+     "https://acct.blob.core.windows.net/docs/policy.pdf?sp=r&sv=2023-01-03&st=2025-02-01&se=2025-02-02&sr=b&sig=BBB"),
+    # S3 presigned URL re-issued
+    ("https://bucket.s3.amazonaws.com/a.pdf?X-Amz-Date=20250101T000000Z&X-Amz-Expires=600&X-Amz-Signature=aa",
+     "https://bucket.s3.amazonaws.com/a.pdf?X-Amz-Date=20250201T000000Z&X-Amz-Expires=900&X-Amz-Signature=bb"),
+    # CloudFront signed URL, plus case-only differences in scheme and host
+    ("HTTPS://CDN.example.com/a.pdf?Expires=1&Signature=x&Key-Pair-Id=k&v=2",
+     "https://cdn.example.com/a.pdf?v=2&Expires=2&Signature=y&Key-Pair-Id=k#page=3"),
+])
+def test_refreshed_signatures_share_one_alias(first, second):
+    assert normalize_document_url(first) == normalize_document_url(second)
+
+
+def test_unsigned_urls_keep_generic_parameters():
+    # Without a signature, 'policy', 'sp' and friends are part of what the URL names
+    first = "https://example.com/download?policy=health&sp=2"
+    second = "https://example.com/download?policy=motor&sp=2"
+    assert normalize_document_url(first) != normalize_document_url(second)
+    assert normalize_document_url(first) == "https://example.com/download?policy=health&sp=2"
+
+
+def test_signed_urls_keep_non_signing_parameters():
+    first = "https://acct.blob.core.windows.net/docs/a.pdf?version=1&sig=AAA&se=1"
+    second = "https://acct.blob.core.windows.net/docs/a.pdf?version=2&sig=AAA&se=1"
+    assert normalize_document_url(first) != normalize_document_url(second)
+    assert normalize_document_url(first) == "https://acct.blob.core.windows.net/docs/a.pdf?version=1"
+
+
+def test_extract_http_validators():
+    headers = {"ETag": '"abc"', "Last-Modified": "Tue, 01 Oct 2024 10:00:00 GMT", "Content-Length": "1024",
+               "Content-Type": "application/pdf"}
+    assert extract_http_validators(headers) == {
+        "etag": '"abc"', "last_modified": "Tue, 01 Oct 2024 10:00:00 GMT", "content_length": "1024"
+    }
+    assert extract_http_validators({}) == {"etag": None, "last_modified": None, "content_length": None}
+
+
+def test_etag_decides_when_both_sides_have_one():
+    stored = {"etag": '"v1"', "last_modified": "Mon", "content_length": "10"}
+    assert validators_match(stored, {"etag": '"v1"', "last_modified": "Tue", "content_length": "99"})
+    assert not validators_match(stored, {"etag": '"v2"', "last_modified": "Mon", "content_length": "10"})
+
+
+def test_last_modified_needs_the_same_size():
+    stored = {"etag": None, "last_modified": "Mon", "content_length": "10"}
+    assert validators_match(stored, {"etag": None, "last_modified": "Mon", "content_length": "10"})
+    assert not validators_match(stored, {"etag": None, "last_modified": "Mon", "content_length": "11"})
+    assert not validators_match(stored, {"etag": None, "last_modified": "Tue", "content_length": "10"})
+
+
+def test_weak_or_missing_validators_never_match():
+    # Size alone can't prove the document is unchanged
+    assert not validators_match({"content_length": "10"}, {"content_length": "10"})
+    assert not validators_match({"etag": '"v1"'}, {"last_modified": "Mon"})
+    assert not validators_match({}, {"etag": '"v1"'})
+    assert not validators_match(None, {"etag": '"v1"'})
@@ -0,0 +1,175 @@
+"""Cache entry layout in faiss_store: chunk store, re-ranked and tiered indexes, checkpoints, commits"""
+import os
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+import faiss_store  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+
+
+def unit_vectors(count, dimension=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def test_chunk_store_round_trip(tmp_path):
+    documents = [
+        Document(page_content="Grace period of thirty days", metadata={"page": 0, "source": "policy.pdf"}),
+        Document(page_content="Période d'attente — 36 mois", metadata={"page": 1, "source": "policy.pdf",
+                                                                          "content_type": "table", "table": 1}),
+        Document(page_content="", metadata={}),
+    ]
+    faiss_store.write_chunk_store(tmp_path, documents)
+    assert faiss_store.has_chunk_store(tmp_path)
+
+    store = faiss_store.ChunkStore(tmp_path)
+    assert len(store) == len(documents)
+    for position, document in enumerate(documents):
+        found = store.search(str(position))
+        assert found.page_content == document.page_content
+        assert found.metadata == document.metadata
+    assert store.search("3") == "ID 3 not found."
+    assert store.search("not-a-row") == "ID not-a-row not found."
+
+
+def test_row_ids():
+    ids = faiss_store.RowIds(3)
+    assert len(ids) == 3
+    assert list(ids) == [0, 1, 2]
+    assert ids[2] == "2"
+    assert dict(ids.items()) == {0: "0", 1: "1", 2: "2"}
+    with pytest.raises(KeyError):
+        ids[3]
+    with pytest.raises(KeyError):
+        ids[-1]
+
+
+def test_reranked_index_recall():
+    # PQ needs PQ_MIN_VECTORS to train; two sub-quantizers keep the training fast and the codes coarse
+    vectors = unit_vectors(faiss_store.PQ_MIN_VECTORS, dimension=16)
+    queries = unit_vectors(50, dimension=16, seed=1)
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, 10)
+
+    compressed, _ = faiss_store.build_index(vectors, faiss.METRIC_INNER_PRODUCT, "flat", "pq", pq_subquantizers=2)
+    assert compressed.sa_code_size() == 2
+    reranked = faiss_store.RerankedIndex(compressed, vectors, rerank_factor=8)
+    distances, labels = reranked.search(queries, 10)
+
+    recall = np.mean([len(set(row) & set(ref)) / 10 for row, ref in zip(labels, expected)])
+    assert recall >= 0.9
+    # Re-ranked scores are exact inner products, best first
+    assert np.allclose(distances[:, 0], np.einsum("ij,ij->i", vectors[labels[:, 0]], queries), atol=1e-5)
+    assert (np.diff(distances, axis=1) <= 1e-6).all()
+    assert np.array_equal(reranked.reconstruct_n(5, 3), vectors[5:8])
+
+
+def test_ingestion_checkpoint_resume(tmp_path):
+    directory = tmp_path / "entry.faiss.partial"
+    documents = [Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(6)]
+    digests = [faiss_store.chunk_digest(document) for document in documents]
+    vectors = unit_vectors(6, dimension=8)
+
+    checkpoint = faiss_store.IngestionCheckpoint(str(directory), every_batches=2)
+    assert checkpoint.load() == 0
+    checkpoint.add([0, 1], digests[0:2], vectors[0:2])
+    checkpoint.add([2, 3], digests[2:4], vectors[2:4])  # second batch writes a segment
+    checkpoint.add([4, 5], digests[4:6], vectors[4:6])  # pending when the attempt dies
+
+    resumed = faiss_store.IngestionCheckpoint(str(directory), every_batches=2)
+    assert resumed.load() == 4
+    for position in range(4):
+        assert np.array_equal(resumed.saved_vector(position, digests[position]), vectors[position])
+    assert resumed.saved_vector(4, digests[4]) is None
+    # A chunk that changed since the checkpoint is embedded again
+    changed = faiss_store.chunk_digest(Document(page_content="chunk 0, edited", metadata={"page": 0}))
+    assert resumed.saved_vector(0, changed) is None
+
+    resumed.add([0], [changed], vectors[5:6])
+    resumed.flush()
+    again = faiss_store.IngestionCheckpoint(str(directory), every_batches=2)
+    again.load()
+    assert np.array_equal(again.saved_vector(0, changed), vectors[5])
+
+    again.discard()
+    assert not directory.exists()
+
+
+def test_commit_directory(tmp_path):
+    directory = tmp_path / "entry.faiss"
+
+    def staged(content):
+        tmp_dir = tmp_path / f".building-{content}"
+        tmp_dir.mkdir()
+        (tmp_dir / "index.faiss").write_text(content)
+        return tmp_dir
+
+    faiss_store.commit_directory(str(staged("first")), str(directory))
+    assert (directory / "index.faiss").read_text() == "first"
+
+    faiss_store.commit_directory(str(staged("second")), str(directory))
+    assert (directory / "index.faiss").read_text() == "second"
+    # Neither the staging directory nor the retired entry is left behind
+    assert sorted(os.listdir(tmp_path)) == ["entry.faiss"]
+
+
+def test_sweep_staging_directories(tmp_path):
+    for name in [".building-abc-1", ".retired-2", ".building-abc-3", "entry.faiss", "entry.faiss.partial"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / ".building-abc-1" / "index.faiss").write_text("partial")
+    old = os.path.getmtime(tmp_path) - 7200
+    for name in [".building-abc-1", ".retired-2", "entry.faiss", "entry.faiss.partial"]:
+        os.utime(tmp_path / name, (old, old))
+
+    assert faiss_store.sweep_staging_directories(str(tmp_path), 3600) == 2
+    # Recent staging directories may belong to a save still running in another worker
+    assert sorted(os.listdir(tmp_path)) == [".building-abc-3", "entry.faiss", "entry.faiss.partial"]
+
+
+def test_sweep_ingestion_checkpoints(tmp_path):
+    for name in ["idle.faiss.partial", "ingesting.faiss.partial", "recent.faiss.partial", "entry.faiss"]:
+        (tmp_path / name).mkdir()
+    old = os.path.getmtime(tmp_path) - 8 * 24 * 3600
+    for name in ["idle.faiss.partial", "ingesting.faiss.partial", "entry.faiss"]:
+        os.utime(tmp_path / name, (old, old))
+
+    released = []
+
+    def try_lock(entry_path):
+        if entry_path.endswith("ingesting.faiss"):
+            return None  # another worker holds the entry's ingestion lock
+        return lambda: released.append(os.path.basename(entry_path))
+
+    assert faiss_store.sweep_ingestion_checkpoints(str(tmp_path), 7 * 24 * 3600, try_lock) == 1
+    assert sorted(os.listdir(tmp_path)) == ["entry.faiss", "ingesting.faiss.partial", "recent.faiss.partial"]
+    assert released == ["idle.faiss"]
+
+
+@pytest.mark.parametrize("quantization", faiss_store.QUANTIZATIONS)
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_vector_index_build_and_reload(tmp_path, index_type, quantization):
+    vectors = unit_vectors(faiss_store.PQ_MIN_VECTORS, dimension=16)
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+
+    manifest = faiss_store.write_vector_index(str(tmp_path), flat, index_type, quantization, rerank_factor=4,
+                                              pq_subquantizers=2, hnsw_m=16)
+    # HNSW over PQ codes is L2-only in faiss, so inner-product entries fall back to sq8
+    applied = "sq8" if (index_type, quantization) == ("hnsw", "pq") else quantization
+    assert (manifest["index_type"], manifest["quantization"]) == (index_type, applied)
+    assert manifest["ntotal"] == len(vectors) and manifest["metric"] == "ip"
+    if (index_type, quantization) != ("flat", "none"):
+        assert manifest["code_bytes_per_vector"] > 0
+
+    for mmap in (True, False):
+        index, _ = faiss_store.read_vector_index(str(tmp_path), mmap=mmap)
+        assert index.ntotal == len(vectors)
+        assert isinstance(index, faiss_store.RerankedIndex) == (quantization != "none")
+        assert faiss_store.resident_vector_bytes(index) > 0
+        _, labels = index.search(vectors[:20], 1)
+        assert np.mean(labels[:, 0] == np.arange(20)) >= 0.9
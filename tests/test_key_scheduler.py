@@ -0,0 +1,106 @@
+"""NvidiaKeyScheduler: least-loaded dispatch, token budgets, 429 cooldowns and the circuit breaker"""
+import asyncio
+import time
+
+import pytest
+
+from key_scheduler import NvidiaKeyScheduler, is_request_rejected
+
+KEYS = [("KEY_1", "a"), ("KEY_2", "b"), ("KEY_3", None)]
+
+
+def test_keys_without_value_are_skipped():
+    scheduler = NvidiaKeyScheduler(KEYS)
+    assert [key.label for key in scheduler.keys] == ["KEY_1", "KEY_2"]
+    assert scheduler.has_keys()
+    assert not NvidiaKeyScheduler([("KEY_1", None)]).has_keys()
+
+
+def test_acquire_spreads_calls_over_keys():
+    async def scenario():
+        scheduler = NvidiaKeyScheduler(KEYS)
+        async with scheduler.acquire() as first, scheduler.acquire() as second:
+            assert {first.label, second.label} == {"KEY_1", "KEY_2"}
+            assert first.in_flight == second.in_flight == 1
+        assert [key.in_flight for key in scheduler.keys] == [0, 0]
+    asyncio.run(scenario())
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def scenario():
+        scheduler = NvidiaKeyScheduler(KEYS[:1], max_concurrency=1)
+        order = []
+
+        async def call(name, hold):
+            async with scheduler.acquire():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(call("first", 0.05), call("second", 0))
+        return order
+    assert asyncio.run(scenario()) == ["first", "second"]
+
+
+def test_token_budget_prefers_the_key_with_headroom():
+    scheduler = NvidiaKeyScheduler(KEYS, tokens_per_minute=1000)
+    first, second = scheduler.keys
+    now = time.monotonic()
+    first.token_log.append((now, 900))
+    assert scheduler._pick(now, 200) is second
+    second.token_log.append((now, 900))
+    assert scheduler._pick(now, 200) is None
+    # A key with nothing spent lets even an oversized prompt through, so it can't starve forever
+    first.token_log.clear()
+    assert scheduler._pick(now, 5000) is first
+
+
+def test_throttled_key_cools_down_for_retry_after():
+    scheduler = NvidiaKeyScheduler(KEYS, cooldown_seconds=30)
+    first, second = scheduler.keys
+    scheduler.record_error_status(first, 429, "12")
+    now = time.monotonic()
+    assert 11 < first.blocked_until - now <= 12
+    assert first.throttled == 1 and first.failures == 0
+    assert scheduler._pick(now, 0) is second
+
+    scheduler.record_throttled(second, "soon")  # unparseable Retry-After: a third of the cooldown
+    assert 9 < second.blocked_until - time.monotonic() <= 10
+
+
+def test_circuit_opens_after_repeated_server_errors():
+    scheduler = NvidiaKeyScheduler(KEYS, failure_threshold=3, cooldown_seconds=30)
+    key = scheduler.keys[0]
+    for _ in range(2):
+        scheduler.record_error_status(key, 503)
+    assert key.blocked_until == 0.0
+    scheduler.record_error_status(key, 500)
+    assert key.blocked_until > time.monotonic() + 29
+    # Half-open: one more failure after the cooldown opens it again straight away
+    assert key.consecutive_failures == 2
+    key.blocked_until = 0.0
+    scheduler.record_success(key)
+    assert key.consecutive_failures == 0
+
+
+@pytest.mark.parametrize("status_code", [400, 404, 413, 422])
+def test_rejected_requests_do_not_penalize_the_key(status_code):
+    scheduler = NvidiaKeyScheduler(KEYS, failure_threshold=1)
+    key = scheduler.keys[0]
+    scheduler.record_error_status(key, status_code)
+    assert key.failures == 0 and key.blocked_until == 0.0
+    assert is_request_rejected(status_code)
+
+
+@pytest.mark.parametrize("status_code", [200, 429, 500, 502])
+def test_retryable_statuses_are_not_rejections(status_code):
+    assert not is_request_rejected(status_code)
+
+
+def test_record_success_corrects_the_token_reservation():
+    scheduler = NvidiaKeyScheduler(KEYS)
+    key = scheduler.keys[0]
+    now = time.monotonic()
+    key.token_log.append((now, 1000))
+    scheduler.record_success(key, estimated_tokens=1000, actual_tokens=400)
+    assert key.tokens_last_minute(time.monotonic()) == 400
+    assert scheduler.stats()["KEY_1"]["tokens_last_minute"] == 400
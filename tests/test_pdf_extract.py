@@ -0,0 +1,46 @@
+"""has_rulings: the gate that keeps find_tables off pages without a ruled grid"""
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import pdf_extract  # noqa: E402
+
+
+def drawn_page(*shapes):
+    doc = fitz.open()
+    page = doc.new_page()
+    shape = page.new_shape()
+    for kind, *args in shapes:
+        getattr(shape, f"draw_{kind}")(*args)
+    shape.finish(color=(0, 0, 0))
+    shape.commit()
+    return doc, page
+
+
+def test_plain_page_has_no_rulings():
+    _, page = drawn_page()
+    assert not pdf_extract.has_rulings(page)
+
+
+def test_page_border_and_a_rule_are_not_a_table():
+    _, page = drawn_page(("rect", fitz.Rect(10, 10, 602, 782)), ("line", (72, 100), (500, 100)))
+    assert not pdf_extract.has_rulings(page)
+
+
+def test_horizontal_rules_alone_are_not_a_grid():
+    _, page = drawn_page(("line", (72, 100), (500, 100)), ("line", (72, 300), (500, 300)))
+    assert not pdf_extract.has_rulings(page)
+
+
+def test_cell_rectangles_form_a_grid():
+    cells = [("rect", fitz.Rect(72 + column * 100, 200 + row * 20, 172 + column * 100, 220 + row * 20))
+             for column in range(2) for row in range(3)]
+    _, page = drawn_page(*cells)
+    assert pdf_extract.has_rulings(page)
+
+
+def test_ruled_lines_form_a_grid():
+    rows = [("line", (72, y), (372, y)) for y in (200, 220, 240)]
+    columns = [("line", (x, 200), (x, 240)) for x in (72, 222, 372)]
+    _, page = drawn_page(*rows, *columns)
+    assert pdf_extract.has_rulings(page)
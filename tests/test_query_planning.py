@@ -0,0 +1,55 @@
+"""Query planning: question types, retrieval depth and the batched (query, k) plan of a request"""
+from query_planning import (PrecomputedQueries, classify_question, get_adaptive_retrieval_params,
+                            get_retrieval_keywords, plan_request_queries, preprocess_question)
+
+
+def test_preprocess_expands_abbreviations_once():
+    assert preprocess_question("Is ICU covered?") == "Is Intensive Care Unit (ICU) covered?"
+    expanded = "Is Intensive Care Unit (ICU) covered?"
+    assert preprocess_question(expanded) == expanded
+
+
+def test_classify_question_by_document_type():
+    assert classify_question("What are the room rent sub-limits for Plan A?", "policy") == "policy_table"
+    assert classify_question("What period applies to maternity?", "policy") == "policy_time"
+    assert classify_question("Explain the derivation", "academic") == "academic_explanation"
+    assert classify_question("Under which article is this?", "legal") == "legal_article"
+    assert classify_question("Show the totals", "spreadsheet") == "spreadsheet_info"
+    assert classify_question("Anything", "unknown") == "general_inquiry"
+
+
+def test_plan_collects_questions_and_keyword_probes():
+    document_type = "policy"
+    question = "What is the grace period for premium payment?"
+    plan = plan_request_queries([question], document_type)
+
+    question_type = classify_question(question, document_type)
+    k = get_adaptive_retrieval_params(question_type, document_type)["k"]
+    keywords = get_retrieval_keywords(question, question_type)
+    assert keywords == ['grace period', 'premium payment', 'thirty days']
+    assert plan == {question: k // 3, **{keyword: k // 6 for keyword in keywords}}
+
+
+def test_plan_keeps_the_deepest_k_for_shared_queries():
+    # A keyword probe that is also asked as a question is searched once, at the larger k
+    plan = plan_request_queries(["grace period", "What is the grace period?"], "policy")
+    assert plan["grace period"] == max(
+        get_adaptive_retrieval_params(classify_question("grace period", "policy"), "policy")["k"] // 3,
+        get_adaptive_retrieval_params(classify_question("What is the grace period?", "policy"), "policy")["k"] // 6,
+    )
+    assert plan_request_queries([], "policy") == {}
+
+
+def test_plan_uses_preprocessed_questions():
+    plan = plan_request_queries(["Is OPD covered?"], "policy")
+    assert "Is Outpatient Department (OPD) covered?" in plan
+    assert "Is OPD covered?" not in plan
+
+
+def test_precomputed_queries_only_serve_deep_enough_searches():
+    precomputed = PrecomputedQueries({"q": [0.1]}, {"q": (6, ["a", "b", "c", "d", "e", "f"])}, {"q": 0.8})
+    assert precomputed.similar("q", 4) == ["a", "b", "c", "d"]
+    assert precomputed.similar("q", 7) is None
+    assert precomputed.similar("missing", 1) is None
+    assert precomputed.vector("q") == [0.1] and precomputed.top_score("q") == 0.8
+    assert precomputed.top_score("missing") is None
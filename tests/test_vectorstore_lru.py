@@ -0,0 +1,68 @@
+"""VectorstoreLRU: byte and entry bounds, recency order and hit/miss accounting"""
+from types import SimpleNamespace
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+import faiss_store  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+from vectorstore_lru import VectorstoreLRU, estimate_vectorstore_bytes  # noqa: E402
+
+
+def sized_lru(max_bytes, max_entries=0):
+    # Stand-in vectorstores are plain ints holding their own size
+    return VectorstoreLRU(max_bytes, max_entries, size_of=lambda size: size)
+
+
+def test_get_tracks_hits_and_misses():
+    lru = sized_lru(100)
+    lru.put("a", 10)
+    assert lru.get("a") == 10
+    assert lru.get("b") is None
+    assert "a" in lru and "b" not in lru
+    stats = lru.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_evicts_least_recently_used_over_byte_budget():
+    lru = sized_lru(100)
+    lru.put("a", 40)
+    lru.put("b", 40)
+    lru.get("a")  # b is now the least recently used
+    lru.put("c", 40)
+    assert "b" not in lru and "a" in lru and "c" in lru
+    assert lru.total_bytes == 80 and lru.evictions == 1
+
+
+def test_entry_cap_bounds_zero_byte_entries():
+    # Memory-mapped stores are charged nothing, so only the entry count limits them
+    lru = sized_lru(100, max_entries=2)
+    for name in "abc":
+        lru.put(name, 0)
+    assert "a" not in lru and lru.stats()["entries"] == 2
+
+
+def test_oversized_store_is_not_cached_and_replacing_recharges():
+    lru = sized_lru(100)
+    lru.put("huge", 101)
+    assert "huge" not in lru and lru.total_bytes == 0
+    lru.put("a", 30)
+    lru.put("a", 50)
+    assert lru.total_bytes == 50 and lru.stats()["entries"] == 1
+    lru.clear()
+    assert lru.total_bytes == 0 and "a" not in lru
+
+
+def test_estimate_counts_unmapped_vectors_and_chunk_data(tmp_path):
+    index = faiss.IndexFlatIP(8)
+    index.add(np.ones((4, 8), dtype=np.float32))
+    documents = [Document(page_content="x" * 10, metadata={"page": 0})]
+    faiss_store.write_chunk_store(tmp_path, documents)
+    chunk_store = faiss_store.ChunkStore(tmp_path)
+
+    resident = SimpleNamespace(index=index, docstore=chunk_store, index_mapped=False)
+    mapped = SimpleNamespace(index=index, docstore=chunk_store, index_mapped=True)
+    assert estimate_vectorstore_bytes(resident) == 4 * 8 * 4 + chunk_store.resident_bytes
+    assert estimate_vectorstore_bytes(mapped) < estimate_vectorstore_bytes(resident)
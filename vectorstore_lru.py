@@ -0,0 +1,86 @@
+"""Process-level LRU of loaded vectorstores.
+
+Loading an entry from disk costs an index read and chunk store open, so recently used
+vectorstores stay in memory. The bound is on private bytes (vectors that are not
+memory-mapped, plus chunk data) and, because mapped entries are charged almost nothing,
+on the entry count as well.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import faiss_store
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_vectorstore_bytes(vectorstore):
+    """Approximate private memory of a loaded vectorstore: its vectors unless memory-mapped, plus chunk data"""
+    vector_bytes = faiss_store.resident_vector_bytes(vectorstore.index, getattr(vectorstore, "index_mapped", False))
+    if isinstance(vectorstore.docstore, faiss_store.ChunkStore):
+        return vector_bytes + vectorstore.docstore.resident_bytes
+    documents = getattr(vectorstore.docstore, "_dict", {}).values()
+    return vector_bytes + sum(len(doc.page_content) for doc in documents)
+
+
+class VectorstoreLRU:
+    """Process-level LRU of loaded vectorstores, bounded by total vector bytes and entry count"""
+
+    def __init__(self, max_bytes, max_entries=0, size_of=estimate_vectorstore_bytes):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries  # 0 = no entry limit
+        self.size_of = size_of
+        self._entries = OrderedDict()  # file_hash -> (vectorstore, size_bytes)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_hash):
+        with self._lock:
+            entry = self._entries.get(file_hash)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(file_hash)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, file_hash):
+        with self._lock:
+            return file_hash in self._entries
+
+    def put(self, file_hash, vectorstore):
+        size = self.size_of(vectorstore)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if file_hash in self._entries:
+                self.total_bytes -= self._entries.pop(file_hash)[1]
+            self._entries[file_hash] = (vectorstore, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes or (self.max_entries and len(self._entries) > self.max_entries):
+                evicted_hash, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+                logger.info(f"♻️ Evicted vectorstore from memory: {evicted_hash}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "resident_mb": round(self.total_bytes / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }